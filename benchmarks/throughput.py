@@ -0,0 +1,289 @@
+"""
+合成スクリーンショットによる処理速度ベンチマーク
+
+「選択肢/icon」のアイコンと「判定画像」の参照画像 (足りない分は生成した画像) を
+src/positions.py の座標に貼り付けたスクリーンショットを一時フォルダに作成し、
+GUIなしで分類処理を実行して 画像/秒・マッチング/秒・最大メモリ使用量 を計測します。
+結果は JSON で保存されるため、コミット間で比較できます。
+
+使い方:
+    python benchmarks/throughput.py
+    python benchmarks/throughput.py --resolutions 1920x1080 --bank-sizes 100 400 --images 50
+    python benchmarks/throughput.py --compare benchmarks/results/<前回の結果>.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import datetime
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+from PIL import Image
+
+# --- グローバル定義 ---
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # アプリケーションのルート
+sys.path.insert(0, BASE_DIR)
+
+from src.positions import positions
+from src.template_bank import TemplateBank
+from src.classifier import iter_classified
+
+# --- 設定 ---
+DEFAULT_RESOLUTIONS = ["1280x720", "1920x1080", "2560x1440"]
+DEFAULT_BANK_SIZES = [50, 200, 800] # 「キャラクター」の参照画像数 (対戦相手はその1/4)
+DEFAULT_IMAGES = 20 # 1条件あたりのスクリーンショット枚数
+NOISE_SIGMA = 2.0 # スクリーンショットごとに加えるノイズ (同一画像による判定結果キャッシュのヒットを防ぐ)
+RESULTS_DIR = os.path.join(BASE_DIR, "benchmarks", "results")
+
+
+# --- 素材の準備 ---
+
+def load_sources():
+    """
+    アイコンと参照画像を {ラベル: PIL画像} として読み込みます。
+
+    Returns:
+        dict[str, PIL.Image.Image]: 実在する画像素材。
+    """
+    sources = {}
+    icon_dir = os.path.join(BASE_DIR, "選択肢", "icon")
+    match_dir = os.path.join(BASE_DIR, "判定画像", "キャラクター")
+    for folder in (icon_dir, match_dir):
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if not name.lower().endswith('.png'):
+                continue
+            label = os.path.splitext(name)[0].rsplit('_', 1)[0] if folder == match_dir else os.path.splitext(name)[0]
+            if label in sources:
+                continue
+            try:
+                with Image.open(os.path.join(folder, name)) as img:
+                    sources[label] = img.convert("RGB")
+            except Exception as e:
+                print(f"素材 {name} の読み込みエラー: {e}")
+    return sources
+
+
+def generate_source(rng):
+    """実物の素材が足りない場合に使用する、なめらかな模様の画像を生成します。"""
+    coarse = rng.integers(0, 256, (6, 6, 3), dtype=numpy.uint8)
+    return Image.fromarray(coarse).resize((96, 96), Image.BICUBIC)
+
+
+def read_choices(name):
+    """「選択肢」フォルダのテキストファイルから選択肢を読み込みます。"""
+    path = os.path.join(BASE_DIR, "選択肢", name)
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def category_labels(category, bank_size):
+    """カテゴリごとの参照画像のラベル一覧を作成します。"""
+    if category == "キャラクター":
+        names = list(dict.fromkeys(read_choices("ST.txt") + read_choices("SP.txt"))) or ["生徒"]
+        # 選択肢より多い場合は番号付きの別名で補う
+        return [names[i % len(names)] + (f"#{i // len(names)}" if i >= len(names) else "")
+                for i in range(bank_size)]
+    if category == "対戦相手":
+        return [f"player{i:04d}" for i in range(max(4, bank_size // 4))]
+    defaults = {"攻守": ["攻撃", "防衛"], "勝敗": ["TRUE", "FALSE"]}
+    return read_choices(f"{category}.txt") or defaults.get(category, [category])
+
+
+def crop_box(position_info, width, height):
+    """相対座標から絶対ピクセル座標を計算します (classify_screenshot と同じ丸め方)。"""
+    l_rel, t_rel, r_rel, b_rel = position_info[:4]
+    return int(width * l_rel), int(height * t_rel), int(width * r_rel), int(height * b_rel)
+
+
+def build_workspace(workspace, width, height, bank_size, n_images, sources, seed=0):
+    """
+    一時フォルダに「判定画像」と合成スクリーンショットを作成します。
+
+    Returns:
+        list[str]: 合成スクリーンショットのパス。
+    """
+    rng = numpy.random.default_rng(seed)
+    art = {} # {ラベル: 素材画像}
+
+    def source_for(label):
+        if label not in art:
+            # 番号付きの別名・対戦相手などの素材がないラベルは生成した画像を使用
+            art[label] = sources.get(label) or generate_source(rng)
+        return art[label]
+
+    # --- 参照画像: 各ラベルをカテゴリ内のいずれかのポジションのサイズで保存 ---
+    labels = {}
+    for category in dict.fromkeys(p[5] for p in positions):
+        labels[category] = category_labels(category, bank_size)
+        boxes = [crop_box(p, width, height) for p in positions if p[5] == category]
+        folder = os.path.join(workspace, "判定画像", category)
+        os.makedirs(folder, exist_ok=True)
+        for label in labels[category]:
+            l, t, r, b = boxes[rng.integers(len(boxes))]
+            source_for(label).resize((r - l, b - t), Image.BILINEAR).save(
+                os.path.join(folder, f"{label}.png"), "PNG")
+
+    # --- スクリーンショット ---
+    screenshot_dir = os.path.join(workspace, "Screenshots")
+    os.makedirs(screenshot_dir, exist_ok=True)
+    gradient = numpy.linspace(20, 80, width, dtype=numpy.float32)[None, :, None]
+    paths = []
+    for k in range(n_images):
+        canvas = numpy.broadcast_to(gradient, (height, width, 3)).copy()
+        for position_info in positions:
+            l, t, r, b = crop_box(position_info, width, height)
+            label = labels[position_info[5]][rng.integers(len(labels[position_info[5]]))]
+            patch = source_for(label).resize((r - l, b - t), Image.BILINEAR)
+            canvas[t:b, l:r] = numpy.asarray(patch, dtype=numpy.float32)
+        canvas += rng.normal(0, NOISE_SIGMA, canvas.shape).astype(numpy.float32)
+        path = os.path.join(screenshot_dir, f"bench{k:04d}.png")
+        Image.fromarray(numpy.clip(canvas, 0, 255).astype(numpy.uint8)).save(path, "PNG")
+        paths.append(path)
+    return paths
+
+
+# --- 計測 ---
+
+def peak_rss_mb():
+    """このプロセスの最大メモリ使用量 (MB) を返します。取得できない場合は None。"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux は KB 単位、macOS はバイト単位
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except ImportError:
+        pass
+    try:
+        import psutil # Windows ではオプションの psutil を使用
+        return round(psutil.Process().memory_info().peak_wset / (1024 * 1024), 1)
+    except (ImportError, AttributeError):
+        return None
+
+
+def run_case(resolution, bank_size, n_images, workers, seed):
+    """
+    1条件分のベンチマークを実行します (最大メモリ使用量を条件ごとに測るため、新しいプロセスで実行)。
+
+    Returns:
+        dict: 計測結果。
+    """
+    width, height = map(int, resolution.lower().split('x'))
+    workspace = tempfile.mkdtemp(prefix="bench_")
+    try:
+        input_paths = build_workspace(workspace, width, height, bank_size, n_images, load_sources(), seed)
+
+        start = time.perf_counter()
+        bank = TemplateBank(workspace)
+        bank.preload(p[5] for p in positions)
+        load_sec = time.perf_counter() - start
+
+        matched = resolved = 0
+        start = time.perf_counter()
+        for input_path, results in iter_classified(input_paths, positions, bank, workers):
+            for result in results or []:
+                matched += 1
+                resolved += result["label"] is not None
+        classify_sec = time.perf_counter() - start
+
+        return {
+            "resolution": resolution,
+            "bank_size": bank_size,
+            "images": n_images,
+            "workers": workers or 1,
+            "load_sec": round(load_sec, 4),
+            "classify_sec": round(classify_sec, 4),
+            "images_per_sec": round(n_images / classify_sec, 2),
+            "matches_per_sec": round(matched / classify_sec, 1),
+            "auto_resolved": round(resolved / matched, 4) if matched else 0.0,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+
+def git_commit():
+    """現在のコミットのハッシュを返します (git が使えない場合は None)。"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def print_table(results, baseline=None):
+    """結果を表形式で表示します (baseline があれば画像/秒の比率も表示)。"""
+    previous = {(r["resolution"], r["bank_size"]): r for r in (baseline or {}).get("results", [])}
+    print(f"\n{'解像度':>10} {'参照数':>6} {'読込(s)':>8} {'画像/秒':>8} {'照合/秒':>9} {'自動判定':>8} {'RSS(MB)':>8}"
+          + ("  前回比" if baseline else ""))
+    for r in results:
+        line = (f"{r['resolution']:>10} {r['bank_size']:>6} {r['load_sec']:>8.3f} {r['images_per_sec']:>8.2f} "
+                f"{r['matches_per_sec']:>9.1f} {r['auto_resolved']:>8.1%} {str(r['peak_rss_mb']):>8}")
+        old = previous.get((r["resolution"], r["bank_size"]))
+        if old and old["images_per_sec"]:
+            line += f"  x{r['images_per_sec'] / old['images_per_sec']:.2f}"
+        print(line)
+
+
+def main():
+    """
+    メイン処理。
+    解像度と参照画像数の組み合わせごとにベンチマークを実行し、結果を JSON で保存する
+    """
+    parser = argparse.ArgumentParser(description="合成スクリーンショットによる分類処理のベンチマーク")
+    parser.add_argument("--resolutions", nargs="+", default=DEFAULT_RESOLUTIONS,
+                        help=f"スクリーンショットの解像度 (既定: {' '.join(DEFAULT_RESOLUTIONS)})")
+    parser.add_argument("--bank-sizes", nargs="+", type=int, default=DEFAULT_BANK_SIZES,
+                        help=f"キャラクターの参照画像数 (既定: {' '.join(map(str, DEFAULT_BANK_SIZES))})")
+    parser.add_argument("--images", type=int, default=DEFAULT_IMAGES,
+                        help=f"1条件あたりのスクリーンショット枚数 (既定: {DEFAULT_IMAGES})")
+    parser.add_argument("--parallel", type=int, default=None, metavar="N",
+                        help="Nプロセスで並列に分類する (RSS は親プロセスのみ)")
+    parser.add_argument("--seed", type=int, default=0, help="乱数シード")
+    parser.add_argument("--output", help="結果の保存先 (既定: benchmarks/results/<日時>_<コミット>.json)")
+    parser.add_argument("--compare", help="比較する過去の結果 JSON")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = []
+    for resolution in args.resolutions:
+        for bank_size in args.bank_sizes:
+            print(f"計測中: {resolution} / 参照画像 {bank_size} 枚 / {args.images} 枚...")
+            # 条件ごとに新しいプロセスで実行し、最大メモリ使用量が前の条件の影響を受けないようにする
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                results.append(executor.submit(run_case, resolution, bank_size, args.images,
+                                               args.parallel, args.seed).result())
+
+    report = {
+        "commit": commit,
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.datetime.now():%Y%m%d-%H%M%S}_{commit or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n結果を保存しました: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,13 @@ import tkinter as tk
 import os
 import threading
 import sys
+import argparse
 
 from src.updatalist import updata_list
 from src.gui import ImageClassifierGUI
 from src.processing import main_processing
 from src import select_preset
+from src import instrument
 from src.transcription import main as transcription_main
 
 # --- ディレクトリ設定 ---
@@ -15,17 +17,25 @@ try:
 except NameError:
     script_dir = os.getcwd()
 
-# --- 設定 ---
-updata_list(script_dir) # 生徒リストの更新
-
-try:
-    positions = select_preset.run() # 使用するプリセットの座標取得
-except:
-    print("\nエラー: プリセットが存在しません。処理を終了します。")
-    sys.exit(1)
-
 input_imgs_dir = os.path.join(script_dir, "Screenshots") # 入力画像ディレクトリを定義
 
+def parse_args():
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description="対抗戦のリザルト画像を文字起こしします。")
+    parser.add_argument(
+        "--parallel", nargs="?", type=int, const=os.cpu_count() or 1, default=None, metavar="N",
+        help="画像の分類をNプロセスで並列に行う (N省略時はCPUコア数)"
+    )
+    parser.add_argument(
+        "--review-later", action="store_true",
+        help="すべての画像を先に自動分類し、要入力の画像は最後にまとめて入力する"
+    )
+    parser.add_argument(
+        "--profile", nargs="?", const=os.path.join(script_dir, "trace.json"), default=None, metavar="TRACE",
+        help="処理段階ごとの時間を計測し、集計表と Chrome trace 形式の JSON (既定: trace.json) を出力する"
+    )
+    return parser.parse_args()
+
 def cleanup_and_transcribe():
     """GUIを完全に閉じてから転記処理を実行"""
     # GUIが完全に破棄されるまで少し待機
@@ -42,13 +52,29 @@ def cleanup_and_transcribe():
     print("プログラムを終了します")
 
 if __name__ == "__main__":
+    # 並列処理のワーカープロセス (spawn) で再実行されないよう、設定処理はここで行う
+    args = parse_args()
+
+    if args.profile:
+        instrument.enable() # 処理段階ごとの時間計測
+
+    # --- 設定 ---
+    updata_list(script_dir) # 生徒リストの更新
+
+    try:
+        positions = select_preset.run() # 使用するプリセットの座標取得
+    except:
+        print("\nエラー: プリセットが存在しません。処理を終了します。")
+        sys.exit(1)
+
     root = tk.Tk()
     gui = ImageClassifierGUI(root, script_dir)
 
     # メイン処理開始
     processing_thread = threading.Thread(
         target=main_processing,
-        args=(gui, script_dir, positions, input_imgs_dir),
+        args=(gui, script_dir, positions, input_imgs_dir, args.parallel,
+              "batch" if args.review_later else "immediate"),
         daemon=True #true -> 処理終了時にスレッドも終了
     )
     processing_thread.start()
@@ -57,6 +83,11 @@ if __name__ == "__main__":
         root.mainloop()
     except KeyboardInterrupt:
         print("\n処理が中断されました")
+
+    # 処理スレッドに終了を通知し、記録中の結果を書き終えるまで待機
+    # (転記処理が結果ファイルを読み込んで削除した後に、結果行が書き込まれないように)
+    gui.on_close()
+    processing_thread.join()
     
     # GUIウィンドウを完全に破棄
     try:
@@ -65,5 +96,8 @@ if __name__ == "__main__":
     except:
         pass
     
+    # 計測結果の出力 (--profile 指定時のみ)
+    instrument.report(args.profile)
+
     # GUIが完全に閉じられた後に転記処理を実行
     cleanup_and_transcribe()
\ No newline at end of file
@@ -0,0 +1,190 @@
+import os
+import time
+import shutil
+import numpy
+from PIL import Image
+
+from .image_utils import fx_templatematch_gray, fx_resize_image
+from .template_bank import TemplateBank
+
+# --- 設定 ---
+DEDUP_THRESHOLD = 0.98 # 同じラベル内でこのスコア以上の参照画像は冗長とみなす
+TIMING_SAMPLES = 50 # マッチング時間の計測に使用するクエリ画像の最大数
+
+
+def list_categories(script_dir):
+    """「判定画像」内のカテゴリ (サブフォルダ) 名の一覧を返します。"""
+    base_dir = os.path.join(script_dir, "判定画像")
+    if not os.path.isdir(base_dir):
+        return []
+    return sorted(
+        d for d in os.listdir(base_dir)
+        if not d.startswith('.') and os.path.isdir(os.path.join(base_dir, d))
+    )
+
+
+def find_redundant(bank, category, threshold=DEDUP_THRESHOLD):
+    """
+    ラベルごとに参照画像をまとめ、互いに似ている画像を冗長として選び出します。
+
+    ヒット回数の多い順 (同数ならファイル名順) に見ていき、既に残すと決めた画像の
+    いずれかと threshold 以上のスコアになる画像を冗長とします (貪欲法による被覆)。
+
+    Args:
+        bank (TemplateBank): 参照画像バンク。
+        category (str): カテゴリ名。
+        threshold (float): 冗長とみなすスコア。
+
+    Returns:
+        tuple[list[int], list[int]]: (残すエントリのインデックス, 冗長なエントリのインデックス)。
+    """
+    entries = bank.load(category)
+    hits = bank.hits.get(category, {})
+
+    by_label = {}
+    for i, (filename, label, gray) in enumerate(entries):
+        by_label.setdefault(label, []).append(i)
+
+    keep, redundant = [], []
+    for label, indices in by_label.items():
+        indices.sort(key=lambda i: (-hits.get(entries[i][0], 0), entries[i][0]))
+        kept_for_label = []
+        for i in indices:
+            gray = entries[i][2]
+            if any(fx_templatematch_gray(gray, entries[k][2]) >= threshold for k in kept_for_label):
+                redundant.append(i)
+            else:
+                kept_for_label.append(i)
+        keep.extend(kept_for_label)
+
+    return sorted(keep), sorted(redundant)
+
+
+def measure_match_time(bank, category, indices, queries):
+    """
+    指定したエントリのみを参照画像とした場合の、1回あたりのマッチング時間を計測します。
+
+    Args:
+        bank (TemplateBank): 参照画像バンク。
+        category (str): カテゴリ名。
+        indices (list[int]): 参照画像として使用するエントリのインデックス。
+        queries (list[numpy.ndarray]): クエリとして使用するグレースケール画像。
+
+    Returns:
+        float: 1回あたりの平均時間 (秒)。
+    """
+    if not queries or not indices:
+        return 0.0
+    indices = numpy.array(indices, dtype=numpy.int64)
+    start = time.perf_counter()
+    for query in queries:
+        bank.scores_for(category, query, indices)
+    return (time.perf_counter() - start) / len(queries)
+
+
+def _archive_path(archive_dir, filename):
+    """アーカイブ先のパスを返します (以前のアーカイブと名前が重複する場合は番号を付ける)。"""
+    archive_path = os.path.join(archive_dir, filename)
+    base_name, ext = os.path.splitext(filename)
+    num = 0
+    while os.path.exists(archive_path):
+        num += 1
+        archive_path = os.path.join(archive_dir, f"{base_name}~{num}{ext}")
+    return archive_path
+
+
+def prune_category(script_dir, category, threshold=DEDUP_THRESHOLD, dry_run=False):
+    """
+    カテゴリ内の冗長な参照画像を「判定画像/.archive/<カテゴリ名>」に移動します。
+
+    Args:
+        script_dir (str): アプリケーションのルートディレクトリ。
+        category (str): カテゴリ名。
+        threshold (float): 冗長とみなすスコア。
+        dry_run (bool): True の場合は移動せずに結果のみを報告します。
+
+    Returns:
+        dict: 枚数・ファイルサイズ・1回あたりのマッチング時間の前後比較。
+    """
+    bank = TemplateBank(script_dir)
+    entries = bank.load(category)
+    match_img_dir = bank.category_dir(category)
+    keep, redundant = find_redundant(bank, category, threshold)
+
+    # 冗長な画像も含めた参照画像からクエリを抽出して、削減前後のマッチング時間を比較
+    step = max(1, len(entries) // TIMING_SAMPLES)
+    queries = [entries[i][2] for i in range(0, len(entries), step)][:TIMING_SAMPLES]
+    time_before = measure_match_time(bank, category, list(range(len(entries))), queries)
+    time_after = measure_match_time(bank, category, keep, queries)
+
+    def total_size(indices):
+        return sum(os.path.getsize(os.path.join(match_img_dir, entries[i][0])) for i in indices)
+    size_before = total_size(range(len(entries)))
+    size_after = total_size(keep)
+
+    if not dry_run and redundant:
+        archive_dir = os.path.join(bank.base_dir, ".archive", category)
+        os.makedirs(archive_dir, exist_ok=True)
+        for i in redundant:
+            filename = entries[i][0]
+            try:
+                shutil.move(os.path.join(match_img_dir, filename), _archive_path(archive_dir, filename))
+            except Exception as e:
+                print(f"{filename} のアーカイブ中にエラー: {e}")
+        # キャッシュを更新 (移動した画像をマニフェストから除外)
+        TemplateBank(script_dir).load(category)
+
+    return {
+        "category": category,
+        "count_before": len(entries),
+        "count_after": len(keep),
+        "size_before": size_before,
+        "size_after": size_after,
+        "time_before": time_before,
+        "time_after": time_after,
+    }
+
+
+def normalize_category(script_dir, category, dry_run=False):
+    """
+    カテゴリ内の参照画像を基準サイズ (最も多い参照画像のサイズ) にリサンプリングして保存し直します。
+    元の画像は「判定画像/.archive/normalize/<カテゴリ名>」に移動して残します。
+
+    Args:
+        script_dir (str): アプリケーションのルートディレクトリ。
+        category (str): カテゴリ名。
+        dry_run (bool): True の場合は保存せずに結果のみを報告します。
+
+    Returns:
+        dict: 基準サイズと、リサンプリングした (する) 画像のファイル名・元のサイズ。
+    """
+    bank = TemplateBank(script_dir)
+    entries = bank.load(category)
+    shape = bank.canonical.get(category)
+    report = {"category": category, "canonical": shape, "total": len(entries), "resized": []}
+    if shape is None:
+        # リサンプリングしないカテゴリ、または参照画像がない
+        return report
+
+    match_img_dir = bank.category_dir(category)
+    archive_dir = os.path.join(bank.base_dir, ".archive", "normalize", category)
+    for filename, _, _ in entries:
+        path = os.path.join(match_img_dir, filename)
+        try:
+            with Image.open(path) as img:
+                if img.size == (shape[1], shape[0]):
+                    continue
+                report["resized"].append((filename, img.size))
+                if dry_run:
+                    continue
+                resized = fx_resize_image(img.convert("RGB"), shape)
+            os.makedirs(archive_dir, exist_ok=True)
+            shutil.move(path, _archive_path(archive_dir, filename))
+            resized.save(path, "PNG")
+        except Exception as e:
+            print(f"{filename} のリサンプリング中にエラー: {e}")
+
+    if not dry_run and report["resized"]:
+        # キャッシュを更新 (保存し直した画像をデコード)
+        TemplateBank(script_dir).load(category)
+    return report
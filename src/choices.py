@@ -0,0 +1,128 @@
+import os
+import threading
+
+from .image_utils import fx_trim
+
+# --- 設定 ---
+CHOICE_DIR_NAME = "選択肢"
+ICON_DIR_NAME = "icon"
+
+# --- 選択肢リストの管理 ---
+
+class ChoiceRegistry:
+    """
+    「選択肢」フォルダの選択肢ファイル (ST.txt, SP.txt, 勝敗.txt, 攻守.txt) を一度だけ読み込んで保持します。
+    ファイルの更新時刻とサイズが変わった場合 (updata_list による更新など) は次の参照時に読み込み直します。
+
+    選択肢ごとに「アイコン画像のパス」と「判定画像のラベル」(fx_save_trim_img で保存した画像を
+    fx_trim したもの) の対応表も作成し、GUI と照合処理で共有します。
+    """
+    def __init__(self, script_dir):
+        """
+        Args:
+            script_dir (str): アプリケーションのルートディレクトリ。
+        """
+        self.choice_dir = os.path.join(script_dir, CHOICE_DIR_NAME)
+        self.icon_dir = os.path.join(self.choice_dir, ICON_DIR_NAME)
+        self._lock = threading.Lock()
+        # {選択肢ファイル名: ((更新時刻, サイズ), 名前のリスト, {ラベル: 名前})}
+        self._lists = {}
+        self._icon_dir_mtime = None
+        self._icon_paths = {} # {名前: アイコン画像のパス}
+
+    def _load(self, choice_file):
+        """選択肢ファイルを読み込み (変更がなければキャッシュを返す)、キャッシュのエントリを返します。"""
+        path = os.path.join(self.choice_dir, choice_file)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            print(f"      選択肢リストファイルが見つかりません: {path}。フリー入力のみ許可します。")
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        cached = self._lists.get(choice_file)
+        if cached and cached[0] == stamp:
+            return cached
+        try:
+            # 選択肢ファイルから名前を読み取る
+            with open(path, 'r', encoding='utf-8') as f:
+                names = [line.strip() for line in f if line.strip()]
+        except Exception as e:
+            print(f"      選択肢リストファイル {path} の読み取りエラー: {e}")
+            return None
+        print(f"      {choice_file} から {len(names)} 個の選択肢をロードしました")
+
+        labels = {}
+        for name in names:
+            labels.setdefault(self.template_label(name), name)
+        self._lists[choice_file] = (stamp, names, labels)
+        return self._lists[choice_file]
+
+    def names(self, choice_file):
+        """
+        選択肢ファイルの名前のリストを返します。
+
+        Args:
+            choice_file (str | None): 選択肢ファイル名 (例: "ST.txt")。
+
+        Returns:
+            list[str]: 名前のリスト (ファイルの順序)。ファイルがない場合は空のリスト。
+        """
+        if not choice_file or not isinstance(choice_file, str):
+            return []
+        with self._lock:
+            entry = self._load(choice_file)
+        return list(entry[1]) if entry else []
+
+    def name_for_label(self, choice_file, label):
+        """
+        判定画像のラベルに対応する選択肢の名前を返します。
+
+        Returns:
+            str: 対応する選択肢の名前。選択肢にない場合はラベルをそのまま返します。
+        """
+        if not choice_file or not isinstance(choice_file, str):
+            return label
+        with self._lock:
+            entry = self._load(choice_file)
+        return entry[2].get(label, label) if entry else label
+
+    @staticmethod
+    def template_label(name):
+        """選択肢の名前で判定画像を保存したときのラベル (例: "A_2" -> "A")。"""
+        return fx_trim(f"{name}.png")
+
+    def icon_path(self, name):
+        """
+        選択肢のアイコン画像のパスを返します。
+        アイコンフォルダの一覧はフォルダの更新時刻が変わった場合のみ取得し直します。
+
+        Returns:
+            str | None: アイコン画像のパス。アイコンがない場合は None。
+        """
+        with self._lock:
+            try:
+                mtime = os.stat(self.icon_dir).st_mtime_ns
+            except OSError:
+                return None
+            if mtime != self._icon_dir_mtime:
+                with os.scandir(self.icon_dir) as it:
+                    self._icon_paths = {
+                        os.path.splitext(e.name)[0]: e.path for e in it
+                        if e.name.lower().endswith('.png') and not e.name.startswith('.') and e.is_file()
+                    }
+                self._icon_dir_mtime = mtime
+            return self._icon_paths.get(name)
+
+
+_registries = {} # {ルートディレクトリ: ChoiceRegistry} (プロセス全体で共有)
+_registries_lock = threading.Lock()
+
+
+def get_choice_registry(script_dir):
+    """ルートディレクトリごとに共有される ChoiceRegistry を返します。"""
+    key = os.path.abspath(script_dir)
+    with _registries_lock:
+        if key not in _registries:
+            _registries[key] = ChoiceRegistry(script_dir)
+        return _registries[key]
@@ -0,0 +1,245 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# GUI (tkinter) に依存しないモジュールのみをインポート (ワーカープロセスからも使用するため)
+from .image_utils import fx_load_screenshot, fx_load_color, fx_color_crop, fx_crop_hash
+from .template_bank import TemplateBank
+from . import instrument
+
+# --- 設定 ---
+MATCH_THRESHOLD = 0.9 # 自動マッチングの信頼度しきい値
+EMPTY_SLOT_LABEL = "-" # 空きスロットとして結果に記録する値
+EMPTY_SLOT_CATEGORIES = ("キャラクター",) # 空きスロットの判定を行うカテゴリ
+EMPTY_STD_THRESHOLD = 6.0 # 輝度の標準偏差がこれ未満のトリミング画像は空きスロットとみなす
+PREFETCH_PER_WORKER = 2 # 並列処理時に先行して分類する画像数 (ワーカー1つあたり)
+
+# --- スクリーンショット単位の分類 ---
+
+def classify_screenshot(input_path, positions, bank, match_threshold=MATCH_THRESHOLD):
+    """
+    1枚のスクリーンショットを開き、各ポジションをトリミングして参照画像とマッチングします。
+    ユーザー入力は行わず、しきい値未満のポジションはトリミング画像を添えて返します。
+
+    画像はグレースケール配列として1回だけデコードし、各ポジションはそのスライスとして比較します。
+    カラーのトリミング画像は、ユーザー入力が必要なポジションについてのみ作成します
+    (JPEG のカラー画像は最初に必要になった時点で1回だけデコードし、以降のポジションで共有します)。
+
+    EMPTY_SLOT_CATEGORIES のポジションは、テンプレートマッチングの前に空きスロットかどうかを判定し、
+    空きの場合は EMPTY_SLOT_LABEL をラベルとします (is_empty_slot を参照)。
+
+    Args:
+        input_path (str): スクリーンショットのパス。
+        positions (list): トリミング領域と関連情報を定義するリスト。
+        bank (TemplateBank): 参照画像バンク。
+        match_threshold (float): 自動マッチングの信頼度しきい値。
+
+    Returns:
+        list[dict] | None: ポジションごとの結果。画像を開けなかった場合は None。
+            各要素は以下のキーを持つ辞書です。
+              - "label": 自動マッチしたラベル。しきい値未満の場合は None。
+              - "best": しきい値に関係なく最もスコアの高いラベル。
+              - "score": ベストマッチのスコア。
+              - "template": ベストマッチの参照画像のファイル名。
+              - "hash": トリミング画像の画素ハッシュ (判定結果キャッシュのキー)。
+              - "cached": 判定結果キャッシュから決定した場合は True。
+              - "empty": 空きスロットと判定した場合は True。
+              - "crop": しきい値未満の場合のトリミング画像 (PIL.Image.Image)。それ以外は None。
+              - "gray": しきい値未満の場合のトリミング画像のグレースケール配列。それ以外は None。
+              - "error": トリミングに失敗した場合のエラー内容。それ以外は None。
+    """
+    instrument.set_screenshot(os.path.basename(input_path))
+    try:
+        # 画像を開き、グレースケール配列を作成 (カラー配列は JPEG 以外のみ保持)
+        with instrument.span("decode"):
+            input_gray, input_color = fx_load_screenshot(input_path)
+    except Exception as e:
+        # 画像ファイルを開く際のエラーを処理 (例: 破損ファイル)
+        print(f"画像 {os.path.basename(input_path)} を開くエラー: {e}。スキップします。")
+        return None
+
+    # 画像の寸法を取得
+    h, w = input_gray.shape
+    results = []
+
+    for position_info in positions:
+        result = {"label": None, "best": "", "score": -1.0, "template": None,
+                  "hash": None, "cached": False, "empty": False, "crop": None, "gray": None, "error": None}
+        results.append(result)
+        try:
+            # ポジションの詳細を抽出: 座標、選択肢ファイル、保存フォルダ名
+            l_rel, t_rel, r_rel, b_rel, choice_file, save_folder_name = position_info
+            with instrument.span("crop", save_folder_name):
+                # 相対値から絶対ピクセル座標を計算して画像をトリミング (コピーなしのスライス)
+                box = (max(int(w * l_rel), 0), max(int(h * t_rel), 0),
+                       min(int(w * r_rel), w), min(int(h * b_rel), h))
+                if box[2] <= box[0] or box[3] <= box[1]:
+                    raise ValueError(f"トリミング領域が画像の範囲外です: {box}")
+                crop_gray = input_gray[box[1]:box[3], box[0]:box[2]]
+                result["hash"] = fx_crop_hash(crop_gray)
+        except Exception as e:
+            # トリミング中のエラーを処理 (例: 無効な座標)
+            result["error"] = str(e)
+            continue
+
+        # --- 空きスロット: 参照画像全体との比較を行わずに判定 ---
+        if save_folder_name in EMPTY_SLOT_CATEGORIES:
+            with instrument.span("empty_check", save_folder_name):
+                empty, template_name, score = is_empty_slot(bank, save_folder_name, crop_gray, match_threshold)
+            if empty:
+                result["label"] = result["best"] = EMPTY_SLOT_LABEL
+                result["score"], result["template"], result["empty"] = score, template_name, True
+                bank.record_hit(save_folder_name, template_name)
+                instrument.count("empty_slot", save_folder_name)
+                continue
+
+        # --- 判定結果キャッシュ: 以前と完全に同じトリミング画像ならマッチングを省略 ---
+        with instrument.span("cache_lookup", save_folder_name):
+            cached = bank.lookup_crop(save_folder_name, result["hash"])
+        if cached:
+            result["template"], result["label"] = cached
+            result["best"], result["score"], result["cached"] = result["label"], 1.0, True
+            bank.record_hit(save_folder_name, result["template"])
+            instrument.count("crop_cache_hit", save_folder_name)
+            continue
+
+        # --- テンプレートマッチング ---
+        with instrument.span("match", save_folder_name):
+            template_name, best_match_name, best_match_score = bank.best_entry(
+                save_folder_name, crop_gray, min_score=match_threshold)
+        result["best"] = best_match_name
+        result["score"] = best_match_score
+        result["template"] = template_name
+        if best_match_score >= match_threshold:
+            result["label"] = best_match_name
+            # 採用された参照画像を以降の比較で優先する
+            bank.record_hit(save_folder_name, template_name)
+            instrument.count("auto_match", save_folder_name)
+        else:
+            # ユーザー入力用にトリミング画像を保持 (スクリーンショット全体を参照し続けないようにコピー)
+            if input_color is None:
+                with instrument.span("decode"):
+                    input_color = fx_load_color(input_path)
+            result["crop"] = fx_color_crop(input_color, box)
+            result["gray"] = crop_gray.copy()
+            instrument.count("needs_review", save_folder_name)
+
+    return results
+
+
+def is_empty_slot(bank, category, crop_gray, match_threshold=MATCH_THRESHOLD):
+    """
+    トリミング画像が空きスロットかどうかを判定します。
+
+    輝度がほぼ一定 (標準偏差が EMPTY_STD_THRESHOLD 未満) の場合は空きとみなします。
+    それ以外は、ラベルが EMPTY_SLOT_LABEL の参照画像 (ユーザーが空きスロットとして登録したもの) とだけ比較し、
+    match_threshold 以上であれば空きとみなします。
+
+    Args:
+        bank (TemplateBank): 参照画像バンク。
+        category (str): カテゴリ名。
+        crop_gray (numpy.ndarray): トリミング画像のグレースケール配列。
+        match_threshold (float): 登録済みの空きスロット画像との一致とみなすスコア。
+
+    Returns:
+        tuple[bool, str | None, float]: (空きかどうか, 一致した参照画像のファイル名, スコア)。
+    """
+    if crop_gray.size and float(crop_gray.std()) < EMPTY_STD_THRESHOLD:
+        return True, None, 1.0
+    template_name, score = bank.best_of_label(category, crop_gray, EMPTY_SLOT_LABEL)
+    return score >= match_threshold, template_name, score
+
+
+# --- 並列処理 ---
+
+_worker_bank = None # ワーカープロセスごとの参照画像バンク
+
+
+def _init_worker(script_dir, categories, profile=False):
+    """ワーカープロセスの初期化: 参照画像バンクをキャッシュから読み込みます。"""
+    global _worker_bank
+    if profile:
+        instrument.enable()
+    _worker_bank = TemplateBank(script_dir)
+    for category in dict.fromkeys(categories):
+        _worker_bank.load(category)
+
+
+def _classify_in_worker(input_path, positions):
+    """
+    ワーカープロセス内で1枚のスクリーンショットを分類します。
+    計測が有効な場合は、このワーカーで記録したイベントも一緒に返します。
+    """
+    results = classify_screenshot(input_path, positions, _worker_bank)
+    return results, (instrument.drain() if instrument.is_enabled() else None)
+
+
+def _remember_results(bank, positions, results):
+    """自動マッチしたトリミング画像を判定結果キャッシュに記録して確定します (呼び出し側のプロセスで実行)。"""
+    for position_info, result in zip(positions, results or []):
+        if result["label"] is not None and not result["cached"]:
+            bank.remember_crop(position_info[5], result["hash"], result["label"], result["template"])
+    bank.commit_crops()
+
+
+def iter_classified(input_paths, positions, bank, workers=None):
+    """
+    スクリーンショットを順に分類し、入力順のまま結果を返すジェネレーター。
+
+    workers が2以上の場合は ProcessPoolExecutor で先行して分類します。先行する画像は
+    workers * PREFETCH_PER_WORKER 枚までとし、結果を1つ返すごとに次の画像を投入します
+    (入力フォルダの画像数に関係なく、保持するトリミング画像の量を一定に抑えるため)。
+    1以下 (または None) の場合は、呼び出し側が前の結果を処理し終えてから次の画像を分類するため、
+    手動入力で追加された参照画像が後続の画像にもすぐに反映されます。
+
+    Args:
+        input_paths (list[str]): スクリーンショットのパスのリスト (処理順)。
+        positions (list): トリミング領域と関連情報を定義するリスト。
+        bank (TemplateBank): 参照画像バンク (逐次処理時に使用)。
+        workers (int | None): ワーカープロセス数。
+
+    Yields:
+        tuple[str, list[dict] | None]: (スクリーンショットのパス, classify_screenshot の結果)。
+    """
+    if not workers or workers <= 1:
+        for input_path in input_paths:
+            results = classify_screenshot(input_path, positions, bank)
+            _remember_results(bank, positions, results)
+            yield input_path, results
+        return
+
+    categories = [position_info[5] for position_info in positions if len(position_info) >= 6]
+    print(f"{workers} プロセスで並列に分類します...")
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(bank.script_dir, categories, instrument.is_enabled())) as executor:
+        pending_paths = iter(input_paths)
+        futures = deque() # (スクリーンショットのパス, Future) を入力順に保持
+
+        def submit_next():
+            input_path = next(pending_paths, None)
+            if input_path is not None:
+                futures.append((input_path, executor.submit(_classify_in_worker, input_path, positions)))
+
+        for _ in range(workers * PREFETCH_PER_WORKER):
+            submit_next()
+        try:
+            while futures:
+                input_path, future = futures.popleft()
+                submit_next()
+                try:
+                    results, recorded = future.result()
+                    if recorded:
+                        instrument.merge(*recorded)
+                except Exception as e:
+                    print(f"画像 {os.path.basename(input_path)} の並列処理エラー: {e}。スキップします。")
+                    results = None
+                # ワーカー側で記録されたヒットを、保存用に呼び出し側のバンクにも反映
+                for position_info, result in zip(positions, results or []):
+                    if result["label"] is not None:
+                        bank.record_hit(position_info[5], result["template"])
+                _remember_results(bank, positions, results)
+                yield input_path, results
+        finally:
+            # 途中で中断された場合は未着手の処理を取り消す
+            for _, future in futures:
+                future.cancel()
@@ -0,0 +1,293 @@
+import os
+import sys
+import csv
+import argparse
+import datetime
+
+# GUI (tkinter) に依存しないモジュールのみをインポート (ヘッドレス環境で実行するため)
+from . import select_preset
+from .template_bank import TemplateBank
+from .classifier import iter_classified
+from .results import ResultWriter
+from .result_store import RESULT_DB_NAME, ResultStore
+from .folder_watcher import FolderWatcher
+from . import instrument
+
+# --- 設定 ---
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # アプリケーションのルート
+VALID_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+REVIEW_FILE_NAME = "review.tsv"
+REVIEW_COLUMNS = ["screenshot", "position", "category", "choice_file", "best", "score", "crop", "error"]
+
+# 終了コード
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_PENDING_REVIEW = 2 # 未判定のトリミング画像が残っている
+
+
+def list_input_files(input_dir):
+    """入力ディレクトリ内の画像ファイルのパスをソートして返します。"""
+    return [
+        os.path.join(input_dir, f) for f in sorted(os.listdir(input_dir))
+        if f.lower().endswith(VALID_EXTENSIONS)
+    ]
+
+
+def classify_batch(script_dir, positions, input_paths, bank, workers=None,
+                   output_format="tsv", output_path=None, review_dir=None, dt_now_str=None):
+    """
+    GUIを使わずに画像を分類し、すべてのポジションが自動判定できた画像のみを記録します。
+    判定できなかったトリミング画像は review_dir に保存し、レビュー待ちとして返します
+    (元画像は入力ディレクトリに残るため、GUIでの実行時や次回の実行時に再処理されます)。
+
+    Args:
+        script_dir (str): アプリケーションのルートディレクトリ。
+        positions (list): トリミング領域と関連情報を定義するリスト。
+        input_paths (list[str]): 処理する画像のパス (処理順)。
+        bank (TemplateBank): 参照画像バンク。
+        workers (int | None): 並列処理のワーカープロセス数。
+        output_format (str): "tsv" (リザルト_<攻守>.txt に追記) または "jsonl" (ResultWriter を参照)。
+        output_path (str | None): jsonl の出力先。
+        review_dir (str | None): 未判定のトリミング画像の保存先。
+        dt_now_str (str | None): 結果行に記録するタイムスタンプ。
+
+    Returns:
+        tuple[int, list[dict]]: (記録した画像数, レビュー待ちの行のリスト)。
+    """
+    dt_now_str = dt_now_str or datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    review_dir = review_dir or os.path.join(script_dir, "未判定")
+    recorded = 0
+    pending = []
+
+    # 結果行はバッチの最後にまとめて書き込む (強制終了した場合は次回の起動時にジャーナルから復元)
+    writer = ResultWriter(script_dir, output_format, output_path)
+    try:
+        for input_path, results in iter_classified(input_paths, positions, bank, workers):
+            input_img_name = os.path.basename(input_path)
+            if results is None:
+                pending.append({"screenshot": input_img_name, "error": "画像を開けません"})
+                continue
+
+            unresolved = [idx for idx, result in enumerate(results) if result["label"] is None]
+            if unresolved:
+                stem = os.path.splitext(input_img_name)[0]
+                for idx in unresolved:
+                    result = results[idx]
+                    row = {
+                        "screenshot": input_img_name,
+                        "position": idx,
+                        "category": positions[idx][5] if len(positions[idx]) >= 6 else "",
+                        "choice_file": positions[idx][4] if len(positions[idx]) >= 6 else "",
+                        "best": result["best"],
+                        "score": f"{result['score']:.3f}",
+                        "error": result["error"] or "",
+                    }
+                    if result["crop"] is not None:
+                        os.makedirs(review_dir, exist_ok=True)
+                        crop_path = os.path.join(review_dir, f"{stem}_pos{idx:02d}.png")
+                        result["crop"].save(crop_path, "PNG")
+                        row["crop"] = crop_path
+                    pending.append(row)
+                print(f"{input_img_name}: 未判定 {len(unresolved)} 件。レビュー待ちとして残します。")
+                continue
+
+            data = [result["label"] for result in results]
+            if writer.record(input_path, data, True, dt_now_str,
+                             scores=[result["score"] for result in results]):
+                recorded += 1
+    finally:
+        writer.close()
+        bank.flush()
+
+    return recorded, pending
+
+
+def write_review_file(review_dir, pending):
+    """
+    レビュー待ちの一覧を review_dir/review.tsv に書き出します。
+    前回の一覧に含まれていたトリミング画像は削除し、今回の結果で置き換えます。
+    """
+    review_path = os.path.join(review_dir, REVIEW_FILE_NAME)
+    if os.path.exists(review_path):
+        with open(review_path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f, delimiter='\t'):
+                crop_path = row.get("crop")
+                if crop_path and os.path.exists(crop_path) and \
+                        not any(p.get("crop") == crop_path for p in pending):
+                    os.remove(crop_path)
+        if not pending:
+            os.remove(review_path)
+
+    if pending:
+        os.makedirs(review_dir, exist_ok=True)
+        with open(review_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=REVIEW_COLUMNS, delimiter='\t', restval="")
+            writer.writeheader()
+            writer.writerows(pending)
+    return review_path
+
+
+def run_classify(args):
+    """classify サブコマンド"""
+    try:
+        positions = select_preset.load(args.preset)
+    except Exception as e:
+        print(f"エラー: プリセット '{args.preset}' を読み込めません: {e}")
+        return EXIT_ERROR
+
+    if args.update_list:
+        from .updatalist import updata_list
+        updata_list(SCRIPT_DIR) # 生徒リストの更新
+
+    try:
+        input_paths = list_input_files(args.input_dir)
+    except FileNotFoundError:
+        print(f"エラー: 入力ディレクトリが見つかりません: {args.input_dir}")
+        return EXIT_ERROR
+    if not input_paths:
+        print(f"{args.input_dir} に処理対象の画像がありません。")
+        return EXIT_OK
+
+    bank = TemplateBank(SCRIPT_DIR)
+    bank.preload(position_info[5] for position_info in positions if len(position_info) >= 6)
+
+    print(f"{len(input_paths)} 個の画像の処理を開始します...")
+    review_dir = args.review_dir or os.path.join(SCRIPT_DIR, "未判定")
+    recorded, pending = classify_batch(
+        SCRIPT_DIR, positions, input_paths, bank, workers=args.parallel,
+        output_format=args.format, output_path=args.output, review_dir=review_dir
+    )
+    review_path = write_review_file(review_dir, pending)
+    instrument.report(args.profile)
+
+    print(f"\n記録: {recorded} 枚 / 未判定: {len(pending)} 件")
+    if pending:
+        print(f"未判定の一覧: {review_path}")
+        return EXIT_PENDING_REVIEW
+    return EXIT_OK
+
+
+def run_watch(args):
+    """watch サブコマンド: 入力フォルダを監視し、追加された画像を順に分類します (Ctrl+C で終了)。"""
+    try:
+        positions = select_preset.load(args.preset)
+    except Exception as e:
+        print(f"エラー: プリセット '{args.preset}' を読み込めません: {e}")
+        return EXIT_ERROR
+
+    if args.update_list:
+        from .updatalist import updata_list
+        updata_list(SCRIPT_DIR) # 生徒リストの更新
+
+    categories = [position_info[5] for position_info in positions if len(position_info) >= 6]
+    bank = TemplateBank(SCRIPT_DIR)
+    bank.preload(categories)
+
+    review_dir = args.review_dir or os.path.join(SCRIPT_DIR, "未判定")
+    watcher = FolderWatcher(args.input_dir, VALID_EXTENSIONS, use_events=not args.poll)
+    watcher.start()
+    print(f"{args.input_dir} を監視しています ({watcher.mode})。Ctrl+C で終了します。")
+
+    pending = {} # {スクリーンショット名: レビュー待ちの行のリスト}
+    total_recorded = 0
+    try:
+        while True:
+            ready = watcher.wait_ready()
+            # 別のプロセス (main.py など) で登録された参照画像を反映
+            bank.refresh(categories)
+            recorded, new_pending = classify_batch(
+                SCRIPT_DIR, positions, ready, bank,
+                output_format=args.format, output_path=args.output, review_dir=review_dir
+            )
+            total_recorded += recorded
+            for input_path in ready:
+                watcher.mark_done(input_path)
+                pending.pop(os.path.basename(input_path), None)
+            for row in new_pending:
+                pending.setdefault(row["screenshot"], []).append(row)
+            write_review_file(review_dir, [row for rows in pending.values() for row in rows])
+    except KeyboardInterrupt:
+        print("\n監視を終了します。")
+    finally:
+        watcher.stop()
+        instrument.report(args.profile)
+
+    print(f"記録: {total_recorded} 枚 / 未判定: {sum(len(rows) for rows in pending.values())} 件")
+    return EXIT_PENDING_REVIEW if pending else EXIT_OK
+
+
+def run_export(args):
+    """export サブコマンド: 結果データベースの試合を リザルト_<攻守>.txt と同じ形式の TSV に書き出します。"""
+    db_path = os.path.join(SCRIPT_DIR, RESULT_DB_NAME)
+    if not os.path.exists(db_path):
+        print(f"エラー: 結果データベースが見つかりません: {db_path}")
+        return EXIT_ERROR
+
+    store = ResultStore(db_path)
+    try:
+        exported = store.export_tsv(args.output_dir, side=args.side, opponent=args.opponent,
+                                    student=args.student, since=args.since, until=args.until)
+    finally:
+        store.close()
+    if not exported:
+        print("条件に一致する試合がありません。")
+    for side, (path, count) in exported.items():
+        print(f"{side}: {count} 試合 -> {path}")
+    return EXIT_OK
+
+
+def _add_common_arguments(parser):
+    """classify / watch 共通の引数を追加"""
+    parser.add_argument("input_dir", nargs="?", default=os.path.join(SCRIPT_DIR, "Screenshots"),
+                        help="入力画像のフォルダ (既定: Screenshots)")
+    parser.add_argument("--preset", required=True, help="使用する座標プリセット名")
+    parser.add_argument("--format", choices=["tsv", "jsonl"], default="tsv",
+                        help="tsv: リザルト_<攻守>.txt に追記 / jsonl: JSON Lines で出力")
+    parser.add_argument("--output", help="jsonl の出力先 (既定: リザルト.jsonl)")
+    parser.add_argument("--review-dir", help="未判定のトリミング画像と review.tsv の保存先 (既定: 未判定)")
+    parser.add_argument("--update-list", action="store_true",
+                        help="処理前に生徒リスト (ST.txt / SP.txt) を更新する")
+    parser.add_argument("--profile", nargs="?", const=os.path.join(SCRIPT_DIR, "trace.json"),
+                        default=None, metavar="TRACE",
+                        help="処理段階ごとの時間を計測し、集計表と Chrome trace 形式の JSON を出力する")
+
+
+def main(argv=None):
+    """コマンドライン引数を解析してサブコマンドを実行"""
+    parser = argparse.ArgumentParser(prog="python -m src.cli",
+                                     description="対抗戦のリザルト画像をGUIなしで文字起こしします。")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    classify_parser = subparsers.add_parser("classify", help="入力フォルダの画像をまとめて分類する")
+    _add_common_arguments(classify_parser)
+    classify_parser.add_argument("--parallel", nargs="?", type=int, const=os.cpu_count() or 1,
+                                 default=None, metavar="N", help="Nプロセスで並列に分類する")
+
+    watch_parser = subparsers.add_parser("watch", help="入力フォルダを監視し、追加された画像を順に分類する")
+    _add_common_arguments(watch_parser)
+    watch_parser.add_argument("--poll", action="store_true",
+                              help="watchdog (ファイル変更通知) を使わずにポーリングで監視する")
+
+    export_parser = subparsers.add_parser("export", help="結果データベースの試合を TSV に書き出す")
+    export_parser.add_argument("output_dir", nargs="?", default=os.path.join(SCRIPT_DIR, "エクスポート"),
+                               help="出力先のフォルダ (既定: エクスポート)。ルートを指定すると転記用のファイルを上書きします")
+    export_parser.add_argument("--side", help="攻守で絞り込む (例: 攻撃)")
+    export_parser.add_argument("--opponent", help="対戦相手で絞り込む")
+    export_parser.add_argument("--student", help="編成に含まれる生徒で絞り込む")
+    export_parser.add_argument("--since", metavar="YYYY-MM-DD", help="この日付以降の試合のみ")
+    export_parser.add_argument("--until", metavar="YYYY-MM-DD", help="この日付以前の試合のみ")
+
+    args = parser.parse_args(argv)
+    if args.command == "export":
+        return run_export(args)
+    if args.profile:
+        instrument.enable()
+    if args.command == "classify":
+        return run_classify(args)
+    if args.command == "watch":
+        return run_watch(args)
+    return EXIT_ERROR
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+import os
+import sqlite3
+
+# --- トリミング画像の判定結果キャッシュ ---
+
+class CropCache:
+    """
+    トリミング画像 (グレースケール) の画素ハッシュと判定結果の対応を SQLite に保存します。
+    同じ対戦相手の名前欄や同じ編成は何度も現れるため、完全に一致するトリミング画像は
+    テンプレートマッチングを行わずにラベルを決定できます。
+
+    各行には判定の根拠となった参照画像のファイル名も保存し、参照画像が削除・リネーム
+    (ラベル変更) された場合はその行を無効として扱います (検証は TemplateBank が行います)。
+    """
+    def __init__(self, db_path):
+        """
+        Args:
+            db_path (str): SQLite ファイルのパス。
+        """
+        self.db_path = db_path
+        self._conn = None
+
+    def _connect(self):
+        """初回使用時にデータベースを開き、テーブルを作成します。"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, timeout=10)
+            # 並列処理のワーカーが読み込み中でも書き込めるように WAL モードを使用
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS crops ("
+                " category TEXT NOT NULL,"
+                " hash TEXT NOT NULL,"
+                " label TEXT NOT NULL,"
+                " template TEXT NOT NULL,"
+                " PRIMARY KEY (category, hash)"
+                ") WITHOUT ROWID"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, category, crop_hash):
+        """
+        キャッシュされた判定結果を返します。
+
+        Args:
+            category (str): カテゴリ名。
+            crop_hash (str): fx_crop_hash で計算したハッシュ。
+
+        Returns:
+            tuple[str, str] | None: (ラベル, 参照画像のファイル名)。未登録の場合は None。
+        """
+        try:
+            return self._connect().execute(
+                "SELECT label, template FROM crops WHERE category = ? AND hash = ?",
+                (category, crop_hash)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"警告: 判定結果キャッシュの読み込みエラー: {e}")
+            return None
+
+    def put(self, category, crop_hash, label, template):
+        """
+        判定結果を登録します (commit() を呼ぶまで確定しません)。
+
+        Args:
+            category (str): カテゴリ名。
+            crop_hash (str): fx_crop_hash で計算したハッシュ。
+            label (str): 判定されたラベル。
+            template (str): 判定の根拠となった参照画像のファイル名。
+        """
+        try:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO crops (category, hash, label, template) VALUES (?, ?, ?, ?)",
+                (category, crop_hash, label, template)
+            )
+        except sqlite3.Error as e:
+            print(f"警告: 判定結果キャッシュの書き込みエラー: {e}")
+
+    def purge(self, category, templates):
+        """
+        参照画像が存在しなくなった、またはラベルが変わった行を削除します。
+
+        Args:
+            category (str): カテゴリ名。
+            templates (dict[str, str]): 現在の {参照画像のファイル名: ラベル}。
+
+        Returns:
+            int: 削除した行数。
+        """
+        try:
+            conn = self._connect()
+            rows = conn.execute(
+                "SELECT hash, label, template FROM crops WHERE category = ?", (category,)
+            ).fetchall()
+            stale = [(category, h) for h, label, template in rows if templates.get(template) != label]
+            conn.executemany("DELETE FROM crops WHERE category = ? AND hash = ?", stale)
+            return len(stale)
+        except sqlite3.Error as e:
+            print(f"警告: 判定結果キャッシュの整理エラー: {e}")
+            return 0
+
+    def commit(self):
+        """保留中の書き込みを確定します。"""
+        if self._conn is not None:
+            try:
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"警告: 判定結果キャッシュの保存エラー: {e}")
+
+    def close(self):
+        """データベースを閉じます。"""
+        if self._conn is not None:
+            self.commit()
+            self._conn.close()
+            self._conn = None
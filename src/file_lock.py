@@ -0,0 +1,73 @@
+# ファイルロック (プロセス間の排他制御) は OS ごとに異なるモジュールを使用
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+    import fcntl
+
+# --- プロセス間のファイルロック ---
+
+class FileLock:
+    """
+    ロックファイルによるプロセス間の排他制御 (with 文、または acquire() / release() で使用)。
+    ロックはプロセスが終了すると OS によって解放されます。
+    """
+    def __init__(self, path):
+        """
+        Args:
+            path (str): ロックファイルのパス (存在しない場合は作成)。
+        """
+        self.path = path
+        self._file = None
+
+    def acquire(self, blocking=True):
+        """
+        ロックを取得します。
+
+        Args:
+            blocking (bool): False の場合、他のプロセスがロック中であれば待たずに False を返します。
+
+        Returns:
+            bool: ロックを取得できたかどうか。
+        """
+        self._file = open(self.path, 'a+b')
+        try:
+            if msvcrt is not None:
+                while True:
+                    try:
+                        self._file.seek(0)
+                        msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        if not blocking:
+                            raise
+                        # LK_LOCK は約10秒で諦めるため、取得できるまで繰り返す
+            else:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._file.close()
+            self._file = None
+            return False
+        return True
+
+    def release(self):
+        """ロックを解放します。"""
+        if self._file is None:
+            return
+        try:
+            if msvcrt is not None:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
@@ -0,0 +1,190 @@
+import os
+import time
+import threading
+
+# watchdog はオプション (未インストールの場合はポーリングで監視)
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# --- 設定 ---
+POLL_INTERVAL = 0.5 # ポーリング時のフォルダ一覧の取得間隔 (秒)
+SETTLE_TIME = 0.3 # サイズと更新時刻がこの時間変化しなければ書き込み完了とみなす (秒)
+CHECK_INTERVAL = 0.1 # 書き込み中のファイルを確認する間隔 (秒)
+
+# --- フォルダ監視 ---
+
+class _EventHandler(FileSystemEventHandler):
+    """watchdog のイベントを受け取り、変化のあったパスを FolderWatcher に通知します。"""
+    def __init__(self, watcher):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher.notify(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.notify(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher.notify(event.dest_path)
+
+
+class FolderWatcher:
+    """
+    フォルダに追加された画像ファイルを検出し、書き込みが完了したものから順に返します。
+
+    watchdog がインストールされていれば OS のファイル変更通知 (inotify など) を使用し、
+    なければ POLL_INTERVAL ごとにフォルダ一覧を取得して比較します。
+    コピー中のファイルを読み込まないよう、サイズと更新時刻が SETTLE_TIME の間
+    変化しなかったファイルのみを「書き込み完了」として扱います。
+
+    一度返したファイルは、サイズまたは更新時刻が変わらない限り再度返しません
+    (判定できずにフォルダに残った画像を繰り返し処理しないため)。
+    """
+    def __init__(self, folder, extensions, use_events=True,
+                 poll_interval=POLL_INTERVAL, settle_time=SETTLE_TIME):
+        """
+        Args:
+            folder (str): 監視するフォルダ。
+            extensions (tuple[str, ...]): 対象とする拡張子 (小文字)。
+            use_events (bool): False の場合は watchdog があってもポーリングで監視します。
+            poll_interval (float): フォルダ一覧の取得間隔 (秒)。
+            settle_time (float): 書き込み完了とみなすまでの待機時間 (秒)。
+        """
+        self.folder = folder
+        self.extensions = extensions
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.use_events = use_events and Observer is not None
+        self._observer = None
+        self._lock = threading.Lock()
+        self._notified = set() # イベントで通知されたパス
+        self._wakeup = threading.Event()
+        # {パス: (サイズ, 更新時刻, 最後に変化を検出した時刻)} 書き込み完了待ちのファイル
+        self._pending = {}
+        # {パス: (サイズ, 更新時刻)} 既に返したファイル
+        self._done = {}
+        self._last_scan = 0.0
+
+    @property
+    def mode(self):
+        """監視方式 ("events" または "polling")。"""
+        return "events" if self.use_events else "polling"
+
+    def start(self):
+        """監視を開始します。起動時にフォルダ内にあるファイルも処理対象になります。"""
+        os.makedirs(self.folder, exist_ok=True)
+        if self.use_events:
+            self._observer = Observer()
+            self._observer.schedule(_EventHandler(self), self.folder, recursive=False)
+            self._observer.start()
+        self._scan()
+
+    def stop(self):
+        """監視を終了します。"""
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        self._wakeup.set()
+
+    def notify(self, path):
+        """変化のあったパスを登録します (watchdog のスレッドから呼ばれます)。"""
+        with self._lock:
+            self._notified.add(path)
+        self._wakeup.set()
+
+    def _is_target(self, path):
+        """監視対象のファイルかどうか"""
+        return os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.folder) and \
+            path.lower().endswith(self.extensions)
+
+    def _scan(self):
+        """フォルダ内のファイルをすべて確認対象に加えます。"""
+        self._last_scan = time.monotonic()
+        try:
+            with os.scandir(self.folder) as it:
+                paths = [e.path for e in it if e.is_file() and e.name.lower().endswith(self.extensions)]
+        except OSError as e:
+            print(f"警告: 監視フォルダを読み込めません: {e}")
+            return
+        with self._lock:
+            self._notified.update(paths)
+
+    def _check(self, now):
+        """
+        確認対象のファイルの状態を更新し、書き込みが完了したファイルを返します。
+
+        Returns:
+            list[str]: 書き込みが完了したファイルのパス (名前順)。
+        """
+        with self._lock:
+            notified, self._notified = self._notified, set()
+        for path in notified:
+            if self._is_target(path) and path not in self._pending:
+                self._pending[path] = (-1, -1, now)
+
+        ready = []
+        for path, (size, mtime, changed_at) in list(self._pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # 処理前に削除・移動されたファイル
+                del self._pending[path]
+                continue
+            current = (stat.st_size, stat.st_mtime_ns)
+            if self._done.get(path) == current:
+                del self._pending[path]
+            elif current != (size, mtime):
+                self._pending[path] = current + (now,)
+            elif stat.st_size > 0 and now - changed_at >= self.settle_time:
+                del self._pending[path]
+                ready.append(path)
+        return sorted(ready)
+
+    def mark_done(self, path):
+        """
+        処理済みのファイルを記録します。フォルダに残ったファイルは、
+        内容が変わらない限り再度返されません。
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._done.pop(path, None)
+            return
+        self._done[path] = (stat.st_size, stat.st_mtime_ns)
+
+    def wait_ready(self, stop_event=None):
+        """
+        書き込みが完了したファイルが現れるまで待機します。
+
+        Args:
+            stop_event (threading.Event | None): セットされると空のリストを返して終了します。
+
+        Returns:
+            list[str]: 書き込みが完了したファイルのパス (名前順)。
+        """
+        while stop_event is None or not stop_event.is_set():
+            now = time.monotonic()
+            if not self.use_events and now - self._last_scan >= self.poll_interval:
+                self._scan()
+            ready = self._check(now)
+            if ready:
+                return ready
+            # 書き込み完了待ちのファイルがある場合は短い間隔で再確認
+            if self._pending:
+                timeout = CHECK_INTERVAL
+            elif self.use_events:
+                timeout = None
+            else:
+                timeout = max(0.0, self.poll_interval - (now - self._last_scan))
+            self._wakeup.wait(timeout if timeout is not None else 1.0)
+            self._wakeup.clear()
+        return []
@@ -2,11 +2,29 @@ import tkinter as tk
 from tkinter import messagebox
 from PIL import Image, ImageTk
 import os
+import math
+import time
+import queue
+import threading
+from .thumbnails import get_thumbnail_cache
+from .choices import get_choice_registry
+
+# --- 設定 ---
+BUTTON_COLUMNS = 5 # 1行あたりのボタン数
+ICON_SIZE = (80, 80) # ボタンに表示するアイコンのサイズ
+THUMBNAIL_SAVE_DELAY_MS = 2000 # 新しいサムネイルをスプライトシートに保存するまでの待機時間 (ミリ秒)
+SHORTCUT_KEYS = "123456789" # 先頭の候補ボタンを選択するキー
+EVENT_POLL_MS = 50 # 処理スレッドからのイベントを確認する間隔 (ミリ秒)
+PROGRESS_INTERVAL = 0.25 # 進捗表示を更新する最短の間隔 (秒)
 
 class ImageClassifierGUI:
     """
     Tkinterを使用して画像分類ツールのグラフィカルユーザーインターフェース (GUI) を管理します。
     画像を表示し、分類オプションをボタンとして提示し、ユーザー入力を処理します。
+
+    Tkinter はスレッドセーフではないため、処理スレッドからは post() / post_progress() /
+    get_input_for_image() / set_review_status() のみを呼び出します。これらはイベントをキューに入れるだけで、
+    実際のウィジェット操作は Tk のメインループが EVENT_POLL_MS ごとに process_events() で行います。
     """
     def __init__(self, root, script_dir):
         """
@@ -18,14 +36,32 @@ class ImageClassifierGUI:
         """
         self.root = root
         self.script_dir = script_dir
+        self.choices = get_choice_registry(script_dir) # 選択肢とアイコンの対応表 (処理スレッドと共有)
         self.root.title("画像分類ツール")
         self.root.geometry("800x700") # 初期ウィンドウサイズ
 
         # --- 状態変数 ---
         self.user_input = None # ユーザーが選択/入力した名前を格納
-        self.input_received = tk.BooleanVar(value=False) # 待機できるフラグとして機能します (wait_variable)
+        self.input_received = threading.Event() # 処理スレッドが入力を待機するためのフラグ
+        self.prompt_active = False # 入力待ちの画像を表示中かどうか (Tkスレッドのみで使用)
+        self.closed = False # ウィンドウが閉じられたかどうか (以降の入力待ちは即座に None を返す)
         self.img_tk = None # 現在表示されているImageTkオブジェクトへの参照を保持
         self.empty_img_tk = tk.PhotoImage(width=100, height=100) # 画像ボタン用のフレーム
+        self.button_pool = [] # 作成済みの候補ボタン (プロンプト間で再利用)
+        self.button_images = [] # 各ボタンに現在設定している画像
+        self.button_names = [] # 現在表示している候補名
+        self.no_options_label = None # 候補がない場合のメッセージ
+        self.thumbnails = None # アイコンのサムネイルキャッシュ (thumbnails.ThumbnailCache)
+        self.icon_photos = {} # {名前: ((更新時刻, ファイルサイズ), PhotoImage)}
+        self.icon_realize_pending = False
+        self.thumbnail_save_job = None
+        self.shortcut_names = [] # 数字キーで選択できる候補名 (先頭から順に 1〜9)
+        self.all_names = [] # 「すべて表示」で表示する候補名
+        self.icon_dir_base = None
+        self.events = queue.Queue() # 処理スレッドから Tk スレッドへのイベント [(関数, 引数)]
+        self.progress_lock = threading.Lock()
+        self.pending_progress = None # まだ表示していない最新の進捗 (%)
+        self.last_progress_time = 0.0
 
         # --- GUIレイアウト ---
         # 上部フレーム: 分類対象の画像を表示するため
@@ -44,6 +80,10 @@ class ImageClassifierGUI:
         self.control_frame = tk.Frame(root)
         self.control_frame.pack(pady=(0, 10), padx=10, fill=tk.BOTH, expand=True)
 
+        # レビュー状況ラベル: まとめてレビューする場合の残り件数などを表示 (control_frame内)
+        self.status_label = tk.Label(self.control_frame, text="", anchor="w", fg="#555555")
+        self.status_label.pack(fill=tk.X)
+
         # 入力フレーム: テキスト入力と送信ボタンを含む (control_frame内)
         self.input_frame = tk.Frame(self.control_frame)
         self.input_frame.pack(pady=5, fill=tk.X) # 水平方向にフィル
@@ -60,8 +100,16 @@ class ImageClassifierGUI:
         # 送信ボタン
         self.submit_button = tk.Button(self.input_frame, text="決定", command=self.submit_input, width=10, font=("Arial", 10))
         self.submit_button.pack(side=tk.LEFT, padx=5)
+        # すべて表示ボタン: スコア上位の候補のみ表示している場合に、すべての選択肢を表示
+        self.show_all_button = tk.Button(self.input_frame, text="すべて表示", command=self.show_all_names,
+                                         width=10, font=("Arial", 10), state=tk.DISABLED)
+        self.show_all_button.pack(side=tk.LEFT, padx=5)
         # Enterキーを送信アクションにバインド
         self.entry.bind("<Return>", lambda event: self.submit_input())
+        # 数字キー (1〜9) で先頭の候補ボタンを選択
+        self.root.bind("<Key>", self.on_shortcut_key)
+        # ウィンドウを閉じたときに入力待ちの処理スレッドを解放
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
         # スクロール可能領域フレーム: CanvasとScrollbarを含む (control_frame内)
         self.scrollable_area_frame = tk.Frame(self.control_frame)
@@ -72,7 +120,8 @@ class ImageClassifierGUI:
         self.button_canvas = tk.Canvas(self.scrollable_area_frame, borderwidth=0, background="#ffffff")
         # 垂直スクロールバー: キャンバスにリンク
         self.scrollbar = tk.Scrollbar(self.scrollable_area_frame, orient="vertical", command=self.button_canvas.yview)
-        self.button_canvas.configure(yscrollcommand=self.scrollbar.set)
+        # スクロールのたびに表示された行のアイコンを設定
+        self.button_canvas.configure(yscrollcommand=self.on_canvas_scroll)
 
         # スクロールバーとキャンバスをscrollable_area_frame内にパック
         self.scrollbar.pack(side=tk.RIGHT, fill="y")
@@ -95,17 +144,26 @@ class ImageClassifierGUI:
         # button_frame自体にもバインド
         self.button_frame.bind("<MouseWheel>", self.on_mousewheel)
 
+        # 処理スレッドからのイベントの定期確認を開始
+        self.root.after(EVENT_POLL_MS, self.process_events)
 
     def on_canvas_configure(self, event):
         """キャンバス内のフレームの幅をキャンバスの幅に合わせて調整します。"""
         canvas_width = event.width
         # 保存されたウィンドウID (self.canvas_window) を使用してアイテムを設定
         self.button_canvas.itemconfig(self.canvas_window, width=canvas_width)
+        self.schedule_icon_realize()
 
 
     def on_frame_configure(self, event=None):
         """キャンバスのスクロール領域をボタンフレームに合わせて更新します。"""
         self.button_canvas.configure(scrollregion=self.button_canvas.bbox("all"))
+        self.schedule_icon_realize()
+
+    def on_canvas_scroll(self, first, last):
+        """キャンバスの表示範囲が変わったときにスクロールバーを更新し、アイコンの設定をスケジュールします。"""
+        self.scrollbar.set(first, last)
+        self.schedule_icon_realize()
 
     def on_mousewheel(self, event):
         """ボタンキャンバスのマウスホイールスクロールを処理します (Windows専用)。"""
@@ -115,10 +173,58 @@ class ImageClassifierGUI:
             self.button_canvas.yview_scroll(delta, "units")
 
 
+    def post(self, callback, *args):
+        """
+        Tk スレッドで実行する処理をキューに入れます (処理スレッドから呼び出し可能)。
+        キューに入れた順に process_events() で実行されます。
+
+        Args:
+            callback (callable): 実行する関数。
+            *args: 関数に渡す引数。
+        """
+        self.events.put((callback, args))
+
+    def post_progress(self, progress_percentage):
+        """
+        進捗を通知します (処理スレッドから呼び出し可能)。
+        表示の更新は PROGRESS_INTERVAL ごとに最新の値のみで行われます。
+        """
+        with self.progress_lock:
+            self.pending_progress = progress_percentage
+
+    def process_events(self):
+        """処理スレッドからのイベントと進捗を反映します (Tk スレッドで定期的に実行)。"""
+        try:
+            now = time.monotonic()
+            # 入力待ちの画像などを表示する前には、間隔に関係なく最新の進捗を反映
+            if now - self.last_progress_time >= PROGRESS_INTERVAL or not self.events.empty():
+                with self.progress_lock:
+                    progress, self.pending_progress = self.pending_progress, None
+                if progress is not None:
+                    self.update_progress(progress)
+                    self.last_progress_time = now
+            while True:
+                try:
+                    callback, args = self.events.get_nowait()
+                except queue.Empty:
+                    break
+                callback(*args)
+        finally:
+            self.root.after(EVENT_POLL_MS, self.process_events)
+
     def update_progress(self, progress_percentage):
         """ウィンドウタイトルを更新して現在の処理進捗を表示します。"""
         self.root.title(f"画像分類ツール - 進捗: {progress_percentage:.2f}%")
 
+    def set_review_status(self, text):
+        """
+        レビュー状況ラベルのテキストを更新します (処理スレッドから呼び出し可能)。
+
+        Args:
+            text (str): 表示するテキスト。空文字列でクリア。
+        """
+        self.post(lambda: self.status_label.configure(text=text))
+
     def display_image(self, img_pil):
         """
         PIL Imageオブジェクトをimage_labelに表示します。
@@ -159,155 +265,251 @@ class ImageClassifierGUI:
             self.image_label.configure(text=error_text, image=None) # 画像をクリア
             self.img_tk = None # 参照をクリア
 
-    def update_buttons(self, name_list, icon_dir_base):
+    def update_buttons(self, name_list, icon_dir_base, numbered=0):
         """
-        既存のボタンをクリアし、提供された名前リストに基づいて新しいボタンを作成します。
-        指定されたアイコンディレクトリから各ボタンのアイコンをロードしようとします。
+        提供された名前リストに基づいて候補ボタンを更新します。
+        ボタンはプロンプト間で再利用し (足りない分のみ作成、余った分は非表示)、
+        アイコンはスクロール領域に表示されている行のボタンにのみ設定します
+        (サムネイルはプロセス全体で共有されるキャッシュから取得)。
 
         Args:
             name_list (list[str]): ボタンの名前のリスト。
             icon_dir_base (str): アイコン画像のベースパス (script_dirからの相対パス、例: "選択肢/icon")。
+            numbered (int): 先頭から何個のボタンにショートカットキーの番号を表示するか。
         """
-        # button_frame内の現在のボタンをすべてクリア
-        for widget in self.button_frame.winfo_children():
-            widget.destroy()
+        # アイコンディレクトリへのフルパスを構築し、サムネイルキャッシュを取得
+        self.thumbnails = get_thumbnail_cache(os.path.join(self.script_dir, icon_dir_base), ICON_SIZE)
+        self.button_names = list(name_list)
 
-        # 名前リストが空の場合、メッセージを表示
+        # 名前リストが空の場合、すべてのボタンを隠してメッセージを表示
         if not name_list:
-            no_options_label = tk.Label(self.button_frame, text="候補なし（新規登録してください）", background="#ffffff")
-            no_options_label.pack(pady=20)
-            no_options_label.bind("<MouseWheel>", self.on_mousewheel)
+            for btn in self.button_pool:
+                btn.grid_remove()
+            if self.no_options_label is None:
+                self.no_options_label = tk.Label(self.button_frame, text="候補なし（新規登録してください）", background="#ffffff")
+                self.no_options_label.bind("<MouseWheel>", self.on_mousewheel)
+            self.no_options_label.grid(row=0, column=0, columnspan=BUTTON_COLUMNS, pady=20)
             # 空の場合でもスクロール領域を更新
             self.root.after(100, self.on_frame_configure)
             return
-
-        # アイコンディレクトリへのフルパスを構築
-        icon_dir = os.path.join(self.script_dir, icon_dir_base)
-
-        cols = 5 # 1行あたりのボタン数
-        button_widgets = [] # 作成されたボタンを追跡
+        if self.no_options_label is not None:
+            self.no_options_label.grid_remove()
 
         for i, name in enumerate(name_list):
-            # 各ボタンのコールバックで正しい 'name' をキャプチャするためにラムダでデフォルト引数を使用
-            def on_click_callback(n=name):
-                self.select_name(n)
-
-            # アイコン画像の期待されるパスを構築
-            image_path = os.path.join(icon_dir, f"{name}.png")
-
-            # ボタン設定引数
-            btn_args = {
-                "width": 100,      # 固定幅
-                "height": 100,     # 固定高さ
-                "command": on_click_callback,
-                "compound": tk.TOP, # デフォルト: 画像とテキスト両方あれば画像が上
-                "text": name,       # 常にテキストを初期設定
-                "font": ("Arial", 8) # ボタンテキスト用の小さいフォント
-            }
-            img_tk_ref = None # このボタンのImageTk参照を格納するため
-
-            try:
-                if os.path.exists(image_path):
-                    # アイコンが存在すればロード
-                    img = Image.open(image_path)
-                    # ボタンに合わせてアイコンをリサイズ (例: 80x80)
-                    img = img.resize((80, 80), Image.Resampling.LANCZOS)
-                    img_tk_ref = ImageTk.PhotoImage(img)
-                    btn_args["image"] = img_tk_ref
-                    btn_args["text"] = name # テキストを画像の下に保持
-                else:
-                    # アイコンがない場合、サイズ/レイアウト維持のためにプレースホルダー空画像を使用
-                    btn_args["image"] = self.empty_img_tk
-                    # 実際の画像がない場合はテキストを中央揃え
-                    btn_args["compound"] = tk.CENTER
-
-            except Exception as e:
-                # アイコンロード中のエラー処理 (例: 破損ファイル)
-                print(f"アイコン {image_path} のロードエラー: {e}")
-                # サイズ維持のためにプレースホルダーを使用してテキストのみのボタンにフォールバック
-                btn_args["image"] = self.empty_img_tk
-                btn_args["compound"] = tk.CENTER
-
-            # ボタンを作成
-            btn = tk.Button(self.button_frame, **btn_args)
-            # ガベージコレクションを防ぐためにImageTk参照をボタンオブジェクト自体に格納
-            if img_tk_ref:
-                 btn.image = img_tk_ref
-
-            # 各ボタンに個別にマウスホイールをバインド
-            btn.bind("<MouseWheel>", self.on_mousewheel)
+            if i < len(self.button_pool):
+                btn = self.button_pool[i]
+            else:
+                # 足りない分のボタンを作成 (以降のプロンプトで再利用)
+                btn = tk.Button(self.button_frame, width=100, height=100, image=self.empty_img_tk,
+                                compound=tk.CENTER, font=("Arial", 8)) # ボタンテキスト用の小さいフォント
+                # 各ボタンに個別にマウスホイールをバインド
+                btn.bind("<MouseWheel>", self.on_mousewheel)
+                self.button_pool.append(btn)
+                self.button_images.append(self.empty_img_tk)
 
+            # 各ボタンのコールバックで正しい 'name' をキャプチャするためにラムダでデフォルト引数を使用
+            text = f"{i + 1}. {name}" if i < numbered else name
+            btn.configure(text=text, command=lambda n=name: self.select_name(n))
+            if self.button_images[i] is not self.empty_img_tk:
+                # アイコンは表示されたときに設定するため、前回のアイコンはプレースホルダーに戻す
+                btn.configure(image=self.empty_img_tk, compound=tk.CENTER)
+                self.button_images[i] = self.empty_img_tk
             # グリッドレイアウトにボタンを配置
-            row = i // cols
-            col = i % cols
-            btn.grid(row=row, column=col, padx=5, pady=5, sticky="nsew")
-            button_widgets.append(btn)
+            btn.grid(row=i // BUTTON_COLUMNS, column=i % BUTTON_COLUMNS, padx=5, pady=5, sticky="nsew")
+
+        # 余ったボタンは破棄せずに隠す
+        for btn in self.button_pool[len(name_list):]:
+            btn.grid_remove()
 
         # button_frame内の列が均等に伸縮するように設定
-        if button_widgets: # ボタンが追加された場合のみ設定
-            # ボタンが配置された最大の列番号+1を計算
-            num_cols = max(b.grid_info()['column'] for b in button_widgets) + 1
-            for c in range(num_cols):
-                # weight=1で伸縮可能に、uniformで均等に
-                self.button_frame.grid_columnconfigure(c, weight=1, uniform="button_col")
+        for c in range(min(len(name_list), BUTTON_COLUMNS)):
+            # weight=1で伸縮可能に、uniformで均等に
+            self.button_frame.grid_columnconfigure(c, weight=1, uniform="button_col")
 
+        # 新しい候補は先頭から表示
+        self.button_canvas.yview_moveto(0)
+        self.schedule_icon_realize()
         # レイアウトが更新された後にスクロール領域を更新する呼び出しをスケジュール
         self.root.after(100, self.on_frame_configure)
 
+    def schedule_icon_realize(self):
+        """表示中の行へのアイコン設定を、アイドル時に1回だけ実行するようにスケジュールします。"""
+        if not self.icon_realize_pending:
+            self.icon_realize_pending = True
+            self.root.after_idle(self.realize_visible_icons)
+
+    def realize_visible_icons(self):
+        """スクロール領域に表示されている行 (と前後1行) のボタンにアイコンを設定します。"""
+        self.icon_realize_pending = False
+        if not self.button_names or self.thumbnails is None:
+            return
+
+        n_rows = -(-len(self.button_names) // BUTTON_COLUMNS)
+        top, bottom = self.button_canvas.yview()
+        first_row = max(0, int(top * n_rows) - 1)
+        last_row = min(n_rows, math.ceil(bottom * n_rows) + 1)
+
+        for i in range(first_row * BUTTON_COLUMNS, min(last_row * BUTTON_COLUMNS, len(self.button_names))):
+            name = self.button_names[i]
+            img_tk = self.get_icon_photo(name)
+            if img_tk is self.button_images[i]:
+                continue
+            if img_tk is None:
+                # アイコンがない場合、サイズ/レイアウト維持のためにプレースホルダー空画像を使用し、テキストを中央揃え
+                self.button_pool[i].configure(image=self.empty_img_tk, compound=tk.CENTER)
+                self.button_images[i] = self.empty_img_tk
+            else:
+                # テキストを画像の下に保持
+                self.button_pool[i].configure(image=img_tk, compound=tk.TOP)
+                self.button_images[i] = img_tk
+
+        # 新しく縮小したサムネイルはしばらく後にまとめてスプライトシートに保存
+        if self.thumbnails.dirty:
+            if self.thumbnail_save_job is not None:
+                self.root.after_cancel(self.thumbnail_save_job)
+            self.thumbnail_save_job = self.root.after(THUMBNAIL_SAVE_DELAY_MS, self.save_thumbnails)
+
+    def get_icon_photo(self, name):
+        """
+        アイコンの PhotoImage を返します。アイコンファイルが変更されていない限り、
+        以前に作成した PhotoImage を再利用します。
+
+        Returns:
+            ImageTk.PhotoImage | None: アイコンがない場合は None。
+        """
+        # アイコンフォルダの一覧 (キャッシュ) にない名前はファイルを確認しない
+        if self.choices.icon_path(name) is None:
+            return None
+        thumb = self.thumbnails.get(name)
+        if thumb is None:
+            return None
+        stamp, img = thumb
+        cached = self.icon_photos.get(name)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, ImageTk.PhotoImage(img))
+            self.icon_photos[name] = cached
+        return cached[1]
+
+    def save_thumbnails(self):
+        """サムネイルのスプライトシートをバックグラウンドで保存します。"""
+        self.thumbnail_save_job = None
+        if self.thumbnails is not None and self.thumbnails.dirty:
+            threading.Thread(target=self.thumbnails.save, daemon=True).start()
+
     def select_name(self, name):
         """
         候補ボタンがクリックされたときに呼び出されます。選択された名前を格納し、
         入力が受信されたことを示すフラグを設定します。
         """
+        if not self.prompt_active:
+            return # 入力待ちでないときのクリックは無視
         print(f"ボタンクリック: {name}")
         self.user_input = name
-        self.input_received.set(True) # 入力が準備完了したことを通知
+        self.finish_prompt()
 
     def submit_input(self):
         """
         '決定' ボタンがクリックされたとき、または入力フィールドでEnterが押されたときに呼び出されます。
         入力されたテキストを格納し、フラグを設定します。
         """
+        if not self.prompt_active:
+            return # 入力待ちでないときの送信は無視
         value = self.entry.get().strip() # 入力からテキストを取得し、空白を削除
         if value:
             print(f"テキスト入力送信: {value}")
             self.user_input = value
-            self.input_received.set(True) # 入力が準備完了したことを通知
+            self.finish_prompt()
         else:
             messagebox.showwarning("入力エラー", "名前を入力してください。")
 
-    def get_input_for_image(self, img_to_show, name_list, icon_dir_base):
+    def on_shortcut_key(self, event):
+        """数字キーが押されたときに、対応する番号の候補を選択します (入力フィールドの編集中は無視)。"""
+        if self.root.focus_get() is self.entry or not event.char or event.char not in SHORTCUT_KEYS:
+            return
+        index = SHORTCUT_KEYS.index(event.char)
+        if index < len(self.shortcut_names):
+            self.select_name(self.shortcut_names[index])
+
+    def show_all_names(self):
+        """スコア上位の候補に続けて、残りのすべての選択肢をボタンとして表示します。"""
+        self.show_all_button.configure(state=tk.DISABLED)
+        self.update_buttons(self.all_names, self.icon_dir_base, numbered=len(self.shortcut_names))
+
+    def get_input_for_image(self, img_to_show, name_list, icon_dir_base, ranked_names=None):
         """
         画像を表示し、候補ボタンを更新し、ユーザーがボタンをクリックするか、
         テキストを入力して '決定' をクリックするのを待ちます。
 
-        このメソッドは入力が受信されるまで実行をブロックします (wait_variableを使用)。
+        このメソッドは処理スレッドから呼び出し、入力が受信されるまで実行をブロックします。
+        画面の更新は Tk スレッドで行われます (show_prompt)。
 
         Args:
             img_to_show (PIL.Image.Image): 分類のために表示する画像。
             name_list (list[str]): ボタンの候補名のリスト。
             icon_dir_base (str): ボタンアイコンのベースパス。
+            ranked_names (list[str] | None): スコアの高い順の候補名。指定された場合はこれらのボタンのみを表示し、
+                                             残りの選択肢は「すべて表示」で表示します。
 
         Returns:
             str | None: ユーザーが選択または入力した名前。入力ループが予期せず中断された場合はNone。
         """
-        # 新しい入力リクエストのために状態をリセット
-        self.user_input = None
-        self.entry.delete(0, tk.END) # テキスト入力フィールドをクリア
-        self.input_received.set(False) # 入力受信フラグをリセット
-
-        # GUI更新をメインTkinterスレッドで実行するようにスケジュール ('after(0, ...)'を使用)
-        self.root.after(0, self.display_image, img_to_show)
-        self.root.after(0, self.update_buttons, name_list, icon_dir_base)
+        # 新しい入力リクエストのために入力受信フラグをリセットし、表示を Tk スレッドに依頼
+        self.input_received.clear()
+        if self.closed:
+            return None
+        self.post(self.show_prompt, img_to_show, list(name_list), icon_dir_base, list(ranked_names or []))
 
-        # input_receivedフラグ (BooleanVar) がTrueに設定されるまで待機
+        # 入力を受信するまで待機
         print("GUIでユーザー入力を待機中...")
-        # 必要に応じてウィンドウを一時的にモーダルにする
-        self.root.grab_set()
-        self.root.wait_variable(self.input_received)
-        # モーダル状態を解除
-        self.root.grab_release()
+        self.input_received.wait()
         print(f"入力受信: {self.user_input}")
 
         # 格納されたユーザー入力を返す
-        return self.user_input
\ No newline at end of file
+        return self.user_input
+
+    def show_prompt(self, img_to_show, name_list, icon_dir_base, ranked_names):
+        """
+        入力待ちの画像と候補ボタンを表示します (Tk スレッドで実行)。
+        表示に失敗した場合は入力なし (None) として処理スレッドに通知します。
+        """
+        # 新しい入力リクエストのために状態をリセット
+        self.user_input = None
+        try:
+            self.entry.delete(0, tk.END) # テキスト入力フィールドをクリア
+
+            # スコア上位の候補を先頭に、残りの選択肢を続ける
+            self.all_names = ranked_names + [name for name in name_list if name not in ranked_names]
+            shown_names = ranked_names or self.all_names
+            self.icon_dir_base = icon_dir_base
+            self.shortcut_names = shown_names[:len(SHORTCUT_KEYS)]
+
+            self.display_image(img_to_show)
+            self.update_buttons(shown_names, icon_dir_base, len(self.shortcut_names))
+            self.show_all_button.configure(
+                state=tk.NORMAL if len(self.all_names) > len(shown_names) else tk.DISABLED)
+
+            # 入力を受け付け、ウィンドウを一時的にモーダルにする
+            self.prompt_active = True
+            self.root.grab_set()
+        except Exception as e:
+            print(f"入力画面の表示エラー: {e}。この画像の入力をスキップします。")
+            self.prompt_active = False
+            self.shortcut_names = []
+            self.user_input = None
+            self.input_received.set()
+
+    def finish_prompt(self):
+        """入力の受付を終了し、待機している処理スレッドに通知します (Tk スレッドで実行)。"""
+        self.prompt_active = False
+        self.shortcut_names = []
+        # モーダル状態を解除
+        self.root.grab_release()
+        self.input_received.set() # 入力が準備完了したことを通知
+
+    def on_close(self):
+        """ウィンドウが閉じられたときに、入力待ちの処理スレッドを解放して終了します。"""
+        self.closed = True
+        self.prompt_active = False
+        self.user_input = None
+        self.input_received.set()
+        self.root.quit()
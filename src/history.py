@@ -0,0 +1,106 @@
+import os
+import re
+import threading
+
+from .file_lock import FileLock
+
+# --- 設定 ---
+SEQUENCE_FILE = ".sequence" # 最後に割り当てた連番を保存するファイル (履歴フォルダ内)
+LOCK_FILE = ".sequence.lock"
+HISTORY_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+SHARD_PATTERN = re.compile(r"^\d{4}-\d{2}$") # 月ごとのサブフォルダ名 (例: 2025-01)
+
+# --- 履歴フォルダの連番 ---
+
+class HistorySequence:
+    """
+    「履歴」フォルダに移動する画像の連番 (00001.png, 00002.png, ...) を割り当てます。
+
+    最後に割り当てた番号を履歴フォルダ内の .sequence に保存し、ロックファイルで排他制御するため、
+    フォルダ内のファイル数に関係なく一定のコストで次の番号が決まります
+    (main.py と src.cli watch を同時に実行しても同じ番号は割り当てられません)。
+    .sequence がない場合 (初回など) のみ、フォルダ内の最大の番号を調べて初期化します。
+
+    .sequence は一時ファイルに書き込んでから置き換えるため、途中で強制終了しても壊れません。
+    保存した番号が実際のファイルより古い場合も、既存のファイルを上書きしないよう次の番号に進みます。
+    """
+    def __init__(self, history_dir):
+        """
+        Args:
+            history_dir (str): 履歴フォルダのパス。
+        """
+        self.history_dir = history_dir
+        self._lock = threading.Lock()
+
+    def _scan(self):
+        """履歴フォルダ (月ごとのサブフォルダを含む) 内の最大の連番を返します。"""
+        last = 0
+        dirs = [self.history_dir]
+        with os.scandir(self.history_dir) as it:
+            for entry in it:
+                if entry.is_dir() and SHARD_PATTERN.match(entry.name):
+                    dirs.append(entry.path)
+        for folder in dirs:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    stem, ext = os.path.splitext(entry.name)
+                    if ext.lower() in HISTORY_EXTENSIONS and stem.isdigit():
+                        last = max(last, int(stem))
+        return last
+
+    def _read(self):
+        """保存された最後の番号を返します。ファイルがない・壊れている場合は None。"""
+        try:
+            with open(os.path.join(self.history_dir, SEQUENCE_FILE), 'r', encoding='utf-8') as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, number):
+        """最後に割り当てた番号を保存します (一時ファイルに書き込んでから置き換え)。"""
+        path = os.path.join(self.history_dir, SEQUENCE_FILE)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            f.write(str(number))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def allocate(self, shard=None, ext=".png"):
+        """
+        次の連番のファイル名を割り当てます。
+
+        Args:
+            shard (str | None): 保存先のサブフォルダ名 (例: "2025-01")。None の場合は履歴フォルダ直下。
+            ext (str): 拡張子。
+
+        Returns:
+            tuple[str, str]: (履歴フォルダからの相対パス (例: "00001.png", "2025-01/00001.png"), フルパス)。
+        """
+        folder = os.path.join(self.history_dir, shard) if shard else self.history_dir
+        os.makedirs(folder, exist_ok=True)
+        with self._lock, FileLock(os.path.join(self.history_dir, LOCK_FILE)):
+            number = self._read()
+            if number is None:
+                number = self._scan()
+                print(f"履歴フォルダの連番を初期化しました: {number}")
+            while True:
+                number += 1
+                filename = str(number).zfill(5) + ext
+                path = os.path.join(folder, filename)
+                if not os.path.exists(path):
+                    break
+            self._write(number)
+        return (f"{shard}/{filename}" if shard else filename), path
+
+
+_sequences = {} # {履歴フォルダ: HistorySequence}
+_sequences_lock = threading.Lock()
+
+
+def get_history_sequence(history_dir):
+    """履歴フォルダごとに共有される HistorySequence を返します。"""
+    key = os.path.abspath(history_dir)
+    with _sequences_lock:
+        if key not in _sequences:
+            _sequences[key] = HistorySequence(history_dir)
+        return _sequences[key]
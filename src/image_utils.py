@@ -2,10 +2,130 @@ import os
 import cv2
 import numpy
 import shutil
+import hashlib
+import datetime
+import tempfile
+import threading
 from PIL import Image
 
+from .history import get_history_sequence
+
+# --- 設定 ---
+HISTORY_SHARD_BY_MONTH = False # True の場合、元画像を「履歴/<yyyy-mm>/」に月ごとに分けて移動
+
 # --- 画像処理関数 ---
 
+def fx_to_gray(img_pil):
+    """
+    PIL画像をテンプレートマッチング用のグレースケール配列に変換します。
+    fx_templatematch 内部と同じ RGB -> BGR -> GRAY の変換結果になります。
+
+    Args:
+        img_pil (PIL.Image.Image): 変換する画像。
+
+    Returns:
+        numpy.ndarray: グレースケール画像 (uint8, 形状 (高さ, 幅))。
+    """
+    img_cv = cv2.cvtColor(numpy.array(img_pil.convert("RGB")), cv2.COLOR_RGB2BGR)
+    return cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
+
+
+def fx_load_screenshot(input_path):
+    """
+    スクリーンショットを開き、画像全体のグレースケール配列を1回だけ作成します。
+    各ポジションはこの配列のスライス (コピーなし) として切り出します。
+
+    JPEG は輝度成分のみをデコードするため (draft)、色差成分の復元と色変換を省略できます。
+    その他の形式は RGB(A) 配列から fx_to_gray と同じ変換でグレースケール化します。
+
+    Args:
+        input_path (str): スクリーンショットのパス。
+
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray | None]: (グレースケール配列, RGB(A) 配列)。
+            JPEG の場合、RGB 配列は None です (カラーのトリミング画像が必要になった時点で fx_load_color で作成)。
+    """
+    with Image.open(input_path) as img:
+        if img.format == "JPEG":
+            # 輝度のみをデコード (縮小は行わない: 参照画像と同じ解像度で比較するため)
+            img.draft("L", img.size)
+            return numpy.asarray(img.convert("L")), None
+        if img.mode in ("RGB", "RGBA"):
+            color = numpy.asarray(img)
+        else:
+            color = numpy.asarray(img.convert("RGB"))
+    # RGB -> GRAY は fx_to_gray の RGB -> BGR -> GRAY と同じ結果 (アルファ値は無視)
+    code = cv2.COLOR_RGBA2GRAY if color.shape[2] == 4 else cv2.COLOR_RGB2GRAY
+    return cv2.cvtColor(color, code), color
+
+
+def fx_load_color(input_path):
+    """
+    スクリーンショットをカラーでデコードし、RGB 配列を返します
+    (fx_load_screenshot がカラー配列を返さなかった JPEG 用。1枚につき1回だけ呼び出します)。
+
+    Args:
+        input_path (str): スクリーンショットのパス。
+
+    Returns:
+        numpy.ndarray: RGB 配列。
+    """
+    with Image.open(input_path) as img:
+        return numpy.asarray(img.convert("RGB"))
+
+
+def fx_color_crop(color, box):
+    """
+    ユーザー入力や参照画像の保存に使用するカラーのトリミング画像を作成します。
+
+    Args:
+        color (numpy.ndarray): fx_load_screenshot または fx_load_color が返した RGB(A) 配列。
+        box (tuple[int, int, int, int]): (左, 上, 右, 下) のピクセル座標。
+
+    Returns:
+        PIL.Image.Image: RGB のトリミング画像。
+    """
+    l, t, r, b = box
+    return Image.fromarray(color[t:b, l:r]).convert("RGB")
+
+
+def fx_resize_gray(gray, shape):
+    """
+    グレースケール画像を指定した形状にリサンプリングします。
+    縮小時は面積平均 (INTER_AREA)、拡大時は双線形補間 (INTER_LINEAR) を使用します。
+
+    Args:
+        gray (numpy.ndarray): グレースケール画像。
+        shape (tuple[int, int]): リサンプリング後の形状 (高さ, 幅)。
+
+    Returns:
+        numpy.ndarray: リサンプリングした画像。既に同じ形状の場合は入力をそのまま返します。
+    """
+    if gray.shape == tuple(shape):
+        return gray
+    h, w = shape
+    shrink = h * w < gray.shape[0] * gray.shape[1]
+    return cv2.resize(gray, (w, h), interpolation=cv2.INTER_AREA if shrink else cv2.INTER_LINEAR)
+
+
+def fx_resize_image(img_pil, shape):
+    """
+    PIL画像を指定した形状にリサンプリングします (参照画像をカテゴリの基準サイズで保存するため)。
+
+    Args:
+        img_pil (PIL.Image.Image): 画像。
+        shape (tuple[int, int]): リサンプリング後の形状 (高さ, 幅)。
+
+    Returns:
+        PIL.Image.Image: リサンプリングした画像。既に同じ形状の場合は入力をそのまま返します。
+    """
+    h, w = shape
+    if img_pil.size == (w, h):
+        return img_pil
+    shrink = h * w < img_pil.size[0] * img_pil.size[1]
+    return img_pil.resize((w, h), Image.BOX if shrink else Image.BILINEAR)
+
+
 def fx_templatematch(img1_pil, img2_pil):
     """
     テンプレートマッチングを使用して2つの画像の類似度を計算します。
@@ -19,14 +139,28 @@ def fx_templatematch(img1_pil, img2_pil):
         float: 類似度スコア。-1.0 から 1.0 の範囲。エラー時は -1.0 を返す。
     """
     try:
-        # PIL画像をOpenCV形式 (BGR) に変換
-        img1_cv = cv2.cvtColor(numpy.array(img1_pil), cv2.COLOR_RGB2BGR)
-        img2_cv = cv2.cvtColor(numpy.array(img2_pil), cv2.COLOR_RGB2BGR)
+        # PIL画像をグレースケールに変換
+        img1_gray = fx_to_gray(img1_pil)
+        img2_gray = fx_to_gray(img2_pil)
+    except Exception as e:
+        print(f"テンプレートマッチング中の予期せぬエラー: {e}")
+        return -1.0
+    return fx_templatematch_gray(img1_gray, img2_gray)
 
-        # グレースケールに変換
-        img1_gray = cv2.cvtColor(img1_cv, cv2.COLOR_BGR2GRAY)
-        img2_gray = cv2.cvtColor(img2_cv, cv2.COLOR_BGR2GRAY)
 
+def fx_templatematch_gray(img1_gray, img2_gray):
+    """
+    グレースケール配列同士で fx_templatematch と同じ類似度を計算します。
+    事前にグレースケール化した参照画像と比較する場合に使用します。
+
+    Args:
+        img1_gray (numpy.ndarray): 第一画像 (グレースケール)。
+        img2_gray (numpy.ndarray): 第二画像 (グレースケール)。
+
+    Returns:
+        float: 類似度スコア。-1.0 から 1.0 の範囲。エラー時は -1.0 を返す。
+    """
+    try:
         # 寸法を取得
         h1, w1 = img1_gray.shape
         h2, w2 = img2_gray.shape
@@ -58,7 +192,7 @@ def fx_templatematch(img1_pil, img2_pil):
 
     except cv2.error as e:
         print(f"テンプレートマッチング中のOpenCVエラー: {e}")
-        print(f"画像1の形状: {img1_pil.size}, 画像2の形状: {img2_pil.size}")
+        print(f"画像1の形状: {img1_gray.shape}, 画像2の形状: {img2_gray.shape}")
         # エラーの場合は低い類似度スコアを返す
         return -1.0
     except Exception as e:
@@ -66,6 +200,161 @@ def fx_templatematch(img1_pil, img2_pil):
         return -1.0
 
 
+def fx_downscale_gray(gray, scale):
+    """
+    グレースケール画像を 1/scale に縮小します (ピラミッドマッチングの粗い段階用)。
+
+    Args:
+        gray (numpy.ndarray): グレースケール画像。
+        scale (int): 縮小率の逆数 (例: 4 で 1/4)。
+
+    Returns:
+        numpy.ndarray: 面積平均で縮小した画像 (各辺は切り捨て、最小1ピクセル)。
+    """
+    h, w = gray.shape
+    return cv2.resize(gray, (max(w // scale, 1), max(h // scale, 1)), interpolation=cv2.INTER_AREA)
+
+
+def fx_pyramid_locate(img1_gray, img2_gray, coarse1, coarse2):
+    """
+    サイズの異なる2画像について、縮小画像同士でスライディングウィンドウの比較を行い、
+    大まかなスコアと位置を求めます (ピラミッドマッチングの粗い段階)。
+    大きい画像・小さい画像の判定は fx_templatematch_gray と同じく元の解像度の面積で行います。
+
+    Args:
+        img1_gray (numpy.ndarray): 第一画像 (元の解像度)。
+        img2_gray (numpy.ndarray): 第二画像 (元の解像度)。
+        coarse1 (numpy.ndarray): 第一画像を fx_downscale_gray で縮小した画像。
+        coarse2 (numpy.ndarray): 第二画像を fx_downscale_gray で縮小した画像。
+
+    Returns:
+        tuple[float, tuple[int, int] | None]: (縮小画像でのスコア, 大きい画像内の最大位置 (x, y))。
+                                              比較できない場合は (-1.0, None)。
+    """
+    large, small = (coarse1, coarse2) if img1_gray.size >= img2_gray.size else (coarse2, coarse1)
+    if small.shape[0] > large.shape[0] or small.shape[1] > large.shape[1]:
+        return -1.0, None
+    result = cv2.matchTemplate(large, small, cv2.TM_CCOEFF_NORMED)
+    _, max_val, _, max_loc = cv2.minMaxLoc(result)
+    return float(max_val), max_loc
+
+
+def fx_pyramid_refine(img1_gray, img2_gray, coarse_loc, scale):
+    """
+    fx_pyramid_locate で求めた位置の周辺のみ、元の解像度でスライディングウィンドウの比較を行います。
+    スコアは fx_templatematch_gray と同じ TM_CCOEFF_NORMED で、最大位置が探索範囲内にあれば同じ値になります。
+
+    Args:
+        img1_gray (numpy.ndarray): 第一画像 (元の解像度)。
+        img2_gray (numpy.ndarray): 第二画像 (元の解像度)。
+        coarse_loc (tuple[int, int]): 縮小画像での最大位置 (x, y)。
+        scale (int): 縮小率の逆数。
+
+    Returns:
+        float: 類似度スコア。-1.0 から 1.0 の範囲。
+    """
+    large, small = (img1_gray, img2_gray) if img1_gray.size >= img2_gray.size else (img2_gray, img1_gray)
+    margin = 2 * scale # 縮小による位置の誤差を吸収する余白
+    x, y = coarse_loc
+    x0, y0 = max(x * scale - margin, 0), max(y * scale - margin, 0)
+    x1 = min(x * scale + margin + small.shape[1], large.shape[1])
+    y1 = min(y * scale + margin + small.shape[0], large.shape[0])
+    window = large[y0:y1, x0:x1]
+    if window.shape[0] < small.shape[0] or window.shape[1] < small.shape[1]:
+        # 探索範囲を作れない場合は全体を比較
+        return fx_templatematch_gray(img1_gray, img2_gray)
+    try:
+        return float(cv2.matchTemplate(window, small, cv2.TM_CCOEFF_NORMED).max())
+    except cv2.error as e:
+        print(f"テンプレートマッチング中のOpenCVエラー: {e}")
+        return -1.0
+
+
+def fx_ncc_stack(grays):
+    """
+    同じサイズのグレースケール画像群を、一括類似度計算用の行列にまとめます。
+    各行は平均を引いてノルム1に正規化した画素ベクトルに、補助列を1つ加えたものです。
+
+    Args:
+        grays (list[numpy.ndarray]): 同じ形状のグレースケール画像のリスト。
+
+    Returns:
+        numpy.ndarray: 形状 (画像数, 高さ*幅 + 1) の float32 行列。
+    """
+    stack = numpy.zeros((len(grays), grays[0].size + 1), dtype=numpy.float32)
+    body = stack[:, :-1]
+    body[:] = numpy.stack([g.reshape(-1) for g in grays])
+    body -= body.mean(axis=1, keepdims=True)
+    norms = numpy.linalg.norm(body, axis=1, keepdims=True)
+    flat = norms[:, 0] == 0
+    norms[flat] = 1.0
+    body /= norms
+    # 輝度が一定の参照画像は、OpenCV の TM_CCOEFF_NORMED と同様に常にスコア1になるようにする
+    stack[flat, -1] = 1.0
+    return stack
+
+
+def fx_batch_templatematch(crop_gray, template_stack):
+    """
+    1枚のトリミング画像と、同じサイズの参照画像群との類似度を一括で計算します。
+    結果は同サイズ時の fx_templatematch (TM_CCOEFF_NORMED) と同じ値になります。
+
+    Args:
+        crop_gray (numpy.ndarray): トリミング画像のグレースケール配列。
+        template_stack (numpy.ndarray): fx_ncc_stack で作成した参照画像の行列。
+
+    Returns:
+        tuple[int, numpy.ndarray]: (最もスコアの高い参照画像のインデックス, 全参照画像のスコア)。
+    """
+    vec = numpy.empty(crop_gray.size + 1, dtype=numpy.float32)
+    body = vec[:-1]
+    body[:] = crop_gray.reshape(-1)
+    body -= body.mean()
+    norm = numpy.linalg.norm(body)
+    if norm > 0:
+        body /= norm
+    # 補助列 (輝度が一定の参照画像用)
+    vec[-1] = 1.0
+    scores = template_stack @ vec
+    return int(numpy.argmax(scores)), scores
+
+
+def fx_signature(gray, size=(16, 16)):
+    """
+    画像を小さく縮小した知覚的シグネチャを作成します。
+    参照画像の候補を絞り込むための粗い比較に使用します (内積が縮小画像同士の相関になります)。
+
+    Args:
+        gray (numpy.ndarray): グレースケール画像。
+        size (tuple[int, int]): 縮小後のサイズ (幅, 高さ)。
+
+    Returns:
+        numpy.ndarray: 平均を引いてノルム1に正規化した float32 ベクトル (幅*高さ 要素)。
+    """
+    small = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+    vec = small.reshape(-1).astype(numpy.float32)
+    vec -= vec.mean()
+    norm = numpy.linalg.norm(vec)
+    if norm > 0:
+        vec /= norm
+    return vec
+
+
+def fx_crop_hash(gray):
+    """
+    グレースケール画像の画素から、完全一致の判定用のハッシュを計算します。
+
+    Args:
+        gray (numpy.ndarray): グレースケール画像。
+
+    Returns:
+        str: 形状と画素バイト列の SHA-1 (16進文字列)。
+    """
+    digest = hashlib.sha1(f"{gray.shape[0]}x{gray.shape[1]}:".encode())
+    digest.update(numpy.ascontiguousarray(gray).tobytes())
+    return digest.hexdigest()
+
+
 def fx_trim(name):
     """
     ファイル名から拡張子と末尾の '_<数字>' を削除します。
@@ -102,43 +391,50 @@ def fx_append_txt(result_file_prefix, text, script_dir):
         print(f"ファイル {file_path} への追記エラー: {e}")
 
 
-def fx_move_and_rename(img_path, output_dir_base):
+def fx_history_target(output_dir_base, shard_by_month=None):
+    """
+    「履歴」フォルダ内の次の連番のファイル名を割り当てます (ファイルの移動は行いません)。
+
+    Args:
+        output_dir_base (str): '履歴' フォルダが存在するべきベースディレクトリ。
+        shard_by_month (bool | None): True の場合は「履歴/<yyyy-mm>/」に割り当てます。
+                                      None の場合は HISTORY_SHARD_BY_MONTH の設定に従います。
+
+    Returns:
+        tuple[str, str]: (履歴フォルダからの相対パス (例: "00001.png"), フルパス)。
+    """
+    output_dir = os.path.join(output_dir_base, "履歴")
+    if shard_by_month is None:
+        shard_by_month = HISTORY_SHARD_BY_MONTH
+    # 履歴ディレクトリが存在しない場合は作成
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+        print(f"ディレクトリを作成しました: {output_dir}")
+    # 次のシーケンス番号を割り当て (番号を先行ゼロでフォーマット (例: 00001) し、.png 拡張子を追加)
+    shard = datetime.date.today().strftime("%Y-%m") if shard_by_month else None
+    return get_history_sequence(output_dir).allocate(shard)
+
+
+def fx_move_and_rename(img_path, output_dir_base, shard_by_month=None, target=None):
     """
     リザルトの元画像を「履歴」フォルダに移動。
     連番でリネームします (例: 00001.png, 00002.png, ...)。
+    連番は HistorySequence が割り当てるため、履歴フォルダ内のファイル数に関係なく一定の時間で移動できます。
 
     Args:
         img_path (str): 移動する画像ファイルのフルパス。
         output_dir_base (str): '履歴' フォルダが存在するべきベースディレクトリ。
+        shard_by_month (bool | None): True の場合は「履歴/<yyyy-mm>/」に移動します。
+                                      None の場合は HISTORY_SHARD_BY_MONTH の設定に従います。
+        target (tuple[str, str] | None): fx_history_target で割り当て済みの移動先。
 
     Returns:
-        str | None: 成功した場合は新しいファイル名 (例: "00001.png")、それ以外は None。
+        str | None: 成功した場合は履歴フォルダからの相対パス (例: "00001.png", "2025-01/00001.png")、
+                    それ以外は None。
     """
     output_dir = os.path.join(output_dir_base, "履歴")
     try:
-        # 履歴ディレクトリが存在しない場合は作成
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-            print(f"ディレクトリを作成しました: {output_dir}")
-
-        # 既存のファイルをチェックして次のシーケンス番号を決定
-        existing_files = [f for f in os.listdir(output_dir)
-                          if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp'))]
-        num = len(existing_files) + 1
-        # 番号を先行ゼロでフォーマット (例: 00001) し、.png 拡張子を追加
-        base_name = str(num).zfill(5)
-        output_filename = base_name + ".png"
-        output_path = os.path.join(output_dir, output_filename)
-
-        # ターゲットファイル名が何らかの理由で既に存在しないことを確認
-        while os.path.exists(output_path):
-             num += 1
-             base_name = str(num).zfill(5)
-             output_filename = base_name + ".png"
-             output_path = os.path.join(output_dir, output_filename)
-             if num > len(existing_files) + 1000: # 安全停止
-                 print(f"エラー: 履歴フォルダ内で {img_path} の一意な名前が見つかりませんでした")
-                 return None
+        output_filename, output_path = target or fx_history_target(output_dir_base, shard_by_month)
 
         # ファイルを移動
         shutil.move(img_path, output_path)
@@ -153,11 +449,44 @@ def fx_move_and_rename(img_path, output_dir_base):
         return None
 
 
+_suffix_index = {} # {保存フォルダ: {ベース名: 使用済みの最大の連番}} (fx_save_trim_img が使用)
+_suffix_index_lock = threading.Lock()
+
+
+def _suffix_index_for(save_folder_path):
+    """
+    保存フォルダ内の画像について、ベース名ごとの使用済みの最大の連番を返します。
+    フォルダの一覧は最初の1回だけ取得し、以降は fx_save_trim_img が保存のたびに更新します。
+    (呼び出し側で _suffix_index_lock を取得していること)
+    """
+    key = os.path.abspath(save_folder_path)
+    index = _suffix_index.get(key)
+    if index is None:
+        index = {}
+        with os.scandir(save_folder_path) as it:
+            for entry in it:
+                stem, ext = os.path.splitext(entry.name)
+                if ext.lower() != '.png':
+                    continue
+                base, sep, suffix = stem.rpartition('_')
+                if sep and suffix.isdigit():
+                    index[base] = max(index.get(base, 0), int(suffix))
+                else:
+                    index.setdefault(stem, 0)
+        _suffix_index[key] = index
+    return index
+
+
 def fx_save_trim_img(img_pil, save_folder_path, name, num=0):
     """
     トリミングされた画像を特定のフォルダに保存します。
     ファイル名の衝突の可能性を '_<数字>' を追記することで処理します。
 
+    希望するファイル名が使用済みの場合は、フォルダごとのインデックスに記録した最大の連番の次を使用するため、
+    既存の画像の数に関係なく一定の回数でファイル名が決まります。画像は同じフォルダの一時ファイル
+    (.<名前>_*.tmp) に書き込んでから、使用されていないファイル名にハードリンクする (既存の場合は失敗する) ため、
+    他のスレッド・プロセスが同時に保存しても上書きされず、書き込み途中の画像が読み込まれることもありません。
+
     Args:
         img_pil (PIL.Image.Image): 保存するPIL画像オブジェクト。
         save_folder_path (str): 画像を保存するディレクトリパス。
@@ -176,11 +505,6 @@ def fx_save_trim_img(img_pil, save_folder_path, name, num=0):
     if img_pil.mode != 'RGB':
         img_pil = img_pil.convert('RGB')
 
-    img_name_base = name
-    # 初期のファイル名構築
-    img_name = f"{img_name_base}_{num}.png" if num > 0 else f"{img_name_base}.png"
-    save_path = os.path.join(save_folder_path, img_name)
-
     # ターゲットディレクトリが存在しない場合は作成
     if not os.path.exists(save_folder_path):
         try:
@@ -190,22 +514,64 @@ def fx_save_trim_img(img_pil, save_folder_path, name, num=0):
             print(f"ディレクトリ {save_folder_path} の作成エラー: {e}")
             return None # ディレクトリ作成に失敗した場合は保存できない
 
-    # ファイル名の衝突をチェックし、必要に応じて番号をインクリメント
+    # 画像を一時ファイルに書き込む (拡張子が .png ではないため、参照画像の読み込みでは無視される)
+    try:
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", prefix=f".{name}_", dir=save_folder_path)
+        with os.fdopen(fd, 'wb') as f:
+            img_pil.save(f, "PNG") # 明示的にPNGとして保存
+    except Exception as e:
+        print(f"{save_folder_path} への画像の保存エラー: {e}")
+        return None
+
+    # 使用されていないファイル名を決めて、書き込み済みの画像を配置
     current_num = num
-    while os.path.exists(save_path):
-        current_num += 1
-        img_name = f"{img_name_base}_{current_num}.png"
-        save_path = os.path.join(save_folder_path, img_name)
-        # 潜在的な無限ループを防ぐための安全停止
-        if current_num > num + 1000:
-             print(f"警告: {save_folder_path} 内で {img_name_base} の一意なファイル名を1000回試行しても見つけられませんでした。保存をスキップします。")
-             return None
+    save_path = None
+    try:
+        with _suffix_index_lock:
+            index = _suffix_index_for(save_folder_path)
+            for _ in range(1000):
+                img_name = f"{name}_{current_num}.png" if current_num > 0 else f"{name}.png"
+                path = os.path.join(save_folder_path, img_name)
+                try:
+                    _place_new_file(tmp_path, path)
+                except FileExistsError:
+                    # 使用済みの場合は、記録されている最大の連番の次を試す
+                    index[name] = max(index.get(name, 0), current_num)
+                    current_num = index[name] + 1
+                    continue
+                index[name] = max(index.get(name, 0), current_num)
+                save_path = path
+                break
+            else:
+                # 潜在的な無限ループを防ぐための安全停止
+                print(f"警告: {save_folder_path} 内で {name} の一意なファイル名を1000回試行しても見つけられませんでした。保存をスキップします。")
+    except OSError as e:
+        print(f"{save_folder_path} への画像の保存エラー: {e}")
+    finally:
+        try:
+            os.remove(tmp_path) # ハードリンクした場合も一時ファイル側の名前のみ削除
+        except OSError:
+            pass
+
+    if save_path is None:
+        return None
+    print(f"画像を保存しました: {save_path}")
+    return os.path.basename(save_path) # 実際に保存されたファイル名を返す
 
+
+def _place_new_file(tmp_path, path):
+    """
+    書き込み済みの一時ファイルを path として配置します。path が既に存在する場合は FileExistsError。
+    ハードリンクに対応していないファイルシステムでは、空のファイルを排他的に作成 (予約) してから
+    一時ファイルで置き換えます。
+    """
     try:
-        # 画像を保存
-        img_pil.save(save_path, "PNG") # 明示的にPNGとして保存
-        print(f"画像を保存しました: {save_path}")
-        return os.path.basename(save_path) # 実際に保存されたファイル名を返す
-    except Exception as e:
-        print(f"画像 {save_path} への保存エラー: {e}")
-        return None
\ No newline at end of file
+        os.link(tmp_path, path)
+        return
+    except FileExistsError:
+        raise
+    except OSError:
+        pass
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0))
+    os.close(fd)
+    os.replace(tmp_path, path)
\ No newline at end of file
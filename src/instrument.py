@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import threading
+
+# --- 処理段階ごとの時間計測 ---
+# 使い方:
+#     with instrument.span("match", category): ...
+#     instrument.count("crop_cache_hit", category)
+# enable() を呼ぶまでは span() が何もしないオブジェクトを返すため、計測のコストはほぼかかりません。
+
+_enabled = False
+_lock = threading.Lock()
+_events = [] # [(段階, カテゴリ, スクリーンショット, 開始 ns, 経過 ns, pid, tid)]
+_counters = {} # {(名前, カテゴリ): 回数}
+_screenshot = None # 現在処理中のスクリーンショット名 (イベントに記録)
+_origin_ns = 0
+
+
+class _NullSpan:
+    """計測が無効な場合に使用する、何もしないコンテキストマネージャー。"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """1つの処理段階の開始から終了までの時間を記録するコンテキストマネージャー。"""
+    __slots__ = ("stage", "category", "screenshot", "start")
+
+    def __init__(self, stage, category, screenshot):
+        self.stage = stage
+        self.category = category
+        self.screenshot = screenshot
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter_ns() - self.start
+        with _lock:
+            _events.append((self.stage, self.category, self.screenshot, self.start, elapsed,
+                            os.getpid(), threading.get_ident()))
+        return False
+
+
+def enable():
+    """計測を有効にし、これまでの記録を破棄します。"""
+    global _enabled, _origin_ns
+    with _lock:
+        _events.clear()
+        _counters.clear()
+    _origin_ns = time.perf_counter_ns()
+    _enabled = True
+
+
+def is_enabled():
+    """計測が有効かどうか"""
+    return _enabled
+
+
+def set_screenshot(name):
+    """以降のイベントを関連付けるスクリーンショット名を設定します。"""
+    global _screenshot
+    _screenshot = name
+
+
+def span(stage, category=None):
+    """
+    処理段階の時間を計測するコンテキストマネージャーを返します。
+
+    Args:
+        stage (str): 段階名 (例: "decode", "match")。
+        category (str | None): カテゴリ名 (保存フォルダ名)。
+
+    Returns:
+        コンテキストマネージャー。計測が無効な場合は何もしません。
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(stage, category, _screenshot)
+
+
+def count(name, category=None, n=1):
+    """カウンターを加算します (計測が無効な場合は何もしません)。"""
+    if not _enabled:
+        return
+    key = (name, category)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + n
+
+
+def drain():
+    """
+    記録したイベントとカウンターを取り出して空にします
+    (並列処理のワーカープロセスから呼び出し側のプロセスへ渡すため)。
+
+    Returns:
+        tuple[list, dict]: (イベントのリスト, カウンター)。
+    """
+    with _lock:
+        events, counters = list(_events), dict(_counters)
+        _events.clear()
+        _counters.clear()
+    return events, counters
+
+
+def merge(events, counters):
+    """drain() で取り出した記録を、このプロセスの記録に追加します。"""
+    if not _enabled:
+        return
+    with _lock:
+        _events.extend(events)
+        for key, n in counters.items():
+            _counters[key] = _counters.get(key, 0) + n
+
+
+def summary():
+    """
+    段階・カテゴリごとの集計を返します。
+
+    Returns:
+        dict: 以下のキーを持つ辞書。
+          - "stages": [(段階, カテゴリ, 回数, 合計秒, 平均ミリ秒, 最大ミリ秒)] (合計時間の長い順)
+          - "screenshots": {スクリーンショット名: {段階: 合計秒}}
+          - "counters": {(名前, カテゴリ): 回数}
+    """
+    with _lock:
+        events, counters = list(_events), dict(_counters)
+
+    stages, screenshots = {}, {}
+    for stage, category, screenshot, start, elapsed, pid, tid in events:
+        total, n, peak = stages.get((stage, category), (0, 0, 0))
+        stages[(stage, category)] = (total + elapsed, n + 1, max(peak, elapsed))
+        if screenshot:
+            per_stage = screenshots.setdefault(screenshot, {})
+            per_stage[stage] = per_stage.get(stage, 0.0) + elapsed / 1e9
+
+    rows = [(stage, category, n, total / 1e9, total / n / 1e6, peak / 1e6)
+            for (stage, category), (total, n, peak) in stages.items()]
+    rows.sort(key=lambda row: -row[3])
+    return {"stages": rows, "screenshots": screenshots, "counters": counters}
+
+
+def print_summary(top_screenshots=5):
+    """集計結果を表形式で出力します。"""
+    result = summary()
+    print("\n=== 処理段階ごとの時間 ===")
+    print(f"{'段階':<12} {'カテゴリ':<10} {'回数':>6} {'合計(s)':>9} {'平均(ms)':>9} {'最大(ms)':>9}")
+    for stage, category, n, total, mean, peak in result["stages"]:
+        print(f"{stage:<12} {category or '-':<10} {n:>6} {total:>9.3f} {mean:>9.2f} {peak:>9.2f}")
+
+    if result["counters"]:
+        print("\n=== カウンター ===")
+        for (name, category), n in sorted(result["counters"].items(), key=lambda item: (item[0][0], item[0][1] or "")):
+            print(f"{name:<20} {category or '-':<10} {n:>6}")
+
+    if result["screenshots"]:
+        slowest = sorted(result["screenshots"].items(), key=lambda item: -sum(item[1].values()))
+        print(f"\n=== 時間のかかったスクリーンショット (上位 {top_screenshots} 件) ===")
+        for screenshot, per_stage in slowest[:top_screenshots]:
+            breakdown = ", ".join(f"{stage} {sec:.3f}s" for stage, sec in
+                                  sorted(per_stage.items(), key=lambda item: -item[1]))
+            print(f"{screenshot}: {sum(per_stage.values()):.3f}s ({breakdown})")
+
+
+def write_chrome_trace(path):
+    """
+    記録したイベントを Chrome の trace 形式 (chrome://tracing, Perfetto で表示可能) で保存します。
+
+    Args:
+        path (str): 保存先のパス。
+    """
+    with _lock:
+        events, counters = list(_events), dict(_counters)
+
+    trace_events = []
+    for stage, category, screenshot, start, elapsed, pid, tid in events:
+        trace_events.append({
+            "name": stage,
+            "cat": category or "",
+            "ph": "X",
+            "ts": (start - _origin_ns) / 1000, # マイクロ秒
+            "dur": elapsed / 1000,
+            "pid": pid,
+            "tid": tid,
+            "args": {"screenshot": screenshot} if screenshot else {},
+        })
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "traceEvents": trace_events,
+            "otherData": {f"{name}:{category or ''}": n for (name, category), n in counters.items()},
+        }, f, ensure_ascii=False)
+    print(f"トレースを保存しました: {path}")
+
+
+def report(trace_path=None):
+    """計測が有効な場合、集計結果を出力し、trace_path が指定されていればトレースを保存します。"""
+    if not _enabled:
+        return
+    print_summary()
+    if trace_path:
+        write_chrome_trace(trace_path)
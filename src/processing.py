@@ -1,16 +1,22 @@
 import os
 import datetime
-from PIL import Image
 import tkinter.messagebox as messagebox
 
 # --- 相対インポートを使用して同じパッケージ内のモジュールをインポート ---
 # 同じ 'src' パッケージ内の image_utils.py からユーティリティ関数をインポート
-from .image_utils import (fx_templatematch, fx_trim, fx_append_txt,
-                          fx_move_and_rename, fx_save_trim_img)
+from .image_utils import fx_crop_hash, fx_save_trim_img
+from .template_bank import TemplateBank
+from .classifier import MATCH_THRESHOLD, EMPTY_SLOT_LABEL, EMPTY_SLOT_CATEGORIES, iter_classified
+from .results import ResultWriter
+from .choices import get_choice_registry
+from . import instrument
+
+# --- 設定 ---
+CANDIDATE_COUNT = 9 # ユーザー入力時にスコア順で表示する候補ボタンの数 (数字キー 1〜9 で選択可能)
 
 # --- メイン処理ロジック ---
 
-def main_processing(gui, script_dir, positions, input_imgs_dir):
+def main_processing(gui, script_dir, positions, input_imgs_dir, workers=None, review_mode="immediate"):
     """
     入力ディレクトリ内の画像を処理するためのメインワークフロー。
     画像を反復処理し、「positions」に基づいてセクションをトリミングし、
@@ -24,6 +30,11 @@ def main_processing(gui, script_dir, positions, input_imgs_dir):
         positions (list): トリミング領域と関連情報を定義するリスト。
         input_imgs_dir (str): 入力画像を含むディレクトリへのパス
                               (通常は script_dir + "/Screenshots")。
+        workers (int | None): 2以上の場合、画像のデコード・トリミング・マッチングを
+                              指定数のプロセスで並列に行います (ユーザー入力と記録は入力順のまま)。
+        review_mode (str): "immediate" の場合は低スコアのポジションが見つかるたびにユーザー入力を求めます。
+                           "batch" の場合はすべての画像を先に自動分類し、要入力のトリミング画像を
+                           最後にまとめてレビューします (同一画像は1回の入力でまとめて解決)。
     """
     try:
         # 入力ディレクトリから画像ファイルのソート済みリストを取得
@@ -34,19 +45,19 @@ def main_processing(gui, script_dir, positions, input_imgs_dir):
         ])
     except FileNotFoundError:
         # 入力ディレクトリが存在しない場合のエラー
-        messagebox.showerror("エラー", f"入力ディレクトリが見つかりません:\n{input_imgs_dir}")
-        gui.root.quit() # GUIを閉じる
+        gui.post(messagebox.showerror, "エラー", f"入力ディレクトリが見つかりません:\n{input_imgs_dir}")
+        gui.post(gui.root.quit) # GUIを閉じる
         return # 処理を停止
     except Exception as e:
         # ディレクトリリスト中の他の潜在的なエラーを処理
-        messagebox.showerror("エラー", f"入力ディレクトリの読み込み中にエラーが発生しました:\n{e}")
-        gui.root.quit()
+        gui.post(messagebox.showerror, "エラー", f"入力ディレクトリの読み込み中にエラーが発生しました:\n{e}")
+        gui.post(gui.root.quit)
         return
 
     # 処理する画像があるか確認
     if not files_input:
-        messagebox.showinfo("情報", f"{os.path.basename(input_imgs_dir)} フォルダに処理対象の画像がありません。")
-        gui.root.quit()
+        gui.post(messagebox.showinfo, "情報", f"{os.path.basename(input_imgs_dir)} フォルダに処理対象の画像がありません。")
+        gui.post(gui.root.quit)
         return
 
     # --- 進捗追跡のための初期化 ---
@@ -56,217 +67,308 @@ def main_processing(gui, script_dir, positions, input_imgs_dir):
     total_tasks = total_files * len(positions)
     completed_tasks = 0
 
+    # 参照画像 (判定画像) をカテゴリごとに一度だけ読み込む
+    bank = TemplateBank(script_dir)
+    bank.preload(position_info[5] for position_info in positions if len(position_info) >= 6)
+
     # この実行でのすべての結果に対して現在のタイムスタンプを一度取得
     dt_now_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     print(f"{total_files} 個の画像の処理を開始します...")
 
-    # --- メインループ: 各入力画像を反復処理 ---
-    for input_img_name in files_input:
-        input_path = os.path.join(input_imgs_dir, input_img_name)
-        print(f"\n画像を処理中: {input_img_name}")
-
-        try:
-            # PILを使用して画像を開き、RGB形式であることを確認
-            input_img = Image.open(input_path).convert("RGB")
-        except Exception as e:
-            # 画像ファイルを開く際のエラーを処理 (例: 破損ファイル)
-            print(f"画像 {input_img_name} を開くエラー: {e}。スキップします。")
-            processed_files_count += 1
-            # このファイルのすべてのタスクが進捗計算のためにスキップされたと仮定
-            completed_tasks += len(positions)
-            # 進捗をすぐに更新
-            gui.update_progress((completed_tasks / max(total_tasks, 1)) * 100)
-            gui.root.update_idletasks() # GUI更新を強制
-            continue # 次のファイルへ
-
-        # 画像の寸法を取得
-        w, h = input_img.size
-        # 各ポジションの分類結果を格納するリストを初期化
-        data = [None] * len(positions)
-        # 現在の画像のすべてのポジションが正常に処理されたかどうかを追跡するフラグ
-        all_positions_processed_successfully = True
-
-        # --- 内部ループ: 現在の画像の各定義済みポジションを反復処理 ---
-        for idx, position_info in enumerate(positions):
-            # ポジションの詳細を抽出: 座標、選択肢ファイル、保存フォルダ名
-            try:
-                l_rel, t_rel, r_rel, b_rel, choice_file, save_folder_name = position_info
-                # 相対値から絶対ピクセル座標を計算
-                l_abs = int(w * l_rel)
-                t_abs = int(h * t_rel)
-                r_abs = int(w * r_rel)
-                b_abs = int(h * b_rel)
-                # 画像をトリミング
-                cropped_img = input_img.crop((l_abs, t_abs, r_abs, b_abs))
-            except Exception as e:
-                # トリミング中のエラーを処理 (例: 無効な座標)
-                print(f"画像 {input_img_name} のポジション {idx} のトリミングエラー: {e}。ポジションをスキップします。")
-                all_positions_processed_successfully = False # 未完了としてマーク
-                completed_tasks += 1 # とにかく完了タスクをインクリメント
-                gui.update_progress((completed_tasks / max(total_tasks, 1)) * 100)
-                gui.root.update_idletasks()
-                continue # 次のポジションへ
-
-            # --- テンプレートマッチング ---
-            # このポジションタイプの参照画像を含むディレクトリ
-            # データフォルダを見つけるために script_dir (main.pyから渡され、ルートを指す) を使用
-            match_img_dir = os.path.join(script_dir, "判定画像", save_folder_name)
-
-            best_match_name = ""
-            best_match_score = -1.0 # 可能なマッチよりも低いスコアで初期化
-
-            try:
-                # マッチングディレクトリが存在しない場合は作成
-                if not os.path.exists(match_img_dir):
-                    print(f"警告: マッチ画像ディレクトリが見つかりません: {match_img_dir}。作成します。")
-                    os.makedirs(match_img_dir)
-
-                # ディレクトリ内の既存の参照画像のリストを取得
-                files_match = sorted([
-                    f for f in os.listdir(match_img_dir)
-                    if f.lower().endswith('.png')
-                ])
-
-                # トリミングされた画像を各参照画像と比較
-                for img_match_name in files_match:
-                    match_img_path = os.path.join(match_img_dir, img_match_name)
-                    try:
-                        # 参照画像を開く
-                        match_img_pil = Image.open(match_img_path).convert("RGB")
-                        # インポートされた関数を使用して類似度スコアを計算
-                        res = fx_templatematch(cropped_img, match_img_pil)
-
-                        # 現在のスコアが高い場合はベストマッチを更新
-                        if res > best_match_score:
-                            best_match_score = res
-                            # マッチのベース名 (拡張子/_numなし) を取得
-                            best_match_name = fx_trim(img_match_name)
-                    except Exception as e:
-                        # 特定の参照画像を処理する際のエラーを処理
-                        print(f"マッチ画像 {img_match_name} の処理エラー: {e}")
-
-            except Exception as e:
-                # マッチディレクトリ自体へのアクセスエラーを処理
-                print(f"マッチディレクトリ {match_img_dir} へのアクセスエラー: {e}")
-
-            # --- 決定: マッチを使用するかユーザーに尋ねる ---
-            match_threshold = 0.9 # 自動マッチングの信頼度しきい値
-            if best_match_score >= match_threshold:
-                # 高信頼度のマッチが見つかりました
-                data[idx] = best_match_name
-                print(f"  Pos {idx} ({save_folder_name}): マッチ発見 - '{best_match_name}' (スコア: {best_match_score:.3f})")
-            else:
-                # 低信頼度またはマッチなし、GUIを介してユーザーに尋ねる
-                print(f"  Pos {idx} ({save_folder_name}): 低スコア ({best_match_score:.3f})。ユーザー入力を要求します。")
-
-                # --- ユーザー入力の準備 ---
-                name_list = [] # ボタン用の事前定義された選択肢のリスト
-                # このポジションに選択肢ファイルが指定されているか確認
-                if choice_file and isinstance(choice_file, str):
-                    # "選択肢" フォルダを見つけるために script_dir (ルート) を使用
-                    name_list_path = os.path.join(script_dir, "選択肢", choice_file)
-                    try:
-                        # 選択肢ファイルから名前を読み取る
-                        with open(name_list_path, 'r', encoding='utf-8') as f:
-                            name_list = [line.strip() for line in f if line.strip()]
-                        print(f"      {choice_file} から {len(name_list)} 個の選択肢をロードしました")
-                    except FileNotFoundError:
-                        print(f"      選択肢リストファイルが見つかりません: {name_list_path}。フリー入力のみ許可します。")
-                        name_list = [] # ファイルが見つからない場合は空リストを保証
-                    except Exception as e:
-                        print(f"      選択肢リストファイル {name_list_path} の読み取りエラー: {e}")
-                        name_list = []
-
-                # ボタンアイコンのベースディレクトリ (ルート内の相対パス)
-                icon_dir_base = os.path.join("選択肢", "icon")
-
-                # --- GUIを呼び出して入力を取得 ---
-                chosen_name = gui.get_input_for_image(cropped_img, name_list, icon_dir_base)
-
-                if chosen_name:
-                    # ユーザーが名前を入力
-                    data[idx] = chosen_name
-                    print(f" 入力値: '{chosen_name}'")
-
-                    # --- マッチングディレクトリ (判定画像) に保存 ---
-                    # この保存操作は必要に応じてまだ番号を追記します (最初はnum=0)
-                    fx_save_trim_img(cropped_img, match_img_dir, chosen_name, 0)
-
-                    # --- アイコンディレクトリ (選択肢/icon) に保存 - 条件付き ---
-                    # "対戦相手"カテゴリの場合はアイコン保存をスキップ
-                    if save_folder_name != "対戦相手":
-                        # script_dir (ルート) を使用してアイコン保存パスを計算
-                        icon_save_path = os.path.join(script_dir, icon_dir_base)
-                        # 正確なターゲットアイコンファイル名を定義
-                        target_icon_filename = f"{chosen_name}.png"
-                        target_icon_full_path = os.path.join(icon_save_path, target_icon_filename)
-
-                        # アイコンファイルが既に存在するか確認
-                        if not os.path.exists(target_icon_full_path):
-                            # アイコンが存在しない場合にのみ保存
-                            print(f"      新しいアイコンを保存中: {target_icon_full_path}")
-                            # num=0でfx_save_trim_imgを呼び出す。ベースファイルが存在しないことを
-                            # 既に知っているので、番号は追記されません。
-                            # 必要に応じてディレクトリ作成も処理します。
-                            fx_save_trim_img(cropped_img, icon_save_path, chosen_name, 0)
-                        else:
-                            # アイコンは既に存在します。上書きしたり、番号付きで保存したりしないでください。
-                            print(f"      アイコンは既に存在します: {target_icon_full_path}。アイコンの保存をスキップします。")
-                    else:
-                        # 対戦相手カテゴリの場合はアイコン保存をスキップする
-                        print(f"      対戦相手カテゴリなので、アイコンの保存をスキップします: {chosen_name}")
+    input_paths = [os.path.join(input_imgs_dir, f) for f in files_input]
+    if review_mode == "batch":
+        # 自動分類をすべて終えてから、要入力の画像をまとめてレビューする
+        with ResultWriter(script_dir) as writer:
+            _run_two_phase(gui, script_dir, positions, input_paths, bank, workers, dt_now_str, writer)
+        bank.flush()
+        if not gui.closed:
+            _finish_processing(gui)
+        return
 
-                else:
-                    # ユーザーはおそらく入力プロンプトを閉じたかキャンセルしました
-                    print(f"      ユーザーはポジション {idx} の入力を提供しませんでした。スキップします。")
-                    data[idx] = "" # 不足データを示すために空文字列またはNoneを格納
+    # 結果行はユーザー入力を待つ前とバッチの最後にまとめて書き込む (強制終了した場合は次回の起動時にジャーナルから復元)
+    with ResultWriter(script_dir) as writer:
+        # --- メインループ: 各入力画像を反復処理 ---
+        # 分類 (デコード・トリミング・マッチング) は iter_classified が担当し、結果は入力順に返される
+        for input_path, results in iter_classified(input_paths, positions, bank, workers):
+            if gui.closed:
+                # ウィンドウが閉じられた後は画像を移動・記録しない (転記処理と並行して結果ファイルに書き込まないように)
+                print("\nウィンドウが閉じられたため、処理を中断します。")
+                break
+            input_img_name = os.path.basename(input_path)
+            instrument.set_screenshot(input_img_name)
+            print(f"\n画像を処理中: {input_img_name}")
+
+            if results is None:
+                # 画像を開けなかった場合 (エラー内容は分類時に出力済み)
+                processed_files_count += 1
+                # このファイルのすべてのタスクが進捗計算のためにスキップされたと仮定
+                completed_tasks += len(positions)
+                # 進捗を通知 (表示はGUIスレッドでまとめて更新)
+                gui.post_progress((completed_tasks / max(total_tasks, 1)) * 100)
+                continue # 次のファイルへ
+
+            # 各ポジションの分類結果を格納するリストを初期化
+            data = [None] * len(positions)
+            # 現在の画像のすべてのポジションが正常に処理されたかどうかを追跡するフラグ
+            all_positions_processed_successfully = True
+
+            # --- 内部ループ: 現在の画像の各定義済みポジションの結果を処理 ---
+            for idx, (position_info, result) in enumerate(zip(positions, results)):
+                if result["error"]:
+                    # トリミング中のエラーを処理 (例: 無効な座標)
+                    print(f"画像 {input_img_name} のポジション {idx} のトリミングエラー: {result['error']}。ポジションをスキップします。")
                     all_positions_processed_successfully = False # 未完了としてマーク
+                    completed_tasks += 1 # とにかく完了タスクをインクリメント
+                    gui.post_progress((completed_tasks / max(total_tasks, 1)) * 100)
+                    continue # 次のポジションへ
+
+                choice_file, save_folder_name = position_info[4], position_info[5]
+                best_match_name, best_match_score = result["best"], result["score"]
+                cropped_img = result["crop"]
+
+                if result["label"] is None:
+                    # 分類後に手動入力で参照画像が追加されている可能性があるため、現在のバンクで再マッチング
+                    with instrument.span("match", save_folder_name):
+                        best_match_name, best_match_score = bank.match(save_folder_name, result["gray"],
+                                                                       min_score=MATCH_THRESHOLD)
+
+                # --- 決定: マッチを使用するかユーザーに尋ねる ---
+                if result["empty"]:
+                    # 空きスロット
+                    data[idx] = EMPTY_SLOT_LABEL
+                    print(f"  Pos {idx} ({save_folder_name}): 空きスロット")
+                elif result["cached"]:
+                    # 以前と完全に同じトリミング画像 (判定結果キャッシュ)
+                    data[idx] = best_match_name
+                    print(f"  Pos {idx} ({save_folder_name}): キャッシュ一致 - '{best_match_name}'")
+                elif best_match_score >= MATCH_THRESHOLD:
+                    # 高信頼度のマッチが見つかりました
+                    data[idx] = best_match_name
+                    print(f"  Pos {idx} ({save_folder_name}): マッチ発見 - '{best_match_name}' (スコア: {best_match_score:.3f})")
+                else:
+                    # 低信頼度またはマッチなし、GUIを介してユーザーに尋ねる
+                    print(f"  Pos {idx} ({save_folder_name}): 低スコア ({best_match_score:.3f})。ユーザー入力を要求します。")
+                    # 入力待ちの間にウィンドウが閉じられても失われないように、移動済みの画像の結果行を書き込む
+                    writer.flush()
+                    chosen_name = _ask_user(gui, script_dir, bank, cropped_img, choice_file, save_folder_name,
+                                            result["gray"])
+
+                    if chosen_name:
+                        # ユーザーが名前を入力
+                        data[idx] = chosen_name
+                    else:
+                        # ユーザーはおそらく入力プロンプトを閉じたかキャンセルしました
+                        print(f"      ユーザーはポジション {idx} の入力を提供しませんでした。スキップします。")
+                        data[idx] = "" # 不足データを示すために空文字列またはNoneを格納
+                        all_positions_processed_successfully = False # 未完了としてマーク
+
+                # --- 進捗更新 ---
+                completed_tasks += 1
+                current_progress = (completed_tasks / max(total_tasks, 1)) * 100
+                # 進捗を通知 (GUIスレッドが一定間隔で最新の値のみを表示する)
+                gui.post_progress(current_progress)
+
+            # --- 現在の画像の後処理 ---
+            processed_files_count += 1
+            print(f"{input_img_name} のポジション処理完了。結果: {data}")
 
-            # --- 進捗更新 ---
-            completed_tasks += 1
-            current_progress = (completed_tasks / max(total_tasks, 1)) * 100
-            # GUIスレッドで進捗更新をスケジュール
-            gui.root.after(0, gui.update_progress, current_progress)
-            # 保留中のイベント (GUI更新など) をTkinterに処理させる
-            gui.root.update_idletasks()
-
-        # --- 現在の画像の後処理 ---
-        processed_files_count += 1
-        print(f"{input_img_name} のポジション処理完了。結果: {data}")
-
-        # --- 結果の記録とファイルの移動 ---
-        # すべての必須データが収集されたか確認 (例: 最初の2つのポジションが必須と仮定)
-        if all_positions_processed_successfully and data[0] and data[1]:
-            # 結果ファイル名の一部として最初のポジションの結果 (例: "攻守") を使用
-            result_file_prefix = data[0]
-            # データ行を準備: タイムスタンプ + すべての収集データ
-            output_data = [dt_now_str] + data
-
-            # 元の入力画像を「履歴」フォルダに移動
-            # 履歴フォルダのベースとして script_dir (ルート) を使用
-            moved_filename = fx_move_and_rename(input_path, script_dir)
-
-            if moved_filename:
-                # 履歴フォルダ内の新しいファイル名をデータに追加
-                output_data.append(moved_filename)
-                # テキストファイル用にタブでデータ項目を結合
-                output_line = '\t'.join(map(str, output_data[0:1] + output_data[2:]))
-                # 結果行を適切な結果ファイルに追記
-                fx_append_txt(result_file_prefix, output_line, script_dir)
-                print(f"  データを記録し、'{input_img_name}' を履歴に '{moved_filename}' として移動しました。")
-            else:
-                # ファイルの移動に失敗しました。結果を完全に記録できません。
-                print(f"  {input_img_name} の移動に失敗しました。データは記録されませんでした。")
-                # 必要に応じて、移動されなかったファイルを処理するためのロジックをここに追加することを検討
-        else:
-            # データが不完全またはステップがスキップされた場合は記録をスキップ
-            print(f"  情報不足またはスキップされたステップのため、{input_img_name} のデータ記録をスキップします。")
-            # オプションで、これらのファイルを別の「失敗」または「未完了」フォルダに移動
+            if gui.closed:
+                print(f"入力中にウィンドウが閉じられたため、{input_img_name} を記録せずに処理を中断します。")
+                break
+
+            # --- 結果の記録とファイルの移動 ---
+            writer.record(input_path, data, all_positions_processed_successfully, dt_now_str)
 
     # --- ファイナライズ ---
+    # 参照画像のヒット回数と判定結果キャッシュを保存 (次回以降のマッチングに使用)
+    bank.flush()
+    if not gui.closed:
+        _finish_processing(gui)
+
+
+def _finish_processing(gui):
+    """完了メッセージを表示し、GUIを終了します。"""
     print("\nすべてのファイル処理が終了しました。")
+    gui.post_progress(100)
     # 完了メッセージボックスを表示 (GUIスレッドでスケジュール)
-    gui.root.after(0, messagebox.showinfo, "完了", "全てのファイルの処理が終了しました！")
+    gui.post(messagebox.showinfo, "完了", "全てのファイルの処理が終了しました！")
     # GUI終了をメインスレッドでスケジュール
-    gui.root.after(100, gui.root.quit) # 終了する前に少し遅延を追加
+    gui.post(gui.root.quit) # メッセージボックスが閉じられた後に終了
+
+
+def _run_two_phase(gui, script_dir, positions, input_paths, bank, workers, dt_now_str, writer):
+    """
+    2段階で画像を処理します。
+
+    フェーズ1ではすべての画像を自動分類し、低スコアのトリミング画像をキューに溜めます。
+    フェーズ2ではキューをまとめてGUIでレビューします。画素が完全に一致するトリミング画像は
+    1つのグループにまとめ、1回の入力ですべてを解決します。
+    最後に入力順で結果を記録し、元画像を履歴に移動します。
+    途中でウィンドウが閉じられた場合は、どの画像も移動・記録せずに終了します。
+    """
+    total_tasks = len(input_paths) * len(positions)
+    completed_tasks = 0
+
+    # --- フェーズ1: 自動分類 ---
+    classified = [] # [{"path", "data", "ok"}] (入力順)
+    pending_groups = {} # {(カテゴリ名, 画素ハッシュ): {"crop", "gray", "choice_file", "category", "targets"}}
+    for input_path, results in iter_classified(input_paths, positions, bank, workers):
+        if gui.closed:
+            break
+        input_img_name = os.path.basename(input_path)
+        entry = {"path": input_path, "data": [None] * len(positions), "ok": results is not None}
+        classified.append(entry)
+
+        for idx, (position_info, result) in enumerate(zip(positions, results or [])):
+            if result["error"]:
+                print(f"画像 {input_img_name} のポジション {idx} のトリミングエラー: {result['error']}。ポジションをスキップします。")
+                entry["ok"] = False
+                continue
+
+            if result["label"] is not None:
+                entry["data"][idx] = result["label"]
+                continue
+
+            # 要入力: 同一のトリミング画像はまとめて1つのグループにする
+            save_folder_name = position_info[5]
+            group = pending_groups.setdefault((save_folder_name, result["hash"]), {
+                "crop": result["crop"],
+                "gray": result["gray"],
+                "choice_file": position_info[4],
+                "category": save_folder_name,
+                "targets": [],
+            })
+            group["targets"].append((len(classified) - 1, idx))
+
+        completed_tasks += len(positions)
+        gui.post_progress((completed_tasks / max(total_tasks, 1)) * 100)
+
+    pending_count = sum(len(group["targets"]) for group in pending_groups.values())
+    print(f"\n自動分類が完了しました。要入力: {pending_count} 件 ({len(pending_groups)} グループ)")
+
+    # --- フェーズ2: まとめてレビュー ---
+    groups = list(pending_groups.values())
+    for i, group in enumerate(groups, 1):
+        if gui.closed:
+            break
+        category = group["category"]
+        # 入力待ちの時間はグループ内の最初のスクリーンショットに記録
+        instrument.set_screenshot(os.path.basename(classified[group["targets"][0][0]]["path"]))
+        # 先のレビューで追加された参照画像で解決できる場合は入力を省略
+        with instrument.span("match", category):
+            best_match_name, best_match_score = bank.match(category, group["gray"],
+                                                           min_score=MATCH_THRESHOLD)
+        if best_match_score >= MATCH_THRESHOLD:
+            chosen_name = best_match_name
+            print(f"  レビュー {i}/{len(groups)} ({category}): マッチ発見 - '{chosen_name}' (スコア: {best_match_score:.3f})")
+        else:
+            print(f"  レビュー {i}/{len(groups)} ({category}): 低スコア ({best_match_score:.3f})。ユーザー入力を要求します。")
+            gui.set_review_status(f"レビュー {i}/{len(groups)} ({category}) - 同一画像 {len(group['targets'])} 件")
+            chosen_name = _ask_user(gui, script_dir, bank, group["crop"], group["choice_file"], category,
+                                    group["gray"])
+
+        for file_index, idx in group["targets"]:
+            classified[file_index]["data"][idx] = chosen_name or ""
+            if not chosen_name:
+                classified[file_index]["ok"] = False
+    gui.set_review_status("")
+
+    # --- フェーズ3: 入力順に記録 ---
+    if gui.closed:
+        print("\nウィンドウが閉じられたため、結果を記録せずに処理を中断します。")
+        return
+    for entry in classified:
+        instrument.set_screenshot(os.path.basename(entry["path"]))
+        print(f"{os.path.basename(entry['path'])} のポジション処理完了。結果: {entry['data']}")
+        writer.record(entry["path"], entry["data"], entry["ok"], dt_now_str)
+
+
+def _ask_user(gui, script_dir, bank, cropped_img, choice_file, save_folder_name, crop_gray):
+    """
+    GUIを介してトリミング画像のラベルをユーザーに尋ね、入力された画像を
+    「判定画像」(および必要に応じて「選択肢/icon」) に保存します。
+
+    Args:
+        gui (ImageClassifierGUI): GUIクラスのインスタンス。
+        script_dir (str): アプリケーションのルートディレクトリ。
+        bank (TemplateBank): 参照画像バンク (入力された画像を追加します)。
+        cropped_img (PIL.Image.Image): ラベル付けするトリミング画像。
+        choice_file (str | None): ボタン用の選択肢ファイル名。
+        save_folder_name (str): 保存先のカテゴリ名。
+        crop_gray (numpy.ndarray): 分類時に使用したトリミング画像のグレースケール配列 (判定結果キャッシュのキー)。
+
+    Returns:
+        str | None: ユーザーが選択または入力した名前。入力がなかった場合は None。
+    """
+    # --- ユーザー入力の準備 ---
+    # ボタン用の事前定義された選択肢のリスト (選択肢ファイルは変更されたときのみ読み込み直す)
+    choices = get_choice_registry(script_dir)
+    name_list = choices.names(choice_file)
+
+    if save_folder_name in EMPTY_SLOT_CATEGORIES:
+        # 空きスロットとして登録するためのボタン (登録した画像は以降の空きスロットの判定に使用)
+        name_list = [EMPTY_SLOT_LABEL] + [name for name in name_list if name != EMPTY_SLOT_LABEL]
+
+    # ボタンアイコンのベースディレクトリ (ルート内の相対パス)
+    icon_dir_base = os.path.join("選択肢", "icon")
+
+    # 参照画像とのスコアが高いラベルを候補ボタンとして先頭に表示
+    with instrument.span("rank", save_folder_name):
+        ranked = bank.ranked_labels(save_folder_name, crop_gray, CANDIDATE_COUNT)
+    if ranked:
+        print("      候補: " + ", ".join(f"{label} ({score:.3f})" for label, score in ranked))
+    # 判定画像のラベルを選択肢の名前に対応付ける (名前が "_<数字>" で終わる場合など)
+    ranked_names = [choices.name_for_label(choice_file, label) for label, _ in ranked]
+    if ranked_names and save_folder_name in EMPTY_SLOT_CATEGORIES and EMPTY_SLOT_LABEL not in ranked_names:
+        # 空きスロットのボタンは候補に含まれなくても常に表示する (「すべて表示」を押さずに選べるように)
+        ranked_names.append(EMPTY_SLOT_LABEL)
+
+    # --- GUIを呼び出して入力を取得 ---
+    with instrument.span("gui_wait", save_folder_name):
+        chosen_name = gui.get_input_for_image(cropped_img, name_list, icon_dir_base, ranked_names)
+
+    if chosen_name:
+        # ユーザーが名前を入力
+        print(f" 入力値: '{chosen_name}'")
+
+        # --- マッチングディレクトリ (判定画像) に保存 ---
+        # この保存操作は必要に応じてまだ番号を追記します (最初はnum=0)
+        match_img_dir = bank.category_dir(save_folder_name)
+        # 参照画像はカテゴリの基準サイズにそろえて保存する
+        template_img = bank.normalize_image(save_folder_name, cropped_img)
+        with instrument.span("save_png", save_folder_name):
+            saved_name = fx_save_trim_img(template_img, match_img_dir, chosen_name, 0)
+        if saved_name:
+            # 同じバッチ内の後続の画像でも使えるように参照画像バンクに追加
+            bank.add(save_folder_name, saved_name, template_img)
+            # 同じトリミング画像が次に現れた場合はマッチングなしで判定できるように記録
+            bank.remember_crop(save_folder_name, fx_crop_hash(crop_gray), chosen_name, saved_name)
+            bank.commit_crops()
+
+        # --- アイコンディレクトリ (選択肢/icon) に保存 - 条件付き ---
+        # "対戦相手"カテゴリと空きスロットの場合はアイコン保存をスキップ
+        if save_folder_name != "対戦相手" and chosen_name != EMPTY_SLOT_LABEL:
+            # script_dir (ルート) を使用してアイコン保存パスを計算
+            icon_save_path = os.path.join(script_dir, icon_dir_base)
+            # 正確なターゲットアイコンファイル名を定義
+            target_icon_filename = f"{chosen_name}.png"
+            target_icon_full_path = os.path.join(icon_save_path, target_icon_filename)
+
+            # アイコンファイルが既に存在するか確認
+            if choices.icon_path(chosen_name) is None:
+                # アイコンが存在しない場合にのみ保存
+                print(f"      新しいアイコンを保存中: {target_icon_full_path}")
+                # num=0でfx_save_trim_imgを呼び出す。ベースファイルが存在しないことを
+                # 既に知っているので、番号は追記されません。
+                # 必要に応じてディレクトリ作成も処理します。
+                with instrument.span("save_png", save_folder_name):
+                    fx_save_trim_img(cropped_img, icon_save_path, chosen_name, 0)
+            else:
+                # アイコンは既に存在します。上書きしたり、番号付きで保存したりしないでください。
+                print(f"      アイコンは既に存在します: {target_icon_full_path}。アイコンの保存をスキップします。")
+        else:
+            # 対戦相手カテゴリと空きスロットの場合はアイコン保存をスキップする
+            print(f"      対戦相手カテゴリまたは空きスロットなので、アイコンの保存をスキップします: {chosen_name}")
+
+    return chosen_name
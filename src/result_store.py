@@ -0,0 +1,187 @@
+import os
+import sqlite3
+
+# --- 設定 ---
+RESULT_DB_NAME = "リザルト.db" # 結果データベースのファイル名 (ルート内)
+
+# --- 結果データベース ---
+
+class ResultStore:
+    """
+    分類した対戦結果を SQLite に保存します (1試合 = matches の1行)。
+    リザルト_<攻守>.txt は転記後に削除されるため、過去の結果を検索・集計できるようにローカルにも残します。
+
+    テーブル:
+        matches: タイムスタンプ、日付、攻守、対戦相手、勝敗、履歴フォルダ内のファイル名、元画像のファイル名
+        match_students: 試合ごとの生徒 (スロット番号 0-11 と名前)
+
+    対戦相手・攻守・日付・生徒にインデックスを作成します。
+    同じ (履歴のファイル名, タイムスタンプ) の試合は1回だけ登録されます (ジャーナルの復元で重複しないように)。
+    """
+    def __init__(self, db_path):
+        """
+        Args:
+            db_path (str): SQLite ファイルのパス。
+        """
+        self.db_path = db_path
+        self._conn = None
+
+    def _connect(self):
+        """初回使用時にデータベースを開き、テーブルとインデックスを作成します。"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, timeout=10)
+            # main.py と src.cli watch を同時に実行しても読み込みを妨げないように WAL モードを使用
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS matches ("
+                " id INTEGER PRIMARY KEY,"
+                " timestamp TEXT NOT NULL,"
+                " date TEXT NOT NULL,"
+                " side TEXT NOT NULL,"
+                " opponent TEXT NOT NULL,"
+                " result TEXT NOT NULL,"
+                " history TEXT NOT NULL,"
+                " source TEXT,"
+                " UNIQUE (history, timestamp)"
+                ");"
+                "CREATE TABLE IF NOT EXISTS match_students ("
+                " match_id INTEGER NOT NULL REFERENCES matches (id) ON DELETE CASCADE,"
+                " slot INTEGER NOT NULL,"
+                " student TEXT NOT NULL,"
+                " PRIMARY KEY (match_id, slot)"
+                ") WITHOUT ROWID;"
+                "CREATE INDEX IF NOT EXISTS idx_matches_opponent ON matches (opponent);"
+                "CREATE INDEX IF NOT EXISTS idx_matches_side ON matches (side, date);"
+                "CREATE INDEX IF NOT EXISTS idx_matches_date ON matches (date);"
+                "CREATE INDEX IF NOT EXISTS idx_match_students_student ON match_students (student, match_id);"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def add_many(self, records):
+        """
+        試合の結果をまとめて1つのトランザクションで登録します。
+
+        Args:
+            records (list[dict]): 試合ごとの {"timestamp", "data", "history", "source"}。
+                                  data は ResultWriter.record に渡した分類結果
+                                  ([攻守, 対戦相手, 勝敗, 生徒 x 12])。
+
+        Returns:
+            int: 新しく登録した試合数 (登録済みの試合は除く)。
+        """
+        if not records:
+            return 0
+        added = 0
+        try:
+            conn = self._connect()
+            with conn: # 例外時はロールバック
+                for record in records:
+                    data = record["data"]
+                    timestamp = record["timestamp"]
+                    cursor = conn.execute(
+                        "INSERT OR IGNORE INTO matches"
+                        " (timestamp, date, side, opponent, result, history, source)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (timestamp, timestamp[:10], data[0], data[1], data[2] or "",
+                         record["history"], record.get("source"))
+                    )
+                    if cursor.rowcount == 0:
+                        continue # 登録済み
+                    conn.executemany(
+                        "INSERT INTO match_students (match_id, slot, student) VALUES (?, ?, ?)",
+                        [(cursor.lastrowid, slot, student or "") for slot, student in enumerate(data[3:])]
+                    )
+                    added += 1
+        except sqlite3.Error as e:
+            print(f"警告: 結果データベースの書き込みエラー: {e}")
+            return 0
+        return added
+
+    def query(self, side=None, opponent=None, student=None, since=None, until=None):
+        """
+        条件に一致する試合をタイムスタンプ順に返します。
+
+        Args:
+            side (str | None): 攻守 (例: "攻撃")。
+            opponent (str | None): 対戦相手。
+            student (str | None): 編成に含まれる生徒。
+            since (str | None): この日付以降 (例: "2025-01-01")。
+            until (str | None): この日付以前。
+
+        Returns:
+            list[dict]: {"timestamp", "side", "opponent", "result", "students", "history"} のリスト。
+        """
+        conditions, params = [], []
+        if side:
+            conditions.append("m.side = ?")
+            params.append(side)
+        if opponent:
+            conditions.append("m.opponent = ?")
+            params.append(opponent)
+        if student:
+            conditions.append("m.id IN (SELECT match_id FROM match_students WHERE student = ?)")
+            params.append(student)
+        if since:
+            conditions.append("m.date >= ?")
+            params.append(since)
+        if until:
+            conditions.append("m.date <= ?")
+            params.append(until)
+        where = (" WHERE " + " AND ".join(conditions)) if conditions else ""
+
+        try:
+            conn = self._connect()
+            matches = conn.execute(
+                "SELECT m.id, m.timestamp, m.side, m.opponent, m.result, m.history FROM matches m"
+                + where + " ORDER BY m.timestamp, m.id", params
+            ).fetchall()
+            students = {}
+            for match_id, slot, name in conn.execute(
+                "SELECT s.match_id, s.slot, s.student FROM match_students s"
+                " JOIN matches m ON m.id = s.match_id" + where + " ORDER BY s.match_id, s.slot", params
+            ):
+                students.setdefault(match_id, []).append(name)
+        except sqlite3.Error as e:
+            print(f"警告: 結果データベースの読み込みエラー: {e}")
+            return []
+        return [
+            {"timestamp": timestamp, "side": side_, "opponent": opponent_, "result": result,
+             "students": students.get(match_id, []), "history": history}
+            for match_id, timestamp, side_, opponent_, result, history in matches
+        ]
+
+    def export_tsv(self, output_dir, **filters):
+        """
+        条件に一致する試合を攻守ごとに「リザルト_<攻守>.txt」と同じ形式の TSV に書き出します
+        (スプレッドシートへの転記用)。既存のファイルは上書きします。
+
+        Args:
+            output_dir (str): 出力先のフォルダ。
+            **filters: query() の条件。
+
+        Returns:
+            dict[str, tuple[str, int]]: {攻守: (出力したファイルのパス, 行数)}。
+        """
+        lines = {}
+        for match in self.query(**filters):
+            row = [match["timestamp"], match["opponent"], match["result"]] + match["students"] + [match["history"]]
+            lines.setdefault(match["side"], []).append('\t'.join(row))
+
+        os.makedirs(output_dir, exist_ok=True)
+        exported = {}
+        for side, side_lines in lines.items():
+            path = os.path.join(output_dir, f"リザルト_{side}.txt")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.writelines(line + '\n' for line in side_lines)
+            exported[side] = (path, len(side_lines))
+        return exported
+
+    def close(self):
+        """データベースを閉じます。"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,277 @@
+import os
+import json
+import glob
+
+# GUI (tkinter) に依存しないモジュールのみをインポート (ヘッドレス実行からも使用するため)
+from .image_utils import fx_history_target, fx_move_and_rename
+from .file_lock import FileLock
+from .result_store import RESULT_DB_NAME, ResultStore
+from . import instrument
+
+# --- 設定 ---
+JOURNAL_DIR_NAME = ".journal" # 書き込み前の結果行を記録するフォルダ (ルート内)
+
+# --- 結果の記録 ---
+
+def result_file_path(script_dir, result_file_prefix):
+    """結果ファイル「リザルト_<攻守>.txt」のパスを返します。"""
+    return os.path.join(script_dir, f"リザルト_{result_file_prefix}.txt")
+
+
+def format_json_line(dt_now_str, source, history, data, scores=None):
+    """JSON Lines 形式の結果行を作成します (src.cli の --format jsonl)。"""
+    row = {
+        "timestamp": dt_now_str,
+        "source": source,
+        "history": history,
+        "side": data[0],
+        "labels": data[1:],
+    }
+    if scores is not None:
+        row["scores"] = [round(float(score), 4) for score in scores]
+    return json.dumps(row, ensure_ascii=False)
+
+
+def _history_of(line):
+    """結果行に記録された履歴フォルダ内のファイル名を返します (TSV は最終列、JSON Lines は "history")。"""
+    if line.startswith("{"):
+        try:
+            return json.loads(line).get("history")
+        except ValueError:
+            return None
+    return line.rsplit('\t', 1)[-1]
+
+
+class ResultWriter:
+    """
+    結果行をまとめて書き込むライター。
+    出力先のファイルは開いたまま保持し、結果行はメモリに溜めて flush() で1回だけ書き込み・同期します。
+
+    強制終了しても結果行が失われないよう、元画像を「履歴」に移動する前に、結果行と移動先を
+    ジャーナル (.journal/<pid>_<番号>.jsonl) に記録します。次回 ResultWriter を作成したときに、
+    終了済みのプロセスのジャーナルを読み込み、元画像が移動済みで結果ファイルにまだない行
+    (履歴のファイル名で判定) を書き込みます。元画像が移動されていない行は破棄します (次回再処理されるため)。
+
+    記録した試合は結果データベース (リザルト.db、ResultStore を参照) にも flush() ごとに
+    1つのトランザクションでまとめて登録します。
+
+    使い方:
+        with ResultWriter(script_dir) as writer:
+            writer.record(input_path, data, ok, dt_now_str)
+    """
+    def __init__(self, script_dir, output_format="tsv", output_path=None, use_store=True):
+        """
+        Args:
+            script_dir (str): アプリケーションのルートディレクトリ。
+            output_format (str): "tsv" (リザルト_<攻守>.txt に追記)、"jsonl" (output_path に追記)、
+                                 または None (元画像の移動のみ)。
+            output_path (str | None): jsonl の出力先 (既定: リザルト.jsonl)。
+            use_store (bool): 結果データベースにも登録するかどうか。
+        """
+        self.script_dir = script_dir
+        self.output_format = output_format
+        self.output_path = output_path or os.path.join(script_dir, "リザルト.jsonl")
+        self.journal_dir = os.path.join(script_dir, JOURNAL_DIR_NAME)
+        self._handles = {} # {出力先のパス: バイナリファイル}
+        self._buffers = {} # {出力先のパス: [まだ書き込んでいない結果行]}
+        self._records = [] # まだ結果データベースに登録していない試合
+        self._journal_lines = [] # 前回の flush() 以降にジャーナルに記録した (出力先のパス, 行)
+        self.store = ResultStore(os.path.join(script_dir, RESULT_DB_NAME)) if use_store else None
+
+        os.makedirs(self.journal_dir, exist_ok=True)
+        self.replay()
+        # このプロセスのジャーナル (ロックしている間は他のプロセスから再生されない)
+        journal_id = f"{os.getpid()}_{id(self)}"
+        self.journal_path = os.path.join(self.journal_dir, journal_id + ".jsonl")
+        self._lock = FileLock(os.path.join(self.journal_dir, journal_id + ".lock"))
+        self._lock.acquire()
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _write_lines(self, path, lines):
+        """結果行をまとめて1回で書き込みます (他のプロセスの行と混ざらないように)。"""
+        handle = self._handles.get(path)
+        if handle is None:
+            handle = self._handles[path] = open(path, 'ab', buffering=0)
+        handle.write("".join(line + os.linesep for line in lines).encode('utf-8'))
+
+    def replay(self):
+        """終了済みのプロセスのジャーナルを読み込み、失われた結果行を書き込みます。"""
+        for journal_path in sorted(glob.glob(os.path.join(self.journal_dir, "*.jsonl"))):
+            lock = FileLock(os.path.splitext(journal_path)[0] + ".lock")
+            if not lock.acquire(blocking=False):
+                continue # 実行中のプロセスのジャーナル
+            try:
+                entries = []
+                with open(journal_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            entries.append(json.loads(line))
+                        except ValueError:
+                            pass # 書き込み途中で終了した行
+                restored = 0
+                existing = {} # {出力先のパス: 記録済みの履歴ファイル名}
+                records = []
+                for entry in entries:
+                    if not os.path.exists(entry["history_path"]):
+                        continue # 元画像が移動されていない (次回再処理される)
+                    if entry.get("record"):
+                        records.append(entry["record"]) # 登録済みの試合はデータベース側で無視される
+                    path = entry["output"]
+                    if not path:
+                        continue
+                    if path not in existing:
+                        existing[path] = set()
+                        if os.path.exists(path):
+                            with open(path, 'r', encoding='utf-8') as f:
+                                existing[path] = {_history_of(line.rstrip('\r\n')) for line in f}
+                    if entry["history"] in existing[path]:
+                        continue # 書き込み済み
+                    self._write_lines(path, [entry["line"]])
+                    existing[path].add(entry["history"])
+                    restored += 1
+                self._sync()
+                if restored:
+                    print(f"前回中断された処理の結果を {restored} 行復元しました。")
+                if self.store is not None and records:
+                    added = self.store.add_many(records)
+                    if added:
+                        print(f"前回中断された処理の結果を {added} 試合データベースに登録しました。")
+                os.remove(journal_path)
+            except Exception as e:
+                print(f"警告: ジャーナル {journal_path} の復元エラー: {e}")
+            finally:
+                lock.release()
+            try:
+                os.remove(os.path.splitext(journal_path)[0] + ".lock")
+            except OSError:
+                pass
+
+    def record(self, input_path, data, all_positions_processed_successfully, dt_now_str, scores=None):
+        """
+        1枚の画像の分類結果を記録し、元画像を「履歴」フォルダに移動します。
+        必須データが揃っていない場合は記録をスキップします。結果行は flush() で書き込まれます。
+
+        Args:
+            input_path (str): 元画像のパス。
+            data (list[str]): ポジションごとの分類結果。
+            all_positions_processed_successfully (bool): すべてのポジションが処理できたかどうか。
+            dt_now_str (str): 結果行に記録するタイムスタンプ。
+            scores (list[float] | None): ポジションごとのスコア (jsonl に記録)。
+
+        Returns:
+            str | None: 履歴フォルダ内の新しいファイル名。記録しなかった場合は None。
+        """
+        input_img_name = os.path.basename(input_path)
+        # すべての必須データが収集されたか確認 (例: 最初の2つのポジションが必須と仮定)
+        if not (all_positions_processed_successfully and data[0] and data[1]):
+            # データが不完全またはステップがスキップされた場合は記録をスキップ
+            print(f"  情報不足またはスキップされたステップのため、{input_img_name} のデータ記録をスキップします。")
+            return None
+
+        with instrument.span("move"):
+            try:
+                history, history_path = fx_history_target(self.script_dir)
+            except Exception as e:
+                print(f"  {input_img_name} の移動先を決定できません: {e}。データは記録されませんでした。")
+                return None
+
+            # 結果行を準備: タイムスタンプ + 攻守以外の収集データ + 履歴フォルダ内の新しいファイル名
+            # (結果ファイル名の一部として最初のポジションの結果 (例: "攻守") を使用)
+            output, line = None, None
+            if self.output_format == "tsv":
+                output = result_file_path(self.script_dir, data[0])
+                line = '\t'.join(map(str, [dt_now_str] + data[1:] + [history]))
+            elif self.output_format == "jsonl":
+                output = self.output_path
+                line = format_json_line(dt_now_str, input_img_name, history, data, scores)
+
+            record = None
+            if self.store is not None:
+                record = {"timestamp": dt_now_str, "data": list(data), "history": history, "source": input_img_name}
+
+            # 元画像を移動する前にジャーナルに記録
+            if output or record:
+                journal_line = json.dumps({"output": output, "line": line, "history": history,
+                                           "history_path": history_path, "record": record},
+                                          ensure_ascii=False) + '\n'
+                self._journal.write(journal_line)
+                self._journal.flush()
+                self._journal_lines.append((output, journal_line))
+
+            # 元の入力画像を「履歴」フォルダに移動
+            moved_filename = fx_move_and_rename(input_path, self.script_dir, target=(history, history_path))
+
+        if not moved_filename:
+            # ファイルの移動に失敗しました。結果を完全に記録できません。
+            print(f"  {input_img_name} の移動に失敗しました。データは記録されませんでした。")
+            return None
+        if output:
+            self._buffers.setdefault(output, []).append(line)
+        if record:
+            self._records.append(record)
+        print(f"  データを記録し、'{input_img_name}' を履歴に '{moved_filename}' として移動しました。")
+        return moved_filename
+
+    def _sync(self):
+        """開いている出力ファイルをディスクに同期します。"""
+        for handle in self._handles.values():
+            os.fsync(handle.fileno())
+
+    def flush(self):
+        """
+        溜めた結果行を書き込んでディスクに同期し、試合をデータベースに登録します。
+        書き込めなかった出力先の結果行はジャーナルに残し、次回の flush() または起動時に書き込みます。
+        """
+        if not self._buffers and not self._records:
+            return # 前回の flush() 以降に記録した結果がない
+        failed = set()
+        with instrument.span("append"):
+            for path in list(self._buffers):
+                try:
+                    self._write_lines(path, self._buffers[path])
+                    os.fsync(self._handles[path].fileno())
+                except Exception as e:
+                    print(f"ファイル {path} への追記エラー: {e}")
+                    failed.add(path)
+                    continue
+                del self._buffers[path] # 書き込めた出力先の結果行のみ破棄
+        if self._records:
+            with instrument.span("store"):
+                self.store.add_many(self._records)
+            self._records = []
+
+        # ジャーナルには書き込めなかった出力先の行のみを残す
+        self._journal_lines = [(output, line) for output, line in self._journal_lines if output in failed]
+        self._journal.seek(0)
+        self._journal.truncate()
+        if self._journal_lines:
+            self._journal.write("".join(line for _, line in self._journal_lines))
+            self._journal.flush()
+
+    def close(self):
+        """溜めた結果行を書き込み、ファイルを閉じます。"""
+        if self._journal is None:
+            return
+        self.flush()
+        for handle in self._handles.values():
+            handle.close()
+        self._handles.clear()
+        self._journal.close()
+        self._journal = None
+        if self.store is not None:
+            self.store.close()
+        if not self._buffers:
+            # すべて書き込めた場合のみジャーナルを削除
+            os.remove(self.journal_path)
+        self._lock.release()
+        try:
+            os.remove(self._lock.path)
+        except OSError:
+            pass
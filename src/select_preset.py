@@ -1,15 +1,21 @@
 import os
 import json
-from InquirerPy import inquirer
 
 
-def run():
+def load_presets():
     base_dir = os.path.dirname(__file__)
     path = os.path.join(base_dir, "positions_preset.json")
 
     # プリセットを読み込む
     with open(path, "r", encoding="utf-8") as f:
-        positions_preset = json.load(f)
+        return json.load(f)
+
+
+def run():
+    # 対話UIが必要な場合のみ読み込む (ヘッドレス実行では load() を使用)
+    from InquirerPy import inquirer
+
+    positions_preset = load_presets()
 
     # 選択したプリセットを返す
     key = inquirer.select(
@@ -17,3 +23,8 @@ def run():
     ).execute()
 
     return positions_preset[key]
+
+
+def load(name):
+    # 名前を指定してプリセットを返す (存在しない場合は KeyError)
+    return load_presets()[name]
@@ -0,0 +1,618 @@
+import os
+import numpy
+from PIL import Image
+
+from .image_utils import (fx_to_gray, fx_templatematch_gray, fx_trim, fx_resize_gray, fx_resize_image,
+                          fx_ncc_stack, fx_batch_templatematch, fx_signature,
+                          fx_downscale_gray, fx_pyramid_locate, fx_pyramid_refine)
+from .template_cache import TemplateCache
+from .crop_cache import CropCache
+
+# --- 設定 ---
+PREFILTER_TOP_K = 32 # シグネチャで絞り込む候補数 (これ以下の参照画像数のカテゴリは全件比較)
+CERTAIN_THRESHOLD = 0.98 # このスコア以上の参照画像が見つかったら残りの比較を打ち切る (None で無効)
+EARLY_EXIT_CHUNK = 16 # 早期終了の判定を行う間隔 (参照画像数)
+# 基準サイズへのリサンプリングを行わないカテゴリ
+# (対戦相手の名前欄は文字が細く、拡大・縮小で字形が崩れてスコアが下がりやすいため、従来どおりの比較を行う)
+NORMALIZE_EXCLUDE = ("対戦相手",)
+# サイズの異なる参照画像を、縮小画像で絞り込んでから元の解像度で比較するカテゴリ
+PYRAMID_CATEGORIES = ("対戦相手",)
+PYRAMID_SCALE = 4 # 粗い段階の縮小率 (1/4)
+PYRAMID_REFINE = 4 # 元の解像度で比較し直す候補数
+PYRAMID_MIN_SIZE = 4 # 縮小後の小さい画像の辺がこれ未満の場合は縮小せずに比較
+
+# --- 参照画像バンク ---
+
+class TemplateBank:
+    """
+    「判定画像」フォルダ内の参照画像をカテゴリ (保存フォルダ名) ごとに一度だけ読み込み、
+    グレースケール配列としてメモリ上に保持します。
+    手動で登録された画像は add() で追加され、同じバッチ内の後続の画像でもすぐに使用されます。
+
+    同じサイズの参照画像は1つの行列にまとめられ、トリミング画像との類似度を一括で計算します。
+    サイズの異なる参照画像のみ、従来どおり1枚ずつスライディングウィンドウで比較します。
+
+    読み込んだ配列は TemplateCache に保存され、次回以降は追加・変更された画像だけをデコードします。
+
+    参照画像が多いカテゴリでは、縮小シグネチャの相関で上位K件の候補に絞り込んでから
+    正確なスコアを計算するため、マッチングのコストは参照画像数ではなくKに比例します。
+
+    候補は「この実行で最近ベストマッチになった順」「過去の累計ヒット回数順」に並べて比較し、
+    certain_threshold 以上のスコアが出た時点で残りの比較を打ち切ります。
+    ヒット回数は save_hits() で保存され、次回以降の並び順に引き継がれます。
+
+    一度判定したトリミング画像は画素ハッシュとともに CropCache に記録され、
+    完全に一致する画像は lookup_crop() でマッチングを行わずにラベルを決定できます。
+
+    カテゴリごとに基準サイズ (最も多い参照画像のサイズ) を決め、参照画像とトリミング画像を
+    そのサイズにリサンプリングして比較します。解像度の異なるスクリーンショットが混在しても、
+    スライディングウィンドウではなく1回の内積でスコアが計算されます (NORMALIZE_EXCLUDE を除く)。
+    """
+    def __init__(self, script_dir, prefilter_top_k=PREFILTER_TOP_K, certain_threshold=CERTAIN_THRESHOLD):
+        """
+        Args:
+            script_dir (str): アプリケーションのルートディレクトリ (main.py がある場所)。
+            prefilter_top_k (int): シグネチャで絞り込む候補数。0 の場合は絞り込みを行いません。
+            certain_threshold (float | None): 比較を打ち切るスコア。None の場合は常にすべての候補を比較します。
+        """
+        self.script_dir = script_dir
+        self.base_dir = os.path.join(script_dir, "判定画像")
+        self.cache = TemplateCache(self.base_dir)
+        self.crop_cache = CropCache(os.path.join(self.cache.cache_dir, "crop_cache.sqlite3"))
+        # {カテゴリ名: [(ファイル名, ラベル, グレースケール配列), ...]}
+        self.templates = {}
+        self.prefilter_top_k = prefilter_top_k
+        self.certain_threshold = certain_threshold
+        # {カテゴリ名: マッチング用インデックス} (必要時に _get_index で構築)
+        self._index = {}
+        # {カテゴリ名: {ファイル名: 累計ヒット回数}} (前回までの回数を含む)
+        self.hits = self.cache.load_hits()
+        # {カテゴリ名: {ファイル名: この実行で最後にヒットした順番}}
+        self._recent = {}
+        self._hit_seq = 0
+        # {カテゴリ名: 読み込み時のフォルダの更新時刻} (refresh で変更を検出するため)
+        self._dir_mtime = {}
+        # {カテゴリ名: 基準サイズ (高さ, 幅)} (リサンプリングしないカテゴリは None)
+        self.canonical = {}
+
+    def category_dir(self, category):
+        """カテゴリの参照画像ディレクトリへのパスを返します。"""
+        return os.path.join(self.base_dir, category)
+
+    def load(self, category):
+        """
+        カテゴリの参照画像を読み込みます。既に読み込み済みの場合はメモリ上のものを返します。
+
+        Args:
+            category (str): カテゴリ名 (例: "キャラクター")。
+
+        Returns:
+            list[tuple[str, str, numpy.ndarray]]: (ファイル名, ラベル, グレースケール配列) のリスト。
+        """
+        if category in self.templates:
+            return self.templates[category]
+
+        match_img_dir = self.category_dir(category)
+        entries = []
+        try:
+            # マッチングディレクトリが存在しない場合は作成
+            if not os.path.exists(match_img_dir):
+                print(f"警告: マッチ画像ディレクトリが見つかりません: {match_img_dir}。作成します。")
+                os.makedirs(match_img_dir)
+
+            # 前回のキャッシュ (ファイル名・サイズ・更新時刻が一致するもの) を再利用
+            cached = self.cache.load(category)
+            self._dir_mtime[category] = os.stat(match_img_dir).st_mtime_ns
+            items = [] # キャッシュに書き戻す (ファイル名, サイズ, 更新時刻, 配列)
+            decoded_count = 0
+
+            with os.scandir(match_img_dir) as it:
+                files_match = sorted(
+                    (e for e in it if e.name.lower().endswith('.png') and e.is_file()),
+                    key=lambda e: e.name
+                )
+            for dir_entry in files_match:
+                img_match_name = dir_entry.name
+                try:
+                    stat = dir_entry.stat()
+                    hit = cached.get(img_match_name)
+                    if hit and hit[0] == stat.st_size and hit[1] == stat.st_mtime_ns:
+                        gray = hit[2]
+                    else:
+                        # 追加・変更された参照画像のみデコード
+                        with Image.open(dir_entry.path) as match_img_pil:
+                            gray = fx_to_gray(match_img_pil)
+                        decoded_count += 1
+                    entries.append((img_match_name, fx_trim(img_match_name), gray))
+                    items.append((img_match_name, stat.st_size, stat.st_mtime_ns, gray))
+                except Exception as e:
+                    # 特定の参照画像を処理する際のエラーを処理
+                    print(f"マッチ画像 {img_match_name} の処理エラー: {e}")
+
+            # 追加・変更・削除があればキャッシュを更新
+            if decoded_count or len(items) != len(cached):
+                self.cache.save(category, items)
+                print(f"参照画像キャッシュを更新しました: {category} (デコード {decoded_count} 枚)")
+
+        except Exception as e:
+            # マッチディレクトリ自体へのアクセスエラーを処理
+            print(f"マッチディレクトリ {match_img_dir} へのアクセスエラー: {e}")
+
+        # 基準サイズを決め、サイズの異なる参照画像をリサンプリング (キャッシュには元のサイズで保存)
+        shape = self._choose_canonical(category, [gray.shape for _, _, gray in entries])
+        self.canonical[category] = shape
+        if shape is not None:
+            entries = [(name, label, fx_resize_gray(gray, shape)) for name, label, gray in entries]
+
+        self.templates[category] = entries
+        return entries
+
+    @staticmethod
+    def _choose_canonical(category, shapes):
+        """最も多い参照画像のサイズ (同数の場合は面積の大きい方) を基準サイズとして返します。"""
+        if category in NORMALIZE_EXCLUDE or not shapes:
+            return None
+        counts = {}
+        for shape in shapes:
+            counts[shape] = counts.get(shape, 0) + 1
+        return max(counts, key=lambda shape: (counts[shape], shape[0] * shape[1]))
+
+    def normalize(self, category, crop_gray):
+        """
+        トリミング画像をカテゴリの基準サイズにリサンプリングします。
+
+        Args:
+            category (str): カテゴリ名。
+            crop_gray (numpy.ndarray): トリミング画像のグレースケール配列。
+
+        Returns:
+            numpy.ndarray: リサンプリングした配列 (基準サイズがない場合はそのまま)。
+        """
+        self.load(category)
+        shape = self.canonical.get(category)
+        if shape is None or crop_gray.size == 0:
+            return crop_gray
+        return fx_resize_gray(crop_gray, shape)
+
+    def normalize_image(self, category, img_pil):
+        """
+        参照画像として保存する画像をカテゴリの基準サイズにリサンプリングします。
+
+        Args:
+            category (str): カテゴリ名。
+            img_pil (PIL.Image.Image): 保存する画像。
+
+        Returns:
+            PIL.Image.Image: リサンプリングした画像 (基準サイズがない場合はそのまま)。
+        """
+        self.load(category)
+        shape = self.canonical.get(category)
+        if shape is None:
+            return img_pil
+        return fx_resize_image(img_pil, shape)
+
+    def preload(self, categories):
+        """
+        指定されたカテゴリをまとめて読み込みます (処理開始時に一度だけ呼び出す想定)。
+
+        Args:
+            categories (Iterable[str]): カテゴリ名のリスト (重複可)。
+        """
+        for category in dict.fromkeys(categories):
+            entries = self.load(category)
+            print(f"参照画像を読み込みました: {category} ({len(entries)} 枚)")
+
+    def refresh(self, categories):
+        """
+        読み込み済みのカテゴリのうち、フォルダに追加・削除・リネームがあったものを読み込み直します
+        (常駐して処理する場合に、別のプロセスで登録された参照画像を反映するため)。
+        変更のない画像はキャッシュから読み込まれるため、デコードし直すのは変更分のみです。
+
+        Args:
+            categories (Iterable[str]): カテゴリ名のリスト (重複可)。
+        """
+        for category in dict.fromkeys(categories):
+            if category not in self.templates:
+                continue
+            try:
+                mtime = os.stat(self.category_dir(category)).st_mtime_ns
+            except OSError:
+                continue
+            if mtime != self._dir_mtime.get(category):
+                del self.templates[category]
+                self._index.pop(category, None)
+                entries = self.load(category)
+                print(f"参照画像を再読み込みしました: {category} ({len(entries)} 枚)")
+
+    def _get_index(self, category):
+        """
+        カテゴリのマッチング用インデックスを返します (未構築または参照画像の追加後は再構築)。
+
+        Returns:
+            dict: 以下のキーを持つ辞書。
+              - "groups": {形状: (エントリのインデックス配列, fx_ncc_stack の行列)}
+              - "rows": エントリごとの、所属する形状グループ内の行番号
+              - "signatures": エントリごとの fx_signature を並べた行列
+              - "labels": {ファイル名: ラベル}
+        """
+        index = self._index.get(category)
+        if index is None:
+            entries = self.load(category)
+            groups = {}
+            rows = numpy.zeros(len(entries), dtype=numpy.int64)
+            for i, (img_match_name, label, gray) in enumerate(entries):
+                members = groups.setdefault(gray.shape, [])
+                rows[i] = len(members)
+                members.append(i)
+            index = {
+                "groups": {
+                    shape: (numpy.array(indices), fx_ncc_stack([entries[i][2] for i in indices]))
+                    for shape, indices in groups.items()
+                },
+                "rows": rows,
+                "signatures": (numpy.stack([fx_signature(gray) for _, _, gray in entries])
+                               if entries else None),
+                "labels": {filename: label for filename, label, _ in entries},
+                # ピラミッドマッチング用の縮小画像 (対象カテゴリのみ)
+                "coarse": ([fx_downscale_gray(gray, PYRAMID_SCALE) for _, _, gray in entries]
+                           if category in PYRAMID_CATEGORIES else None),
+            }
+            self._index[category] = index
+        return index
+
+    def shortlist(self, category, crop_gray, top_k=None):
+        """
+        縮小シグネチャの相関が高い順に、候補となる参照画像を絞り込みます。
+
+        Args:
+            category (str): カテゴリ名。
+            crop_gray (numpy.ndarray): トリミング画像のグレースケール配列。
+            top_k (int | None): 候補数。None の場合は prefilter_top_k。
+
+        Returns:
+            numpy.ndarray: 候補エントリのインデックス (昇順)。
+        """
+        top_k = self.prefilter_top_k if top_k is None else top_k
+        signatures = self._get_index(category)["signatures"]
+        if signatures is None:
+            return numpy.array([], dtype=numpy.int64)
+        if top_k <= 0 or top_k >= len(signatures):
+            return numpy.arange(len(signatures))
+        similarity = signatures @ fx_signature(crop_gray)
+        return numpy.sort(numpy.argpartition(-similarity, top_k - 1)[:top_k])
+
+    def scores_for(self, category, crop_gray, indices):
+        """
+        指定したエントリについてのみ、トリミング画像との類似度を計算します。
+
+        Args:
+            category (str): カテゴリ名。
+            crop_gray (numpy.ndarray): トリミング画像のグレースケール配列。
+            indices (numpy.ndarray): 対象エントリのインデックス。
+
+        Returns:
+            numpy.ndarray: indices と同じ順序のスコア配列。
+        """
+        entries = self.load(category)
+        crop_gray = self.normalize(category, crop_gray)
+        index = self._get_index(category)
+        scores = numpy.full(len(indices), -1.0, dtype=numpy.float32)
+        if crop_gray.size == 0:
+            print(f"警告: ゼロ次元の画像が検出されました。 形状: {crop_gray.shape}")
+            return scores
+
+        same_size = [n for n, i in enumerate(indices) if entries[i][2].shape == crop_gray.shape]
+        if same_size:
+            # 同じサイズの候補は、形状グループの行列から該当行だけを取り出して一括で計算
+            _, stack = index["groups"][crop_gray.shape]
+            rows = index["rows"][numpy.asarray(indices)[same_size]]
+            _, scores[same_size] = fx_batch_templatematch(crop_gray, stack[rows])
+        other_size = [n for n, i in enumerate(indices) if entries[i][2].shape != crop_gray.shape]
+        if other_size:
+            scores[other_size] = self._sliding_scores(category, crop_gray,
+                                                      [indices[n] for n in other_size])
+        return scores
+
+    def scores(self, category, crop_gray):
+        """
+        トリミング画像とカテゴリ内のすべての参照画像との類似度を計算します。
+
+        Args:
+            category (str): カテゴリ名。
+            crop_gray (numpy.ndarray): トリミング画像のグレースケール配列。
+
+        Returns:
+            numpy.ndarray: load() が返すエントリと同じ順序のスコア配列。
+        """
+        entries = self.load(category)
+        crop_gray = self.normalize(category, crop_gray)
+        scores = numpy.full(len(entries), -1.0, dtype=numpy.float32)
+        if crop_gray.size == 0:
+            print(f"警告: ゼロ次元の画像が検出されました。 形状: {crop_gray.shape}")
+            return scores
+
+        other_size = []
+        for shape, (indices, stack) in self._get_index(category)["groups"].items():
+            if shape == crop_gray.shape:
+                # 同じサイズの参照画像は一括で計算
+                _, scores[indices] = fx_batch_templatematch(crop_gray, stack)
+            else:
+                other_size.extend(int(i) for i in indices)
+        if other_size:
+            scores[other_size] = self._sliding_scores(category, crop_gray, other_size)
+        return scores
+
+    def _sliding_scores(self, category, crop_gray, indices):
+        """
+        サイズの異なる参照画像との類似度をスライディングウィンドウで計算します。
+
+        PYRAMID_CATEGORIES のカテゴリでは、まず 1/PYRAMID_SCALE に縮小した画像同士で全候補を比較し、
+        スコア上位 PYRAMID_REFINE 件のみ、縮小画像での最大位置の周辺を元の解像度で比較し直します。
+        元の解像度で比較しなかった候補のスコアは -1.0 になります。
+
+        Args:
+            category (str): カテゴリ名。
+            crop_gray (numpy.ndarray): トリミング画像のグレースケール配列。
+            indices (list[int]): 対象エントリのインデックス (トリミング画像とサイズが異なるもの)。
+
+        Returns:
+            numpy.ndarray: indices と同じ順序のスコア配列。
+        """
+        entries = self.templates[category]
+        scores = numpy.full(len(indices), -1.0, dtype=numpy.float32)
+        coarse = self._get_index(category)["coarse"]
+        crop_coarse = fx_downscale_gray(crop_gray, PYRAMID_SCALE) if coarse is not None else None
+
+        located = [] # [(縮小画像でのスコア, 位置, n)]
+        for n, i in enumerate(indices):
+            gray = entries[i][2]
+            small = crop_gray if crop_gray.size <= gray.size else gray
+            if crop_coarse is None or min(small.shape) < PYRAMID_MIN_SIZE * PYRAMID_SCALE:
+                # 1枚ずつ元の解像度でスライディングウィンドウの比較
+                scores[n] = fx_templatematch_gray(crop_gray, gray)
+                continue
+            coarse_score, loc = fx_pyramid_locate(crop_gray, gray, crop_coarse, coarse[i])
+            if loc is not None:
+                located.append((coarse_score, loc, n))
+
+        # 縮小画像でのスコア上位の候補のみ、元の解像度で比較し直す
+        located.sort(key=lambda item: -item[0])
+        for coarse_score, loc, n in located[:PYRAMID_REFINE]:
+            scores[n] = fx_pyramid_refine(crop_gray, entries[indices[n]][2], loc, PYRAMID_SCALE)
+        return scores
+
+    def best_of_label(self, category, crop_gray, label):
+        """
+        指定したラベルの参照画像とだけ比較し、最も類似度の高いものを返します。
+
+        Args:
+            category (str): カテゴリ名。
+            crop_gray (numpy.ndarray): トリミング画像のグレースケール配列。
+            label (str): 比較するラベル。
+
+        Returns:
+            tuple[str | None, float]: (参照画像のファイル名, スコア)。該当する参照画像がない場合は (None, -1.0)。
+        """
+        index = self._get_index(category)
+        by_label = index.setdefault("by_label", {})
+        if label not in by_label:
+            by_label[label] = numpy.array(
+                [i for i, (_, entry_label, _) in enumerate(self.templates[category]) if entry_label == label],
+                dtype=numpy.int64)
+        indices = by_label[label]
+        if not len(indices):
+            return None, -1.0
+        scores = self.scores_for(category, crop_gray, indices)
+        best = int(numpy.argmax(scores))
+        return self.templates[category][indices[best]][0], float(scores[best])
+
+    def ranked_labels(self, category, crop_gray, top_n):
+        """
+        カテゴリ内のすべての参照画像と比較し、ラベルごとの最高スコアが高い順に上位のラベルを返します
+        (ユーザー入力時に候補ボタンを並べるため)。
+        スコアを計算しなかった参照画像 (PYRAMID_CATEGORIES で元の解像度の比較を省略したもの) は含めません。
+
+        Args:
+            category (str): カテゴリ名。
+            crop_gray (numpy.ndarray): トリミング画像のグレースケール配列。
+            top_n (int): 返すラベル数。
+
+        Returns:
+            list[tuple[str, float]]: (ラベル, スコア) のリスト (スコアの高い順)。
+        """
+        entries = self.load(category)
+        if not entries or top_n <= 0:
+            return []
+        scores = self.scores(category, crop_gray)
+        ranked = {}
+        for i in numpy.argsort(-scores, kind="stable"):
+            if scores[i] <= -1.0:
+                break # 以降はスコア未計算の参照画像のみ
+            label = entries[i][1]
+            if label and label not in ranked:
+                ranked[label] = float(scores[i])
+                if len(ranked) >= top_n:
+                    break
+        return list(ranked.items())
+
+    def _ordered(self, category, candidates):
+        """候補を「最近ヒットした順」「累計ヒット回数順」に並べ替えます。"""
+        entries = self.templates[category]
+        hits = self.hits.get(category, {})
+        recent = self._recent.get(category, {})
+        return sorted(candidates, key=lambda i: (-recent.get(entries[i][0], 0),
+                                                 -hits.get(entries[i][0], 0)))
+
+    def _scan(self, category, crop_gray, candidates):
+        """
+        候補を並び順に EARLY_EXIT_CHUNK 件ずつ比較し、certain_threshold 以上のスコアが
+        見つかった時点で打ち切ります。
+
+        Returns:
+            tuple[int, float]: (ベストのエントリインデックス, スコア)。
+        """
+        if self.certain_threshold is None:
+            scores = self.scores_for(category, crop_gray, candidates)
+            best = int(numpy.argmax(scores))
+            return int(candidates[best]), float(scores[best])
+
+        ordered = numpy.array(self._ordered(category, candidates), dtype=numpy.int64)
+        best_index, best_score = -1, -numpy.inf
+        for start in range(0, len(ordered), EARLY_EXIT_CHUNK):
+            chunk = ordered[start:start + EARLY_EXIT_CHUNK]
+            scores = self.scores_for(category, crop_gray, chunk)
+            best = int(numpy.argmax(scores))
+            if scores[best] > best_score:
+                best_index, best_score = int(chunk[best]), float(scores[best])
+            if best_score >= self.certain_threshold:
+                break
+        return best_index, best_score
+
+    def best_entry(self, category, crop_gray, min_score=None):
+        """
+        トリミング画像をカテゴリ内の参照画像と比較し、最も類似度の高い参照画像を返します。
+
+        参照画像が prefilter_top_k 件より多い場合は shortlist() の候補のみを比較します。
+        候補内のベストスコアが min_score 未満の場合は、絞り込み漏れに備えて全件を比較し直します。
+
+        Args:
+            category (str): カテゴリ名。
+            crop_gray (numpy.ndarray): トリミング画像のグレースケール配列。
+            min_score (float | None): 候補のみの比較結果を採用する最低スコア。
+                                      None の場合は候補内のベストをそのまま返します。
+
+        Returns:
+            tuple[str | None, str, float]: (参照画像のファイル名, ラベル, スコア)。
+                                           参照画像がない場合は (None, "", -1.0)。
+        """
+        entries = self.load(category)
+        if not entries:
+            return None, "", -1.0
+        # 基準サイズにそろえて、同じサイズ同士の一括計算で比較する
+        crop_gray = self.normalize(category, crop_gray)
+
+        narrowed = 0 < self.prefilter_top_k < len(entries)
+        if narrowed:
+            candidates = self.shortlist(category, crop_gray)
+        else:
+            candidates = numpy.arange(len(entries))
+        best, best_score = self._scan(category, crop_gray, candidates)
+
+        if narrowed and min_score is not None and best_score < min_score:
+            scores = self.scores(category, crop_gray)
+            best = int(numpy.argmax(scores))
+            best_score = float(scores[best])
+
+        return entries[best][0], entries[best][1], best_score
+
+    def match(self, category, crop_gray, min_score=None):
+        """
+        best_entry() と同じ比較を行い、ラベルとスコアのみを返します。
+
+        Returns:
+            tuple[str, float]: (ベストマッチのラベル, スコア)。参照画像がない場合は ("", -1.0)。
+        """
+        filename, label, score = self.best_entry(category, crop_gray, min_score)
+        return label, score
+
+    def record_hit(self, category, filename):
+        """
+        参照画像がベストマッチとして採用されたことを記録し、以降の比較順を前に移動します。
+
+        Args:
+            category (str): カテゴリ名。
+            filename (str): 採用された参照画像のファイル名。
+        """
+        if not filename:
+            return
+        counts = self.hits.setdefault(category, {})
+        counts[filename] = counts.get(filename, 0) + 1
+        self._hit_seq += 1
+        self._recent.setdefault(category, {})[filename] = self._hit_seq
+
+    def lookup_crop(self, category, crop_hash):
+        """
+        判定結果キャッシュから、画素が完全に一致するトリミング画像のラベルを探します。
+        根拠となった参照画像が削除されている、またはラベルが変わっている場合は無効です。
+
+        Args:
+            category (str): カテゴリ名。
+            crop_hash (str): fx_crop_hash で計算したハッシュ。
+
+        Returns:
+            tuple[str, str] | None: (参照画像のファイル名, ラベル)。該当なしの場合は None。
+        """
+        cached = self.crop_cache.get(category, crop_hash)
+        if cached is None:
+            return None
+        label, template = cached
+        if self._get_index(category)["labels"].get(template) != label:
+            return None
+        return template, label
+
+    def remember_crop(self, category, crop_hash, label, template):
+        """
+        トリミング画像の判定結果をキャッシュに記録します (commit_crops() または flush() で確定)。
+
+        Args:
+            category (str): カテゴリ名。
+            crop_hash (str): fx_crop_hash で計算したハッシュ。
+            label (str): 判定されたラベル。
+            template (str): 判定の根拠となった参照画像のファイル名。
+        """
+        if crop_hash and label and template:
+            self.crop_cache.put(category, crop_hash, label, template)
+
+    def commit_crops(self):
+        """
+        記録した判定結果を確定します。
+        確定するまでキャッシュの書き込みロックを保持するため、スクリーンショットごとに呼び出します
+        (src.cli watch と main.py を同時に実行しても、一方がロック待ちにならないように)。
+        """
+        self.crop_cache.commit()
+
+    def flush(self):
+        """
+        実行中に蓄積した情報を保存します。
+        ヒット回数を保存し、判定結果キャッシュから無効になった行を削除して確定します。
+        """
+        self.save_hits()
+        for category in self.templates:
+            removed = self.crop_cache.purge(category, self._get_index(category)["labels"])
+            if removed:
+                print(f"判定結果キャッシュから無効な {removed} 件を削除しました: {category}")
+        self.crop_cache.commit()
+
+    def save_hits(self):
+        """累計ヒット回数を保存します (存在しなくなった参照画像の記録は削除)。"""
+        for category, entries in self.templates.items():
+            if category in self.hits:
+                names = {entry[0] for entry in entries}
+                self.hits[category] = {n: c for n, c in self.hits[category].items() if n in names}
+        self.cache.save_hits(self.hits)
+
+    def add(self, category, filename, img_pil):
+        """
+        新しく保存された参照画像をメモリ上のインデックスに追加します。
+
+        Args:
+            category (str): カテゴリ名。
+            filename (str): fx_save_trim_img が返した保存ファイル名。
+            img_pil (PIL.Image.Image): 保存された画像。
+        """
+        if category not in self.templates:
+            # 未読み込みのカテゴリは、保存済みのファイルごとディスクから読み込む
+            self.load(category)
+            return
+        gray = fx_to_gray(img_pil)
+        if self.canonical.get(category) is None:
+            # 最初の参照画像のサイズを基準サイズにする
+            self.canonical[category] = self._choose_canonical(category, [gray.shape])
+        else:
+            gray = fx_resize_gray(gray, self.canonical[category])
+        self.templates[category].append((filename, fx_trim(filename), gray))
+        # 新しく登録された画像は直近の画像に写っている可能性が高いため、比較順の先頭に置く
+        self._hit_seq += 1
+        self._recent.setdefault(category, {})[filename] = self._hit_seq
+        # マッチング用インデックスは次回のマッチング時に再構築する
+        self._index.pop(category, None)
@@ -0,0 +1,153 @@
+import os
+import re
+import json
+import numpy
+
+# --- 参照画像のコンパイル済みキャッシュ ---
+
+CACHE_VERSION = 1 # キャッシュ形式を変更した場合はインクリメントして古いキャッシュを無効化
+
+
+class TemplateCache:
+    """
+    「判定画像/.cache」にカテゴリごとのグレースケール配列をまとめて保存し、
+    次回起動時にメモリマップで読み込めるようにします。
+
+    カテゴリごとに以下の2ファイルを作成します。
+      - <カテゴリ名>.<世代>.npy : 全参照画像の画素を連結した uint8 配列
+      - <カテゴリ名>.json       : ファイル名・サイズ・更新時刻・形状・オフセットのマニフェスト
+    """
+    def __init__(self, base_dir):
+        """
+        Args:
+            base_dir (str): 「判定画像」ディレクトリへのパス。
+        """
+        self.cache_dir = os.path.join(base_dir, ".cache")
+
+    def _manifest_path(self, category):
+        return os.path.join(self.cache_dir, f"{category}.json")
+
+    def _read_manifest(self, category):
+        """マニフェストを読み込みます。存在しない・破損している場合は None を返します。"""
+        try:
+            with open(self._manifest_path(category), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"警告: キャッシュマニフェスト {category} の読み込みエラー: {e}。再構築します。")
+            return None
+        if manifest.get("version") != CACHE_VERSION:
+            return None
+        return manifest
+
+    def load(self, category):
+        """
+        カテゴリのキャッシュをメモリマップで読み込みます。
+
+        Args:
+            category (str): カテゴリ名。
+
+        Returns:
+            dict[str, tuple[int, int, numpy.ndarray]]:
+                {ファイル名: (ファイルサイズ, 更新時刻(ns), グレースケール配列)}。
+                キャッシュがない場合は空の辞書。
+        """
+        manifest = self._read_manifest(category)
+        if not manifest or not manifest.get("data"):
+            return {}
+
+        try:
+            data = numpy.load(os.path.join(self.cache_dir, manifest["data"]), mmap_mode="r")
+            cached = {}
+            for item in manifest["entries"]:
+                h, w = item["shape"]
+                offset = item["offset"]
+                gray = data[offset:offset + h * w].reshape(h, w)
+                cached[item["name"]] = (item["size"], item["mtime_ns"], gray)
+            return cached
+        except Exception as e:
+            print(f"警告: キャッシュデータ {category} の読み込みエラー: {e}。再構築します。")
+            return {}
+
+    def save(self, category, items):
+        """
+        カテゴリのキャッシュを書き直します。
+
+        データファイルは世代番号付きの新しいファイルに書き込み、マニフェストを置き換えた後で
+        古い世代を削除します (メモリマップ中のファイルを上書きしないため)。
+
+        Args:
+            category (str): カテゴリ名。
+            items (list[tuple[str, int, int, numpy.ndarray]]):
+                (ファイル名, ファイルサイズ, 更新時刻(ns), グレースケール配列) のリスト。
+        """
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            old_manifest = self._read_manifest(category) or {}
+            generation = old_manifest.get("generation", 0) + 1
+
+            entries = []
+            offset = 0
+            for name, size, mtime_ns, gray in items:
+                entries.append({"name": name, "size": size, "mtime_ns": mtime_ns,
+                                "shape": list(gray.shape), "offset": offset})
+                offset += gray.size
+
+            data_name = None
+            if items:
+                data_name = f"{category}.{generation}.npy"
+                data = numpy.concatenate([gray.reshape(-1) for _, _, _, gray in items])
+                numpy.save(os.path.join(self.cache_dir, data_name), data.astype(numpy.uint8))
+
+            manifest = {"version": CACHE_VERSION, "generation": generation,
+                        "data": data_name, "entries": entries}
+            manifest_path = self._manifest_path(category)
+            tmp_path = manifest_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False)
+            os.replace(tmp_path, manifest_path)
+        except Exception as e:
+            print(f"警告: キャッシュ {category} の保存エラー: {e}")
+            return
+
+        # 古い世代のデータファイルを削除 (使用中で削除できない場合は次回に持ち越し)
+        pattern = re.compile(re.escape(category) + r"\.\d+\.npy")
+        for f in os.listdir(self.cache_dir):
+            if pattern.fullmatch(f) and f != data_name:
+                try:
+                    os.remove(os.path.join(self.cache_dir, f))
+                except OSError:
+                    pass
+
+    def load_hits(self):
+        """
+        参照画像ごとのヒット回数 (ベストマッチになった回数) を読み込みます。
+
+        Returns:
+            dict[str, dict[str, int]]: {カテゴリ名: {ファイル名: ヒット回数}}。
+        """
+        try:
+            with open(os.path.join(self.cache_dir, "hits.json"), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"警告: ヒット回数ファイルの読み込みエラー: {e}")
+            return {}
+
+    def save_hits(self, hits):
+        """
+        参照画像ごとのヒット回数を保存します。
+
+        Args:
+            hits (dict[str, dict[str, int]]): {カテゴリ名: {ファイル名: ヒット回数}}。
+        """
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = os.path.join(self.cache_dir, "hits.json")
+            with open(path + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump(hits, f, ensure_ascii=False)
+            os.replace(path + ".tmp", path)
+        except Exception as e:
+            print(f"警告: ヒット回数ファイルの保存エラー: {e}")
@@ -0,0 +1,153 @@
+import os
+import json
+import threading
+from PIL import Image
+
+# --- 設定 ---
+THUMBNAIL_SIZE = (80, 80) # ボタンに表示するアイコンのサイズ
+SPRITE_FILE = ".thumbnails.png" # 縮小済みアイコンをまとめた画像 (アイコンフォルダ内)
+SPRITE_INDEX_FILE = ".thumbnails.json" # スプライトシートの索引
+SPRITE_COLUMNS = 16 # スプライトシートの1行あたりのアイコン数
+
+# --- アイコンのサムネイルキャッシュ ---
+
+class ThumbnailCache:
+    """
+    「選択肢/icon」のアイコンを縮小したサムネイルをプロセス内で保持します。
+    各アイコンは (更新時刻, サイズ) が変わらない限り一度だけデコード・リサイズされます。
+
+    persist が True の場合、縮小済みのサムネイルを1枚のスプライトシート
+    (アイコンフォルダ内の .thumbnails.png と索引の .thumbnails.json) に保存し、
+    次回の起動時は個々のアイコンをデコードせずにスプライトシートから切り出します。
+    """
+    def __init__(self, icon_dir, size=THUMBNAIL_SIZE, persist=True):
+        """
+        Args:
+            icon_dir (str): アイコンフォルダのパス。
+            size (tuple[int, int]): サムネイルのサイズ (幅, 高さ)。
+            persist (bool): スプライトシートを読み書きするかどうか。
+        """
+        self.icon_dir = icon_dir
+        self.size = tuple(size)
+        self.persist = persist
+        self._lock = threading.Lock()
+        self._thumbs = {} # {名前: ((更新時刻, ファイルサイズ), PIL画像)}
+        self._sprite = None # 読み込んだスプライトシート (未読み込みの場合は None)
+        self._sprite_index = None # {名前: [番号, 更新時刻, ファイルサイズ]}
+        self._dirty = False # スプライトシートに保存していないサムネイルがあるか
+
+    @property
+    def dirty(self):
+        """スプライトシートに保存していないサムネイルがあるかどうか。"""
+        return self._dirty
+
+    def _load_sprite(self):
+        """スプライトシートと索引を読み込みます (初回のみ)。"""
+        if self._sprite_index is not None:
+            return
+        self._sprite_index = {}
+        if not self.persist:
+            return
+        index_path = os.path.join(self.icon_dir, SPRITE_INDEX_FILE)
+        sprite_path = os.path.join(self.icon_dir, SPRITE_FILE)
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if tuple(index.get("size", ())) != self.size:
+                return # サイズが異なる場合は作り直す
+            with Image.open(sprite_path) as img:
+                self._sprite = img.convert("RGBA")
+            self._sprite_index = index.get("icons", {})
+        except (OSError, ValueError):
+            # スプライトシートがない・壊れている場合は個々のアイコンから作成
+            self._sprite, self._sprite_index = None, {}
+
+    def get(self, name):
+        """
+        アイコンのサムネイルを返します。
+
+        Args:
+            name (str): アイコン名 (拡張子なし)。
+
+        Returns:
+            tuple[tuple, PIL.Image.Image] | None: ((更新時刻, ファイルサイズ), サムネイル)。
+                                                 アイコンがない場合は None。
+        """
+        path = os.path.join(self.icon_dir, f"{name}.png")
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            cached = self._thumbs.get(name)
+            if cached and cached[0] == stamp:
+                return cached
+
+            self._load_sprite()
+            entry = self._sprite_index.get(name)
+            thumb = None
+            if self._sprite is not None and entry and (entry[1], entry[2]) == stamp:
+                # スプライトシートから切り出し
+                w, h = self.size
+                x, y = (entry[0] % SPRITE_COLUMNS) * w, (entry[0] // SPRITE_COLUMNS) * h
+                thumb = self._sprite.crop((x, y, x + w, y + h))
+            if thumb is None:
+                try:
+                    with Image.open(path) as img:
+                        thumb = img.convert("RGBA").resize(self.size, Image.Resampling.LANCZOS)
+                except Exception as e:
+                    print(f"アイコン {path} のロードエラー: {e}")
+                    return None
+                self._dirty = True
+            self._thumbs[name] = (stamp, thumb)
+            return self._thumbs[name]
+
+    def save(self):
+        """新しく作成したサムネイルがあれば、スプライトシートを保存し直します。"""
+        with self._lock:
+            if not (self.persist and self._dirty):
+                return
+            # 以前のスプライトシートにあり、今回使用しなかったアイコンも引き継ぐ
+            self._load_sprite()
+            w, h = self.size
+            for name, entry in self._sprite_index.items():
+                if name not in self._thumbs and self._sprite is not None:
+                    x, y = (entry[0] % SPRITE_COLUMNS) * w, (entry[0] // SPRITE_COLUMNS) * h
+                    self._thumbs[name] = ((entry[1], entry[2]), self._sprite.crop((x, y, x + w, y + h)))
+
+            names = sorted(self._thumbs)
+            rows = max(1, -(-len(names) // SPRITE_COLUMNS))
+            sprite = Image.new("RGBA", (SPRITE_COLUMNS * w, rows * h))
+            icons = {}
+            for i, name in enumerate(names):
+                stamp, thumb = self._thumbs[name]
+                sprite.paste(thumb, ((i % SPRITE_COLUMNS) * w, (i // SPRITE_COLUMNS) * h))
+                icons[name] = [i, stamp[0], stamp[1]]
+            try:
+                # 書き込み途中のファイルを読まないよう、一時ファイルに書いてから置き換える
+                sprite_path = os.path.join(self.icon_dir, SPRITE_FILE)
+                index_path = os.path.join(self.icon_dir, SPRITE_INDEX_FILE)
+                sprite.save(sprite_path + ".tmp", "PNG")
+                os.replace(sprite_path + ".tmp", sprite_path)
+                with open(index_path + ".tmp", 'w', encoding='utf-8') as f:
+                    json.dump({"size": list(self.size), "icons": icons}, f, ensure_ascii=False)
+                os.replace(index_path + ".tmp", index_path)
+            except OSError as e:
+                print(f"警告: サムネイルの保存エラー: {e}")
+                return
+            self._sprite, self._sprite_index, self._dirty = sprite, icons, False
+
+
+_caches = {} # {アイコンフォルダ: ThumbnailCache} (プロセス全体で共有)
+_caches_lock = threading.Lock()
+
+
+def get_thumbnail_cache(icon_dir, size=THUMBNAIL_SIZE):
+    """アイコンフォルダごとに共有される ThumbnailCache を返します。"""
+    key = (os.path.abspath(icon_dir), tuple(size))
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = ThumbnailCache(icon_dir, size)
+        return _caches[key]
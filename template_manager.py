@@ -0,0 +1,91 @@
+import os
+import argparse
+
+from src.bank_tools import DEDUP_THRESHOLD, list_categories, prune_category, normalize_category
+
+# --- グローバル定義 ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    """
+    メイン処理。
+    サブコマンドに応じて「判定画像」(参照画像バンク) のメンテナンスを行う
+    """
+    parser = argparse.ArgumentParser(description="判定画像 (参照画像) のメンテナンスツール")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    prune_parser = subparsers.add_parser(
+        "prune", help="ラベルごとにほぼ同一の参照画像をまとめ、冗長な画像を 判定画像/.archive に移動する"
+    )
+    prune_parser.add_argument("--category", action="append",
+                              help="対象カテゴリ (複数指定可、省略時はすべて)")
+    prune_parser.add_argument("--threshold", type=float, default=DEDUP_THRESHOLD,
+                              help=f"冗長とみなすスコア (既定: {DEDUP_THRESHOLD})")
+    prune_parser.add_argument("--dry-run", action="store_true",
+                              help="移動せずに削減結果のみを表示する")
+
+    normalize_parser = subparsers.add_parser(
+        "normalize", help="参照画像をカテゴリごとの基準サイズにリサンプリングして保存し直す (元画像は 判定画像/.archive に移動)"
+    )
+    normalize_parser.add_argument("--category", action="append",
+                                  help="対象カテゴリ (複数指定可、省略時はすべて)")
+    normalize_parser.add_argument("--dry-run", action="store_true",
+                                  help="保存せずに対象の画像のみを表示する")
+
+    args = parser.parse_args()
+
+    if args.command == "prune":
+        run_prune(args.category or list_categories(BASE_DIR), args.threshold, args.dry_run)
+    elif args.command == "normalize":
+        run_normalize(args.category or list_categories(BASE_DIR), args.dry_run)
+
+
+def run_prune(categories, threshold, dry_run):
+    """
+    カテゴリごとに冗長な参照画像を整理し、枚数・サイズ・マッチング時間の変化を表示する
+    """
+    if not categories:
+        print("判定画像フォルダにカテゴリが存在しません")
+        return
+
+    for category in categories:
+        report = prune_category(BASE_DIR, category, threshold, dry_run)
+        print(f"\n[{category}]")
+        print(f"  枚数: {report['count_before']} → {report['count_after']}"
+              f" (-{report['count_before'] - report['count_after']})")
+        print(f"  サイズ: {report['size_before'] / 1024:.1f} KB → {report['size_after'] / 1024:.1f} KB")
+        if report["time_after"] > 0:
+            print(f"  マッチング時間: {report['time_before'] * 1000:.2f} ms → {report['time_after'] * 1000:.2f} ms"
+                  f" ({report['time_before'] / report['time_after']:.1f} 倍高速)")
+
+    if dry_run:
+        print("\n(--dry-run のため画像は移動していません)")
+
+
+def run_normalize(categories, dry_run):
+    """
+    カテゴリごとに参照画像のサイズを基準サイズにそろえ、結果を表示する
+    """
+    if not categories:
+        print("判定画像フォルダにカテゴリが存在しません")
+        return
+
+    for category in categories:
+        report = normalize_category(BASE_DIR, category, dry_run)
+        print(f"\n[{category}]")
+        if report["canonical"] is None:
+            print("  基準サイズなし (リサンプリングの対象外のカテゴリ、または参照画像なし)")
+            continue
+        height, width = report["canonical"]
+        print(f"  基準サイズ: {width}x{height}")
+        print(f"  リサンプリング: {len(report['resized'])} / {report['total']} 枚")
+        for filename, (old_width, old_height) in report["resized"]:
+            print(f"    {filename}: {old_width}x{old_height} → {width}x{height}")
+
+    if dry_run:
+        print("\n(--dry-run のため画像は保存していません)")
+
+
+if __name__ == "__main__":
+    main()